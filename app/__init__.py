@@ -3,8 +3,7 @@
 from flask import Flask
 from config import Config
 from .extensions import db, migrate, login_manager, mail
-from .models import User
-from sqlalchemy.orm import selectinload
+from .identity_cache import load_identity
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -22,9 +21,16 @@ def create_app(config_class=Config):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.query(User).options(
-            selectinload(User.subjects)
-        ).get(int(user_id))
+        # 変更が無ければ、短時間はプロセス内に保持したユーザー情報を使う（クエリを発行しない）
+        return load_identity(int(user_id))
+
+    # ログ（JSON形式・別スレッドで出力）
+    from .structured_logging import init_logging
+    init_logging(app)
+
+    # リクエストごとのSQLの計測
+    from .sql_instrument import init_sql_instrumentation
+    init_sql_instrumentation(app)
 
     # ブループリントの登録
     from .routes.main import main_bp
@@ -35,4 +41,8 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
 
+    # 管理用コマンドの登録
+    from .commands import register_commands
+    register_commands(app)
+
     return app
\ No newline at end of file
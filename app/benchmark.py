@@ -0,0 +1,220 @@
+# app/benchmark.py
+# データを入れたDBに対して、ユーザーの一連の操作（ログイン→ダッシュボード→科目ごとの計画→学習記録→統計→受信箱）を
+# 繰り返し実行し、エンドポイントごとのレイテンシ（p50/p95/p99）・1リクエストあたりのSQL件数・RSSを計測する。
+# 結果はJSONで保存でき、次回以降はその基準値と比べて遅くなっていれば失敗にする。
+# ワーカーの起動時間（python -X importtime）も別プロセスで計測し、同じように基準値と比べる。
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from flask import request_finished
+from .extensions import db
+from .models import User
+from .sql_instrument import request_sql_stats
+
+# 基準値より何割遅くなったら失敗にするか
+DEFAULT_THRESHOLD = 0.2
+
+# Webワーカーの起動時に読み込まれてはいけないモジュール（管理者用の app/exam_scraper.py だけが使う）
+LAZY_MODULES = ('google.generativeai', 'grpc', 'bs4', 'requests')
+
+# アプリを作成した時点までの import を計測し、最後にRSSを出力する
+_IMPORT_TIME_SCRIPT = 'from app import create_app; create_app(); import app.benchmark as b; print(b.current_rss_kb())'
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """最近傍順位法による百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def current_rss_kb():
+    """現在の常駐メモリ（/proc が無い環境ではプロセスの最大値）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class TestClientDriver:
+    """Flaskのテストクライアントで同じプロセス内のアプリを呼び出す。SQLの件数も取れる"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self._queries = []
+        request_finished.connect(self._on_finished, app)
+
+    def _on_finished(self, sender, response, **extra):
+        stats = request_sql_stats()
+        self._queries.append(stats.count if stats else None)
+
+    def request(self, method, url, **kwargs):
+        self._queries.clear()
+        response = self.client.open(url, method=method, **kwargs)
+        return response.status_code, (self._queries[-1] if self._queries else None)
+
+    def close(self):
+        request_finished.disconnect(self._on_finished, self.app)
+
+
+class HttpDriver:
+    """起動済みのサーバー（gunicornなど）にHTTPで接続する。SQLの件数は取れない"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, url, data=None, json=None, **kwargs):
+        # テストクライアントと同じく、リダイレクトは辿らずにそのステータスを返す
+        response = self.session.request(method, self.base_url + url, data=data, json=json, allow_redirects=False,
+                                        **kwargs)
+        return response.status_code, None
+
+    def close(self):
+        self.session.close()
+
+
+class EndpointBenchmark:
+    def __init__(self, driver, users, password):
+        self.driver = driver
+        self.users = users  # (user_id, username, [(subject_id, subject_name), ...]) のリスト
+        self.password = password
+        self.samples = defaultdict(list)  # エンドポイント名 -> [(秒, SQL件数, RSS)]
+        self.errors = defaultdict(int)
+
+    def run(self, iterations=1, warmup=1):
+        for _ in range(warmup):
+            self._run_all(record=False)
+        for _ in range(iterations):
+            self._run_all(record=True)
+        self.driver.close()
+        return self.report()
+
+    def _run_all(self, record):
+        for user in self.users:
+            self._journey(user, record)
+
+    def _journey(self, user, record):
+        user_id, username, subjects = user
+        self._call(record, 'login', 'POST', '/login', data={'username': username, 'password': self.password},
+                   expected_status=302)
+        self._call(record, 'dashboard', 'GET', f'/dashboard/{user_id}')
+        for _, subject_name in subjects:
+            self._call(record, 'plan_data', 'GET', f'/api/plan_data/{user_id}/{subject_name}')
+        if subjects:
+            self._call(record, 'log_study', 'POST', f'/api/log_study_for_date/{user_id}', json={
+                'date': date.today().isoformat(), 'comment': None,
+                'logs': [{'subject_id': subjects[0][0], 'hours': '0', 'minutes': '30'}]})
+        self._call(record, 'stats', 'GET', f'/stats/{user_id}')
+        self._call(record, 'inbox', 'GET', '/inbox')
+        self._call(record, 'logout', 'GET', '/logout', expected_status=302)
+
+    def _call(self, record, name, method, url, expected_status=200, **kwargs):
+        """ログインの失敗やセッション切れで別のページにリダイレクトされたものも、エラーとして数える"""
+        started = time.perf_counter()
+        status, queries = self.driver.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        if not record:
+            return
+        if status != expected_status:
+            self.errors[name] += 1
+        self.samples[name].append((elapsed, queries, current_rss_kb()))
+
+    def report(self):
+        endpoints = {}
+        for name, samples in self.samples.items():
+            latencies = [s[0] * 1000 for s in samples]
+            queries = [s[1] for s in samples if s[1] is not None]
+            endpoints[name] = {
+                'count': len(samples),
+                'errors': self.errors[name],
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'peak_rss_kb': max(s[2] for s in samples),
+            }
+        return {'users': len(self.users), 'endpoints': endpoints}
+
+
+def load_benchmark_users(app, count, prefix='load'):
+    """ベンチマークに使うユーザーと、その科目を読み込む"""
+    with app.app_context():
+        users = db.session.query(User).filter(User.username.like(f'{prefix}%'), User.is_admin == False)\
+            .order_by(User.id).limit(count).all()
+        return [(u.id, u.username, [(s.id, s.name) for s in sorted(u.subjects, key=lambda s: s.id)]) for u in users]
+
+
+def parse_importtime(text):
+    """python -X importtime の出力を、読み込んだ順の (モジュール名, 自身の時間μs, 累計μs, 深さ) のリストにする"""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip()) - 1) // 2))
+    return entries
+
+
+def measure_import_time(top=15):
+    """別プロセスでアプリを作成し、起動にかかった import の時間・RSS・読み込まれた重いモジュールを返す"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _IMPORT_TIME_SCRIPT],
+                            cwd=_PROJECT_ROOT, capture_output=True, text=True, check=True)
+    entries = parse_importtime(result.stderr)
+    loaded = {name for name, _, _, _ in entries}
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:top]
+    return {
+        'total_ms': round(sum(e[2] for e in entries if e[3] == 0) / 1000, 2),
+        'modules': len(entries),
+        'rss_kb': int(result.stdout.split()[-1]),
+        'lazy_modules_loaded': [m for m in LAZY_MODULES if m in loaded],
+        'slowest': [{'module': name, 'self_ms': round(self_us / 1000, 2), 'cumulative_ms': round(cum_us / 1000, 2)}
+                    for name, self_us, cum_us, _ in slowest],
+    }
+
+
+def endpoint_errors(report):
+    """想定外のステータスを返したエンドポイントの説明のリスト（計測結果が信用できない）"""
+    return [f"{name}: {row['errors']}/{row['count']} requests returned an unexpected status"
+            for name, row in report['endpoints'].items() if row['errors']]
+
+
+def compare_with_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """基準値と比べて悪化したエンドポイントの説明のリストを返す（空なら合格）"""
+    regressions = endpoint_errors(report)
+    current_import, base_import = report.get('import_time'), baseline.get('import_time')
+    if current_import:
+        regressions += [f"import: {m} is loaded at startup" for m in current_import['lazy_modules_loaded']]
+        if base_import and current_import['total_ms'] > base_import['total_ms'] * (1 + threshold):
+            regressions.append(f"import: {base_import['total_ms']}ms -> {current_import['total_ms']}ms")
+    for name, base in baseline.get('endpoints', {}).items():
+        current = report['endpoints'].get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base.get('queries_per_request') is not None and current['queries_per_request'] is not None \
+                and current['queries_per_request'] > base['queries_per_request']:
+            regressions.append(f"{name}: queries/request {base['queries_per_request']} -> {current['queries_per_request']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
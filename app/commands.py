@@ -0,0 +1,168 @@
+# app/commands.py
+# `flask <コマンド名>` で実行する管理用コマンド
+import click
+from flask.cli import with_appcontext, pass_script_info
+
+
+@click.command('backfill-study-rollup')
+@click.option('--user-id', type=int, default=None, help='特定のユーザーだけ作り直す場合に指定')
+@with_appcontext
+def backfill_study_rollup_command(user_id):
+    """既存の学習記録から、日毎の学習時間集計を作り直す"""
+    from .study_rollup import backfill_study_rollup
+    count = backfill_study_rollup(user_id)
+    click.echo(f"学習時間の集計を {count} 行作成しました。")
+
+
+@click.command('backfill-progress-bitmaps')
+@with_appcontext
+def backfill_progress_bitmaps_command():
+    """progress テーブルから、ユーザーごとの完了タスクのビット列を作り直す"""
+    from .progress_bitmap import backfill_progress_bitmaps
+    count = backfill_progress_bitmaps()
+    click.echo(f"{count} 人分の進捗ビット列を作成しました。")
+
+
+@click.command('generate-load-data')
+@click.option('--users', type=int, default=1000, show_default=True, help='作成するユーザー数')
+@click.option('--seed', type=int, default=0, show_default=True, help='乱数のシード（同じ値なら同じデータになる）')
+@click.option('--days', type=int, default=365, show_default=True, help='学習記録・模試を作る期間（日数）')
+@click.option('--study-days-per-week', type=float, default=4, show_default=True, help='1週間あたりの学習記録のある日数')
+@click.option('--exams-per-user', type=int, default=4, show_default=True, help='1人あたりの模試の数')
+@click.option('--inquiry-rate', type=float, default=0.1, show_default=True, help='お問い合わせをするユーザーの割合')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='1回の一括INSERTにまとめるユーザー数')
+@click.option('--prefix', default='load', show_default=True, help='ユーザー名の接頭辞')
+@click.option('--password', envvar='LOAD_DATA_PASSWORD', default=None,
+              help='作成するユーザーのパスワード（省略すると乱数で作り、最後に表示する）')
+@click.option('--with-admin', is_flag=True, help='お問い合わせに返信する管理者も作成する')
+@click.option('--admin-password', envvar='LOAD_DATA_ADMIN_PASSWORD', default=None,
+              help='--with-admin で作成する管理者のパスワード')
+@with_appcontext
+def generate_load_data_command(with_admin, admin_password, **options):
+    """負荷試験用の大量のユーザーデータを作成する（参照データは投入済みであること）"""
+    from .load_dataset import LoadDatasetGenerator
+    if with_admin and not admin_password:
+        raise click.UsageError('--with-admin には --admin-password（または LOAD_DATA_ADMIN_PASSWORD）が必要です。')
+    generator = LoadDatasetGenerator(admin_password=admin_password if with_admin else None, **options)
+    elapsed = generator.generate()
+    for table, count in generator.row_counts.items():
+        click.echo(f"{table}: {count} 行")
+    click.echo(f"{options['users']} 人分のデータを {elapsed:.1f} 秒で作成しました。")
+    if not options['password']:
+        click.echo(f"ユーザーのパスワード: {generator.password}（benchmark-endpoints の --password に指定してください）")
+
+
+@click.command('benchmark-endpoints')
+@click.option('--users', type=int, default=20, show_default=True, help='操作を再現するユーザー数')
+@click.option('--iterations', type=int, default=3, show_default=True, help='計測する周回数')
+@click.option('--warmup', type=int, default=1, show_default=True, help='計測前に捨てる周回数')
+@click.option('--prefix', default='load', show_default=True, help='対象ユーザーのユーザー名の接頭辞')
+@click.option('--password', envvar='LOAD_DATA_PASSWORD', required=True,
+              help='generate-load-data で作成したユーザーのパスワード')
+@click.option('--base-url', default=None, help='指定すると、テストクライアントではなく起動済みのサーバーにHTTPで接続する')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='結果のJSONの保存先（次回の基準値になる）')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), default=None, help='比較する基準値のJSON')
+@click.option('--threshold', type=float, default=0.2, show_default=True, help='基準値より何割遅くなったら失敗にするか')
+@click.option('--import-time/--no-import-time', default=True, show_default=True, help='ワーカーの起動時の import の時間も計測する')
+@pass_script_info
+def benchmark_endpoints_command(info, users, iterations, warmup, prefix, password, base_url, output, baseline, threshold,
+                                import_time):
+    """ユーザーの一連の操作を再現し、エンドポイントごとのレイテンシ・SQL件数・メモリを計測する"""
+    from .benchmark import (EndpointBenchmark, TestClientDriver, HttpDriver, load_benchmark_users, endpoint_errors,
+                            measure_import_time, compare_with_baseline, load_baseline, save_report)
+    # リクエストごとにアプリのコンテキストが作られるよう、ここではコンテキストを保持しない
+    app = info.load_app()
+    benchmark_users = load_benchmark_users(app, users, prefix)
+    if not benchmark_users:
+        raise click.ClickException(f"ユーザー名が '{prefix}' で始まるユーザーがいません。先に generate-load-data を実行してください。")
+
+    driver = HttpDriver(base_url) if base_url else TestClientDriver(app)
+    report = EndpointBenchmark(driver, benchmark_users, password).run(iterations, warmup)
+
+    click.echo(f"{'endpoint':<12}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+               f"{'rss MB':>9}")
+    for name, row in report['endpoints'].items():
+        queries = '-' if row['queries_per_request'] is None else row['queries_per_request']
+        click.echo(f"{name:<12}{row['count']:>7}{row['errors']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                   f"{row['p99_ms']:>10}{queries:>9}{row['peak_rss_kb'] // 1024:>9}")
+    if import_time:
+        report['import_time'] = measure_import_time()
+        click.echo(f"import: {report['import_time']['total_ms']}ms, {report['import_time']['modules']} modules, "
+                   f"rss {report['import_time']['rss_kb'] // 1024}MB")
+        for row in report['import_time']['slowest'][:5]:
+            click.echo(f"  {row['module']:<40}{row['self_ms']:>10}")
+    if output:
+        save_report(report, output)
+
+    if baseline:
+        regressions = compare_with_baseline(report, load_baseline(baseline), threshold)
+        if regressions:
+            raise click.ClickException('基準値より悪化しました:\n' + '\n'.join(regressions))
+        click.echo('基準値との比較: 問題ありません。')
+    else:
+        errors = endpoint_errors(report)
+        if errors:
+            # パスワードの誤りなどでリダイレクトを計測している
+            raise click.ClickException('想定外のステータスを返したリクエストがあります:\n' + '\n'.join(errors))
+
+
+@click.command('scrape-official-exams')
+@click.option('--provider', 'providers', multiple=True, help='対象の提供元（省略時はすべて）')
+@click.option('--workers', type=int, default=8, show_default=True, help='同時に進める取得・判定・抽出の数')
+@click.option('--per-host', type=int, default=2, show_default=True, help='同じホストへの同時接続数の上限')
+@click.option('--interval', type=float, default=1.0, show_default=True, help='同じホストへのアクセスの最小間隔（秒）')
+@click.option('--dry-run', is_flag=True, help='抽出結果を表示するだけで保存しない')
+@click.option('--cache/--no-cache', default=True, show_default=True, help='リンクの判定結果を保存・再利用する')
+@click.option('--fake-model', is_flag=True, help='AIを呼ばずにキーワードで判定する（オフラインでの計測用）')
+@click.option('--frontier/--no-frontier', default=True, show_default=True,
+              help='巡回予定（crawl_pages）を使い、期限の来たページだけを条件付きGETで取得する')
+@with_appcontext
+def scrape_official_exams_command(providers, workers, per_host, interval, dry_run, cache, fake_model, frontier):
+    """模試の公式ページから模試の情報を集め、公式模試の一覧に書き込む"""
+    from flask import current_app
+    from .exam_scraper import PROVIDER_LISTING_URLS, FakeModel, refresh_official_exams
+    unknown = set(providers) - set(PROVIDER_LISTING_URLS)
+    if unknown:
+        raise click.BadParameter(f"不明な提供元です: {', '.join(sorted(unknown))}", param_hint='--provider')
+
+    rows, summary = refresh_official_exams(
+        providers, cache_path=current_app.config['EXAM_SCRAPER_CACHE_PATH'] if cache else None,
+        model=FakeModel() if fake_model else None, workers=workers, per_host=per_host, interval=interval,
+        use_frontier=frontier, dry_run=dry_run)
+    for row in sorted(rows, key=lambda r: (r['provider'], r['exam_date'])):
+        click.echo(f"{row['provider']} {row['exam_date']} {row['name']}")
+    if cache:
+        click.echo(f"リンクの判定: 保存済み {summary['link_cache_hits']} 件 / 新規 {summary['link_cache_misses']} 件")
+    click.echo(f"詳細ページ: 規則だけで抽出 {summary['rule_only']} 件 / AIで抽出 {summary['ai_calls']} 件")
+    click.echo(f"取得したページ: 更新あり {summary['changed']} 件 / 304 {summary['not_modified']} 件 / "
+               f"内容が同じ {summary['unchanged']} 件")
+    if not dry_run:
+        click.echo(f"{summary['saved']} 件の模試を保存しました。")
+
+
+@click.command('run-jobs')
+@click.option('--once', is_flag=True, help='今すぐ実行できるジョブが無くなったら終了する')
+@click.option('--poll-interval', type=float, default=2.0, show_default=True, help='ジョブが無いときに待つ秒数')
+@with_appcontext
+def run_jobs_command(once, poll_interval):
+    """jobs テーブルに積まれたジョブを実行するワーカー（Webとは別のプロセスで起動する）"""
+    import signal
+    from .jobs import run_worker
+    stopping = []
+
+    def stop(signum, frame):
+        # 実行中のジョブは最後まで終えてから止まる
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    count = run_worker(poll_interval=poll_interval, once=once, should_stop=lambda: bool(stopping))
+    click.echo(f"{count} 件のジョブを実行しました。")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_study_rollup_command)
+    app.cli.add_command(backfill_progress_bitmaps_command)
+    app.cli.add_command(generate_load_data_command)
+    app.cli.add_command(benchmark_endpoints_command)
+    app.cli.add_command(scrape_official_exams_command)
+    app.cli.add_command(run_jobs_command)
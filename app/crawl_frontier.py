@@ -0,0 +1,119 @@
+# app/crawl_frontier.py
+# 模試の公式ページの巡回予定（クロールフロンティア）。URLを正規化して重複を除き、URLごとに
+# ETag / Last-Modified / 本文のハッシュを crawl_pages に保存する。次回は期限の来たページだけを
+# If-None-Match / If-Modified-Since 付きで取得し、304 や本文が同じときは解析もAIでの抽出もしない。
+# このモジュールは requests などの重いライブラリを読み込まないので、Webのリクエスト中に使ってもよい。
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from .extensions import db
+from .models import CrawlPage
+
+# 模試の一覧ページ（提供元 → URL）
+PROVIDER_LISTING_URLS = {
+    '河合塾': 'https://www.kawai-juku.ac.jp/moshi/',
+    '駿台': 'https://www.sundai.ac.jp/moshi/',
+    '東進': 'https://www.toshin-moshi.com/',
+}
+
+# 次に取得するまでの間隔（一覧ページは新しい模試が載るので短く、詳細ページは長く）
+REVISIT_INTERVALS = {
+    'listing': timedelta(hours=24),
+    'detail': timedelta(days=7),
+}
+# 取得や抽出に失敗したページを、もう一度試すまでの間隔
+RETRY_INTERVAL = timedelta(hours=1)
+
+# URLの正規化で取り除く、計測用のクエリパラメータ
+_TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid')
+
+# 1回の取得の結果（本文が前回と同じ、または 304 のときは changed=False）
+FetchResult = namedtuple('FetchResult', 'status etag last_modified content_hash changed')
+
+
+def canonical_url(url, base=None):
+    """
+    同じページを指すURLを1つの形にそろえる（絶対URL化、スキームとホストの小文字化、既定のポート・
+    ページ内リンク・計測用パラメータの除去、クエリの並べ替え）。http(s) 以外は None
+    """
+    parts = urlsplit(urljoin(base, url) if base else url)
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https') or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and parts.port != {'http': 80, 'https': 443}[scheme]:
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not k.lower().startswith(_TRACKING_PARAMS)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def conditional_headers(etag, last_modified):
+    """前回の ETag / Last-Modified から、条件付きGETのヘッダーを作る"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+class CrawlFrontier:
+    """
+    crawl_pages の行を読み書きする。DBのセッションを使うので、呼び出しはパイプラインのメインスレッドだけで行う。
+    コミットは呼び出し側で行う（抽出結果の保存と同じトランザクションにするため）。
+    """
+
+    def __init__(self, clock=datetime.utcnow):
+        self.clock = clock
+        self._pages = None  # 正規化したURL → CrawlPage
+
+    @property
+    def pages(self):
+        if self._pages is None:
+            self._pages = {page.url: page for page in db.session.query(CrawlPage)}
+        return self._pages
+
+    def add(self, url, provider, kind):
+        """まだ無いURLなら、すぐに取得する予定で追加する。追加した（または既にある）ページを返す"""
+        url = canonical_url(url) or url
+        page = self.pages.get(url)
+        if page is None:
+            page = CrawlPage(url=url, provider=provider, kind=kind, next_fetch_at=self.clock())
+            db.session.add(page)
+            self.pages[url] = page
+        return page
+
+    def knows(self, url):
+        return url in self.pages
+
+    def seed_listings(self, listings):
+        for provider, url in listings.items():
+            self.add(url, provider, 'listing')
+
+    def due(self, providers=None):
+        """取得の期限が来たページ（一覧ページが先）"""
+        now = self.clock()
+        pages = [page for page in self.pages.values()
+                 if page.next_fetch_at <= now and (providers is None or page.provider in providers)]
+        return sorted(pages, key=lambda page: (page.kind != 'listing', page.next_fetch_at, page.url))
+
+    def record(self, page, result):
+        """取得の結果を保存し、次の取得の予定を立てる"""
+        now = self.clock()
+        page.last_status = result.status
+        page.last_fetched_at = now
+        if result.status != 304:
+            page.etag = result.etag
+            page.last_modified = result.last_modified
+            page.content_hash = result.content_hash
+        page.next_fetch_at = now + REVISIT_INTERVALS[page.kind]
+
+    def record_failure(self, page):
+        """取得・解析に失敗したページは、保存済みの ETag などを変えずに少し後でもう一度試す"""
+        page.next_fetch_at = self.clock() + RETRY_INTERVAL
@@ -0,0 +1,132 @@
+# app/dashboard_loader.py
+# ダッシュボード表示に必要なデータを、科目数に関係なく一定回数のクエリでまとめて取得する
+import logging
+from datetime import date, datetime
+from .extensions import db
+from .models import UserContinuousTaskSelection, UserSequentialTaskSelection
+from .plan_cache import get_plan_cache
+from .progress_bitmap import load_completed_task_ids
+from .structured_logging import get_logger
+
+logger = get_logger('dashboard')
+
+# 学年と志望校レベルに応じた、中間目標の基準日（月-日）
+BENCHMARK_SCHEDULES = {
+    # 高校3年生向けのスケジュール
+    'high3': {
+        '早慶': {
+            '日東駒専': '07-31', # 7月末
+            'MARCH': '10-31',   # 10月末
+        },
+        'MARCH': {
+            '日東駒専': '09-30', # 9月末
+        }
+    },
+    # 浪人生向けの、より前倒しのスケジュール
+    'ronin': {
+        '早慶': {
+            '日東駒専': '06-30', # 6月末
+            'MARCH': '09-30',   # 9月末
+        },
+        'MARCH': {
+            '日東駒専': '08-31', # 8月末
+        }
+    }
+}
+
+
+def _benchmark_for(next_group, user, target_level_name):
+    user_schedule = BENCHMARK_SCHEDULES.get(user.grade, {}).get(target_level_name, {})
+    if not user_schedule:
+        return None
+    for step in next_group.steps:
+        level_from_db = step.level
+        lookup_key = level_from_db.replace('レベル', '')
+        if lookup_key in user_schedule:
+            deadline_date = datetime.strptime(f"{date.today().year}-{user_schedule[lookup_key]}", "%Y-%m-%d").date()
+            return {'level_name': level_from_db, 'deadline': deadline_date.strftime('%-m月%-d日'), 'days_remaining': (deadline_date - date.today()).days}
+    return None
+
+
+def load_dashboard_snapshot(user, target_level_name):
+    """ダッシュボード用の科目ごとのデータを作成する。
+
+    ユーザーの進捗・選択状況だけを科目数に依存しない回数のクエリで取得し、
+    ルート計画はコンパイル済みのキャッシュから引いてメモリ上で解決する。
+    """
+    plan_cache = get_plan_cache()
+    books_by_task_id = plan_cache.books_by_task_id
+
+    # --- 1. ユーザーの状態をまとめて取得 ---
+    completed_tasks_set = load_completed_task_ids(user.id)
+    seq_selections = {row.group_id: row.selected_task_id for row in db.session.query(UserSequentialTaskSelection).filter_by(user_id=user.id)}
+    cont_selections = {(s.subject_id, s.level, s.category): s.selected_task_id
+                       for s in db.session.query(UserContinuousTaskSelection).filter_by(user_id=user.id)}
+
+    # --- 2. 各科目のダッシュボード用データをメモリ上で作成 ---
+    dashboard_data = []
+    for subject in user.subjects:
+        item = {'id': subject.id, 'name': subject.name, 'next_task': None, 'continuous_tasks': [],
+                'progress': 0, 'last_completed_task': None, 'pending_selections': [], 'benchmark': None}
+
+        # ベンチマーク表が見つからない原因を調べるためのログ（DEBUGが無効なら何もしない）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('benchmark schedule lookup', extra={
+                'subject': subject.name, 'grade': user.grade, 'target_level': target_level_name,
+                'has_grade': user.grade in BENCHMARK_SCHEDULES,
+                'has_level': target_level_name in BENCHMARK_SCHEDULES.get(user.grade, {})})
+
+        plan = plan_cache.plan_for_subject(subject, user)
+        if not plan:
+            dashboard_data.append(item)
+            continue
+
+        # --- 2a. 「次のタスク」と「最後に完了したタスク」を決定 ---
+        completed_task_ids_in_plan = []
+        uncompleted_groups = []
+        for group in plan.groups:
+            actual_task_id = seq_selections.get(group.group_id, group.group_id)
+            if actual_task_id in completed_tasks_set:
+                completed_task_ids_in_plan.append(actual_task_id)
+            else:
+                uncompleted_groups.append(group)
+
+        if uncompleted_groups:
+            next_group = uncompleted_groups[0]
+            if len(next_group.steps) > 1 and next_group.group_id not in seq_selections:
+                first_step = next_group.steps[0]
+                item['next_task'] = {'is_choice_pending': True, 'title': f"『{first_step.category}』を選択", 'subject_name': subject.name, 'level': first_step.level}
+            else:
+                item['next_task'] = books_by_task_id.get(seq_selections.get(next_group.group_id, next_group.group_id))
+            item['benchmark'] = _benchmark_for(next_group, user, target_level_name)
+
+        if completed_task_ids_in_plan:
+            item['last_completed_task'] = books_by_task_id.get(completed_task_ids_in_plan[-1])
+
+        # --- 2b. 「継続タスク」と「現在のレベル」と「進捗率」を決定 ---
+        current_level = None
+        if item['next_task'] and not isinstance(item['next_task'], dict):
+            current_level = plan.level_by_task_id.get(item['next_task'].task_id)
+        elif item['last_completed_task']:
+            current_level = plan.level_by_task_id.get(item['last_completed_task'].task_id)
+        elif plan.sequential:
+            current_level = plan.sequential[0].level
+
+        if current_level:
+            for category in plan.continuous_categories:
+                steps_in_current_level = plan.continuous.get((current_level, category))
+                if not steps_in_current_level: continue
+
+                user_selection_id = cont_selections.get((subject.id, current_level, category))
+                if len(steps_in_current_level) > 1 and not user_selection_id:
+                    item['pending_selections'].append(f"{current_level}の{category}")
+                else:
+                    book = books_by_task_id.get(user_selection_id or steps_in_current_level[0].book.task_id)
+                    if book: item['continuous_tasks'].append(book)
+
+        if plan.groups:
+            item['progress'] = int((len(completed_task_ids_in_plan) / len(plan.groups)) * 100)
+
+        dashboard_data.append(item)
+
+    return dashboard_data
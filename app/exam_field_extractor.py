@@ -0,0 +1,186 @@
+# app/exam_field_extractor.py
+# 模試の詳細ページの本文から、決まった書き方の項目（模試名・実施日・申込期間・対象学年）を規則で読み取る。
+# 「2026年5月3日(日)」「5/3」「令和8年6月7日」「申込期間 3月20日～4月22日」のような書き方に対応する。
+# 読み取れなかった項目は None のままにし、呼び出し側（app/exam_scraper.py）がAIに任せる。
+import re
+import unicodedata
+from datetime import date, timedelta
+
+WEEKDAYS = '月火水木金土日'
+
+# 全角は NFKC で半角にそろえてから読むので、数字・括弧・コロン・波ダッシュ（～）は半角で書く
+_DATE_RE = re.compile(
+    r'(?:(?:(?P<era>令和)\s*(?P<era_year>元|\d{1,2})|(?P<year>\d{4}))\s*年\s*)?(?P<month>\d{1,2})\s*月\s*(?P<day>\d{1,2})\s*日'
+    r'|(?:(?P<slash_year>\d{4})/)?(?P<slash_month>\d{1,2})/(?P<slash_day>\d{1,2})'
+)
+_WEEKDAY_RE = re.compile(r'\s*\((?P<weekday>[月火水木金土日])(?:曜日?)?(?:・祝)?\)')
+_RANGE_SEPARATOR_RE = re.compile(r'\s*(?:~|〜|-|–|―|から)\s*')
+_NAME_RE = re.compile(r'第\s*\d+\s*回\s*[^\s|｜]*?模試')
+
+_EXAM_DATE_KEYWORDS = re.compile(r'実施日程|実施日|試験日|受験日')
+_APPLICATION_KEYWORDS = re.compile(r'申込期間|申し込み期間|申込み期間|申込受付|受付期間')
+_DEADLINE_KEYWORDS = re.compile(r'申込締切日?|締切日')
+_GRADE_RE = re.compile(r'対象(?:学年|者)?\s*:?\s*(?P<grade>[^\s]{1,20})')
+
+# キーワードの後ろ何文字までに日付があれば、そのキーワードの日付とみなすか
+_WINDOW = 30
+_ERA_START = {'令和': 2018}
+
+
+def normalize(text):
+    """全角英数字・記号を半角にそろえる"""
+    return unicodedata.normalize('NFKC', text)
+
+
+def extract_exam_fields(text, provider=None, today=None):
+    """
+    本文から読み取れた項目の辞書（name, exam_date, app_start_date, app_end_date, target_grade）を返す。
+    日付は 'YYYY-MM-DD'。自信のない項目（候補が複数ある・年が決まらないなど）は None にする。
+    """
+    today = today or date.today()
+    name = _exam_name(text, provider)  # 模試名は全角の記号もそのまま残す
+    text = normalize(text)
+    page_years = {_parts(m)[0] for m in _DATE_RE.finditer(text)} - {None}
+
+    exam_dates = {_resolve_upcoming(parts, today, page_years)
+                  for parts, _ in _dates_after(text, _EXAM_DATE_KEYWORDS)}
+    exam_date = exam_dates.pop() if len(exam_dates) == 1 else None
+
+    app_start = app_end = None
+    periods = _dates_after(text, _APPLICATION_KEYWORDS)
+    if periods and periods[0][1] is not None:
+        start_parts, end_parts = periods[0]
+        app_start = _resolve_before(start_parts, exam_date) if exam_date else \
+            _resolve_upcoming(start_parts, today, page_years, allow_past=True)
+        app_end = _resolve_after(end_parts, app_start) if app_start else None
+    else:
+        deadlines = _dates_after(text, _DEADLINE_KEYWORDS)
+        if deadlines and exam_date:
+            app_end = _resolve_before(deadlines[0][0], exam_date)
+
+    return {
+        'name': name,
+        'exam_date': _iso(exam_date),
+        'app_start_date': _iso(app_start),
+        'app_end_date': _iso(app_end),
+        'target_grade': _target_grade(text),
+    }
+
+
+def unresolved_fields(text, fields):
+    """
+    ページに書かれていそうなのに読み取れなかった項目のリスト（空なら規則だけで十分）。
+    模試名と実施日は必須、申込の日付は「申込期間」「締切」などのキーワードがあるときだけ必要とする。
+    """
+    text = normalize(text)
+    required = ['name', 'exam_date']
+    if _APPLICATION_KEYWORDS.search(text):
+        required += ['app_start_date', 'app_end_date']
+    elif _DEADLINE_KEYWORDS.search(text):
+        required.append('app_end_date')
+    return [key for key in required if not fields.get(key)]
+
+
+def _dates_after(text, keywords):
+    """キーワードの直後にある日付の (年, 月, 日, 曜日) と、範囲ならその終わりの日付 のリスト"""
+    found = []
+    for keyword in keywords.finditer(text):
+        match = _DATE_RE.search(text, keyword.end(), keyword.end() + _WINDOW)
+        if not match:
+            continue
+        start, position = _with_weekday(text, match)
+        end = None
+        separator = _RANGE_SEPARATOR_RE.match(text, position)
+        if separator:
+            end_match = _DATE_RE.match(text, separator.end())
+            if end_match:
+                end, _ = _with_weekday(text, end_match)
+        found.append((start, end))
+    return found
+
+
+def _with_weekday(text, match):
+    weekday = _WEEKDAY_RE.match(text, match.end())
+    parts = _parts(match) + (WEEKDAYS.index(weekday.group('weekday')) if weekday else None,)
+    return parts, weekday.end() if weekday else match.end()
+
+
+def _parts(match):
+    """日付の正規表現の一致から (年 または None, 月, 日)"""
+    if match.group('month'):
+        year = match.group('year')
+        if match.group('era'):
+            era_year = match.group('era_year')
+            year = _ERA_START[match.group('era')] + (1 if era_year == '元' else int(era_year))
+        return (int(year) if year else None, int(match.group('month')), int(match.group('day')))
+    year = match.group('slash_year')
+    return (int(year) if year else None, int(match.group('slash_month')), int(match.group('slash_day')))
+
+
+def _make_date(year, month, day, weekday):
+    """存在しない日付や、書かれた曜日と合わない日付は None"""
+    try:
+        value = date(year, month, day)
+    except ValueError:
+        return None
+    return value if weekday is None or value.weekday() == weekday else None
+
+
+def _resolve_upcoming(parts, today, page_years, allow_past=False):
+    """実施日の年を決める。年が無ければ、曜日とページ内の年から今日以降で最も近い日付を選ぶ"""
+    year, month, day, weekday = parts
+    if year is not None:
+        return _make_date(year, month, day, weekday)
+    years = sorted(page_years | {today.year - 1, today.year, today.year + 1})
+    candidates = [d for d in (_make_date(y, month, day, weekday) for y in years) if d]
+    if weekday is not None and len(candidates) == 1:
+        return candidates[0]
+    if len(page_years) == 1:
+        return _make_date(next(iter(page_years)), month, day, weekday)
+    threshold = today - timedelta(days=365) if allow_past else today
+    upcoming = [d for d in candidates if d >= threshold]
+    return upcoming[0] if upcoming else None
+
+
+def _resolve_before(parts, limit):
+    """申込の日付の年を決める。年が無ければ、limit（実施日）以前で最も近い日付を選ぶ"""
+    year, month, day, weekday = parts
+    if year is not None:
+        return _make_date(year, month, day, weekday)
+    value = _make_date(limit.year, month, day, weekday)
+    if value is None or value > limit:
+        value = _make_date(limit.year - 1, month, day, weekday)
+    return value
+
+
+def _resolve_after(parts, start):
+    """期間の終わりの年を決める。年が無ければ、start 以降で最も近い日付を選ぶ"""
+    year, month, day, weekday = parts
+    if year is not None:
+        return _make_date(year, month, day, weekday)
+    value = _make_date(start.year, month, day, weekday)
+    if value is None or value < start:
+        value = _make_date(start.year + 1, month, day, weekday)
+    return value
+
+
+def _exam_name(text, provider):
+    names = {' '.join(m.group(0).split()) for m in _NAME_RE.finditer(text)}
+    if len(names) != 1:
+        return None
+    name = names.pop()
+    if provider:
+        name = ' '.join(name.replace(provider, '').split())
+    return name
+
+
+def _target_grade(text):
+    for match in _GRADE_RE.finditer(text):
+        grade = match.group('grade')
+        if '高' in grade or '卒' in grade or '中' in grade:
+            return grade
+    return None
+
+
+def _iso(value):
+    return value.isoformat() if value else None
@@ -0,0 +1,544 @@
+# app/exam_scraper.py
+# 模試の公式ページを取得し、AI（Gemini）でリンクの判定と模試情報の抽出を行う（管理者用）。
+# requests / bs4 / google.generativeai は読み込みに時間とメモリがかかるので、このモジュールは
+# 使う処理の中で `from ..exam_scraper import ...` のように読み込み、ワーカーの起動時には読み込まないこと。
+#
+# ExamScrapePipeline は一覧ページの取得 → リンクの判定 → 詳細ページの取得と抽出 を、上限付きのスレッドプールで
+# 並行に進め、最後に OfficialMockExam へまとめて書き込む。接続はホストごとに1つの Session で使い回し、
+# 同じホストへの同時接続数とアクセス間隔を制限する。
+#
+# リンクの判定は LinkClassifier がまとめて（1回のプロンプトで数十件ずつ）行い、結果は
+# (プロンプトのバージョン, 正規化したURL, リンクテキスト) をキーにディスク（SQLite）に保存して次回以降は再利用する。
+# AIのモデルは GeminiModel と同じ generate() を持つものに差し替えられる（テスト・ベンチマークでは FakeModel）。
+# 詳細ページの項目は、まず規則（app/exam_field_extractor.py）で読み取り、読み取れなかったページだけAIに任せる。
+# CrawlFrontier（app/crawl_frontier.py）を渡すと、期限の来たページだけを条件付きGETで取得し、
+# 304 や本文が前回と同じページは解析・判定・抽出をしない。
+import json
+import os
+import re
+import sqlite3
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+from urllib.parse import urlsplit
+import requests
+import google.generativeai as genai
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from .crawl_frontier import PROVIDER_LISTING_URLS, CrawlFrontier, FetchResult, canonical_url, conditional_headers, content_hash
+from .exam_field_extractor import extract_exam_fields, unresolved_fields
+from .extensions import db
+from .models import OfficialMockExam
+from .structured_logging import get_logger
+from .upsert import upsert_rows
+
+logger = get_logger('exam_scraper')
+
+MODEL_NAME = 'gemini-1.5-flash'
+
+# AIに渡すページ本文の最大文字数
+PAGE_TEXT_LIMIT = 8000
+
+# リンク判定のプロンプトを変えたら上げる（保存済みの判定結果は使われなくなる）
+LINK_PROMPT_VERSION = 2
+# 1回のプロンプトで判定するリンクの数
+LINK_BATCH_SIZE = 40
+
+
+class LegacySSLAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        ssl_context.options |= getattr(ssl, "OP_LEGACY_SERVER_CONNECT", 0x4)
+        self.poolmanager = PoolManager(
+            ssl_context=ssl_context, num_pools=connections, maxsize=maxsize,
+            block=block, **pool_kwargs)
+
+
+def get_legacy_session(pool_maxsize=10):
+    """古いSSLリネゴシエーションを許可するrequests.Sessionオブジェクトを作成する"""
+    session = requests.Session()
+    session.mount("https://", LegacySSLAdapter(pool_maxsize=pool_maxsize))
+    session.mount("http://", HTTPAdapter(pool_maxsize=pool_maxsize))
+    return session
+
+
+def page_text(content):
+    """HTMLから、AIに渡す本文（空白を詰めたテキスト）を取り出す"""
+    soup = BeautifulSoup(content, 'html.parser')
+    return ' '.join(soup.get_text().split())[:PAGE_TEXT_LIMIT]
+
+
+# --- AIのモデル ---
+
+class GeminiModel:
+    """google.generativeai のモデル。generate() は応答のテキストを返す"""
+
+    def __init__(self, name=MODEL_NAME):
+        self._model = genai.GenerativeModel(name)
+
+    def generate(self, prompt, timeout, json_response=False):
+        config = {'response_mime_type': 'application/json'} if json_response else None
+        return self._model.generate_content(prompt, generation_config=config, request_options={'timeout': timeout}).text
+
+
+class FakeModel:
+    """
+    オフラインのテスト・ベンチマーク用のモデル。responder(プロンプト) の戻り値を応答にし、呼び出しを記録する。
+    responder を省略すると、リンクの判定にはリンクテキストのキーワードで答え、それ以外には空のJSONを返す。
+    """
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder or _keyword_responder
+        self.latency = latency
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, timeout, json_response=False):
+        with self._lock:
+            self.prompts.append(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.responder(prompt)
+
+
+def _keyword_responder(prompt):
+    links = _prompt_links(prompt)
+    if links is None:
+        return '```json\n{}\n```'
+    return json.dumps([{'id': link['id'], 'is_exam': '模試' in link['text'] and not
+                        any(word in link['text'] for word in ('一覧', '方法', 'スケジュール', 'お問い合わせ'))}
+                       for link in links], ensure_ascii=False)
+
+
+# --- AIの役割定義 (思考ルーチンを強化) ---
+
+_LINK_PROMPT = """
+以下は大学受験模試の提供元サイトにあるリンクの一覧です。それぞれのリンクが、特定の大学受験模試（例：「第1回全統共通テスト模試」）の
+詳細・申込ページへのリンクかを判定してください。
+一般的な案内ページ（例：「模試一覧」「お申し込み方法」）や、模試と無関係なページは false と判断してください。
+結果は [{{"id": 番号, "is_exam": true または false}}, ...] の形のJSON配列だけで、全てのリンクについて返してください。
+リンク一覧:
+{links}
+"""
+_LINKS_MARKER = 'リンク一覧:\n'
+
+
+def _prompt_links(prompt):
+    """リンク判定のプロンプトに埋め込んだリンクの一覧（リンク判定のプロンプトでなければ None）"""
+    if _LINKS_MARKER not in prompt:
+        return None
+    return json.loads(prompt.split(_LINKS_MARKER, 1)[1])
+
+
+def _parse_json(text):
+    """AIの応答からJSONを取り出す（```json で囲まれていてもよい）"""
+    fenced = re.search(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL)
+    return json.loads(fenced.group(1) if fenced else text)
+
+
+class ClassificationCache:
+    """リンクの判定結果をSQLiteのファイルに保存する（複数のスレッドから使える）"""
+
+    def __init__(self, path):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS link_classifications ('
+            'prompt_version INTEGER NOT NULL, url TEXT NOT NULL, link_text TEXT NOT NULL, is_exam INTEGER NOT NULL, '
+            'PRIMARY KEY (prompt_version, url, link_text))')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """(プロンプトのバージョン, URL, リンクテキスト) のリストを受け取り、保存済みのものだけ キー → 判定 で返す"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._connection.execute(
+                    'SELECT is_exam FROM link_classifications WHERE prompt_version = ? AND url = ? AND link_text = ?',
+                    key).fetchone()
+                if row is not None:
+                    found[key] = bool(row[0])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, results):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO link_classifications (prompt_version, url, link_text, is_exam) VALUES (?, ?, ?, ?)',
+                [(*key, int(is_exam)) for key, is_exam in results.items()])
+
+    def close(self):
+        self._connection.close()
+
+
+class LinkClassifier:
+    """【鑑定士AI】リンクが模試の詳細ページらしいかを、保存済みの結果を使いつつ数十件ずつまとめて判定する"""
+
+    def __init__(self, model=None, cache=None, batch_size=LINK_BATCH_SIZE):
+        self.model = model or GeminiModel()
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def classify_links(self, links, undetermined=False):
+        """
+        (リンクテキスト, URL) のリストを受け取り、同じ順の True/False のリストを返す。
+        判定できなかった（応答が壊れていた・AIの呼び出しに失敗した）リンクは保存せず、undetermined を返す
+        """
+        keys = [(LINK_PROMPT_VERSION, canonical_url(url) or url, text) for text, url in links]
+        results = self.cache.get_many(keys) if self.cache else {}
+        missing = list(dict.fromkeys(key for key in keys if key not in results))
+        for start in range(0, len(missing), self.batch_size):
+            answered = self._ask(missing[start:start + self.batch_size])
+            if self.cache and answered:
+                self.cache.put_many(answered)
+            results.update(answered)
+        return [results.get(key, undetermined) for key in keys]
+
+    def _ask(self, batch):
+        payload = json.dumps([{'id': i, 'text': text, 'url': url} for i, (_, url, text) in enumerate(batch)],
+                             ensure_ascii=False)
+        try:
+            answers = _parse_json(self.model.generate(_LINK_PROMPT.format(links=payload), timeout=40, json_response=True))
+            by_id = {int(a['id']): bool(a['is_exam']) for a in answers}
+        except Exception:
+            logger.warning('mock exam link classification failed', extra={'links': len(batch)}, exc_info=True)
+            return {}
+        if len(by_id) < len(batch):
+            logger.warning('mock exam link classification is incomplete', extra={'links': len(batch), 'answers': len(by_id)})
+        return {key: by_id[i] for i, key in enumerate(batch) if i in by_id}
+
+
+def is_link_a_mock_exam(link_text: str, link_url: str, classifier=None) -> bool:
+    """1件のリンクだけを判定する"""
+    return (classifier or LinkClassifier()).classify_links([(link_text, link_url)])[0]
+
+
+def extract_exam_details_from_text(text: str, provider: str, model=None):
+    """【書記AI - 強化版】詳細ページの本文から文脈を読んで模試の情報をJSONで抽出する"""
+    model = model or GeminiModel()
+    today = date.today().isoformat()
+    prompt = f"""
+    あなたはWebページから日本の大学受験模試の情報を抽出するエキスパートです。今日の日付は{today}です。
+    以下のテキストから、以下の項目を抽出してください。
+    - name: 模試の正式名称。「{provider}」という単語は含めないでください。
+    - target_grade: 対象学年（例：「高3・卒」）。
+    - exam_date: 実施日。
+    - app_start_date: 申込開始日。
+    - app_end_date: 申込締切日。
+
+    重要：
+    - 日付は必ず「YYYY-MM-DD」形式にしてください。
+    - 実施日は、今日以降の最も可能性の高い日付を選んでください。
+    - 申込開始日と締切日は、「申込期間」などのキーワードの近くにある日付を優先してください。
+    - 情報が見つからない項目はnullにしてください。
+    - 結果は必ずJSON形式 {{"name": ..., "exam_date": ...}} で返してください。
+
+    テキスト：
+    {text}
+    """
+
+    return _parse_json(model.generate(prompt, timeout=40, json_response=True))
+
+
+class ExamDetailsExtractor:
+    """詳細ページの本文から、まず規則で項目を読み取り、足りないページだけAIで抽出して補う"""
+
+    def __init__(self, model=None, today=None):
+        self.model = model
+        self.today = today
+        self.rule_only = 0
+        self.ai_calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, provider):
+        fields = extract_exam_fields(text, provider, self.today)
+        if not unresolved_fields(text, fields):
+            with self._lock:
+                self.rule_only += 1
+            return fields
+        with self._lock:
+            self.ai_calls += 1
+        details = extract_exam_details_from_text(text, provider, model=self.model)
+        # 規則で読み取れた項目はそのまま使い、残りをAIの結果で埋める
+        return {key: fields.get(key) or details.get(key) for key in fields}
+
+
+def extract_exam_details_with_ai(url: str, provider: str):
+    """詳細ページを取得し、AIで模試の情報を抽出する（1件だけ調べるとき用）"""
+    response = get_legacy_session().get(url, timeout=15)
+    response.raise_for_status()
+    return extract_exam_details_from_text(page_text(response.content), provider)
+
+
+class HostSessions:
+    """ホストごとに1つ、接続を使い回す Session を持ち、同時接続数とアクセス間隔をホストごとに制限する"""
+
+    def __init__(self, max_per_host=2, min_interval=1.0, timeout=15):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._hosts = {}  # ホスト -> (Session, 同時接続数のセマフォ, 次にアクセスしてよい時刻を守るロック, [時刻])
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (get_legacy_session(self.max_per_host), threading.BoundedSemaphore(self.max_per_host),
+                                     threading.Lock(), [0.0])
+            return self._hosts[host]
+
+    def get(self, url):
+        response = self.fetch(url)
+        response.raise_for_status()
+        return response.content
+
+    def fetch(self, url, headers=None):
+        """レスポンスをそのまま返す（304 などの確認は呼び出し側で行う）"""
+        session, slots, pacing, next_at = self._host(url)
+        with slots:
+            with pacing:
+                delay = next_at[0] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at[0] = time.monotonic() + self.min_interval
+            return session.get(url, headers=headers, timeout=self.timeout)
+
+    @property
+    def hosts(self):
+        return list(self._hosts)
+
+    def close(self):
+        for session, _, _, _ in self._hosts.values():
+            session.close()
+        self._hosts.clear()
+
+
+class ExamScrapePipeline:
+    """
+    一覧ページ → リンクの判定 → 詳細ページの取得と抽出 を並行に進める。
+    classifier（LinkClassifier）と extract(本文, 提供元) は差し替えられる（テストではAIを呼ばない）。
+    frontier（CrawlFrontier）を渡すと期限の来たページだけを条件付きGETで取得し、変わっていないページは飛ばす。
+    on_progress(終わった件数, 全体の件数) は、段階が1つ終わるたびにメインスレッドから呼ばれる。
+    """
+
+    def __init__(self, fetcher=None, classifier=None, extract=None, workers=8, frontier=None, on_progress=None):
+        self.fetcher = fetcher or HostSessions()
+        self.classifier = classifier or LinkClassifier()
+        self.extract = extract or ExamDetailsExtractor()
+        self.workers = workers
+        self.frontier = frontier
+        self.on_progress = on_progress
+        self.errors = []  # (URL, 例外の説明)
+        self.stats = {'not_modified': 0, 'unchanged': 0, 'changed': 0}  # 取得したページの内訳
+
+    def run(self, listings=None):
+        """listings（提供元 → 一覧ページのURL）を調べ、OfficialMockExam に書き込む行のリストを返す"""
+        listings = listings or PROVIDER_LISTING_URLS
+        frontier = self.frontier
+        rows = []
+        seen = {canonical_url(url) for url in listings.values()}
+        batch_size = self.classifier.batch_size
+        waiting = {}  # 一覧ページのURL → [判定待ちのバッチ数, すべて判定できたか, 取得の結果]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+
+            def submit(stage, provider, target):
+                if stage == 'listing':
+                    future = pool.submit(self._listing_links, target, self._state(target))
+                elif stage == 'links':
+                    future = pool.submit(self.classifier.classify_links, target[1], undetermined=None)
+                else:
+                    if frontier:
+                        frontier.add(target, provider, 'detail')
+                    future = pool.submit(self._exam_details, target, provider, self._state(target))
+                pending[future] = (stage, provider, target)
+
+            def batch_done(listing, determined):
+                entry = waiting[listing]
+                entry[0] -= 1
+                entry[1] = entry[1] and determined
+                if entry[0] == 0:
+                    del waiting[listing]
+                    # 判定できなかったリンクがあれば、一覧ページを変わっていない扱いにせず後でもう一度調べる
+                    if entry[1]:
+                        self._record(listing, entry[2])
+                    else:
+                        self._failed(listing)
+
+            if frontier:
+                frontier.seed_listings(listings)
+                for page in frontier.due(providers=set(listings)):
+                    seen.add(page.url)
+                    submit(page.kind, page.provider, page.url)
+            else:
+                for provider, url in listings.items():
+                    submit('listing', provider, url)
+
+            # 終わったものから次の段階を投入するので、取得と抽出が重なって進む
+            finished = 0
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished += len(done)
+                for future in done:
+                    stage, provider, target = pending.pop(future)
+                    url = target[0] if stage == 'links' else target
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning('exam scraping step failed', extra={'stage': stage, 'url': url}, exc_info=True)
+                        self.errors.append((url, repr(e)))
+                        if stage == 'links':
+                            batch_done(url, False)
+                        else:
+                            self._failed(url)
+                        continue
+                    if stage == 'listing':
+                        fetched, found = result
+                        if found is None:
+                            self._record(url, fetched)
+                            continue
+                        # 巡回予定にある詳細ページは、一覧に載っていても予定の時刻まで取得しない
+                        links = [(text, link) for text, link in found
+                                 if link not in seen and not (frontier and frontier.knows(link))]
+                        seen.update(link for _, link in links)
+                        batches = [links[start:start + batch_size] for start in range(0, len(links), batch_size)]
+                        if not batches:
+                            self._record(url, fetched)
+                        else:
+                            waiting[url] = [len(batches), True, fetched]
+                        for batch in batches:
+                            submit('links', provider, (url, batch))
+                    elif stage == 'links':
+                        for (_, link), is_exam in zip(target[1], result):
+                            if is_exam:
+                                submit('detail', provider, link)
+                        batch_done(url, None not in result)
+                    else:
+                        fetched, details = result
+                        self._record(url, fetched)
+                        row = exam_row(provider, url, details) if details is not None else None
+                        if row:
+                            rows.append(row)
+                if self.on_progress:
+                    self.on_progress(finished, finished + len(pending))
+        return rows
+
+    def _state(self, url):
+        """前回の取得の (ETag, Last-Modified, 本文のハッシュ)。巡回予定を使わないか、まだ取得していなければ None"""
+        page = self.frontier.pages.get(url) if self.frontier else None
+        if page is None or page.last_fetched_at is None:
+            return None
+        return page.etag, page.last_modified, page.content_hash
+
+    def _record(self, url, fetched):
+        if fetched.status == 304:
+            self.stats['not_modified'] += 1
+        else:
+            self.stats['changed' if fetched.changed else 'unchanged'] += 1
+        if self.frontier:
+            self.frontier.record(self.frontier.pages[url], fetched)
+
+    def _failed(self, url):
+        if self.frontier and url in self.frontier.pages:
+            self.frontier.record_failure(self.frontier.pages[url])
+
+    def _fetch(self, url, state):
+        """
+        ページを取得し、(取得の結果, 本文) を返す。前回の結果（state）があれば条件付きGETにし、
+        304 が返ったときや本文のハッシュが前回と同じときは、本文の代わりに None を返す
+        """
+        etag, last_modified, known_hash = state or (None, None, None)
+        response = self.fetcher.fetch(url, headers=conditional_headers(etag, last_modified))
+        if response.status_code == 304:
+            return FetchResult(304, etag, last_modified, known_hash, False), None
+        response.raise_for_status()
+        digest = content_hash(response.content)
+        fetched = FetchResult(response.status_code, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                              digest, digest != known_hash)
+        return fetched, response.content if fetched.changed else None
+
+    def _listing_links(self, url, state=None):
+        """
+        一覧ページの (リンクテキスト, 正規化したURL) のリスト（http(s) 以外とページ内で重複するリンクは除く）。
+        (取得の結果, リンクのリスト) を返し、ページが変わっていなければリンクのリストは None
+        """
+        fetched, content = self._fetch(url, state)
+        if content is None:
+            return fetched, None
+        soup = BeautifulSoup(content, 'html.parser')
+        links = {}
+        for a in soup.find_all('a', href=True):
+            link = canonical_url(a['href'], base=url)
+            if link and link not in links:
+                links[link] = ' '.join(a.get_text().split())
+        return fetched, [(text, link) for link, text in links.items()]
+
+    def _exam_details(self, url, provider, state=None):
+        """(取得の結果, 抽出結果) を返す。ページが変わっていなければ抽出せず、抽出結果は None"""
+        fetched, content = self._fetch(url, state)
+        return fetched, self.extract(page_text(content), provider) if content is not None else None
+
+
+def exam_row(provider, url, details):
+    """抽出結果を OfficialMockExam の行にする。模試名か実施日が無ければ None"""
+    if not details or not details.get('name'):
+        return None
+    dates = {}
+    for key in ('exam_date', 'app_start_date', 'app_end_date'):
+        try:
+            dates[key] = date.fromisoformat(details[key]) if details.get(key) else None
+        except (TypeError, ValueError):
+            dates[key] = None
+    if dates['exam_date'] is None:
+        return None
+    target_grade = details.get('target_grade')
+    return dict(dates, provider=provider, name=details['name'][:150], url=url[:255],
+                target_grade=target_grade[:50] if target_grade else None)
+
+
+def save_official_exams(rows):
+    """(提供元, 模試名, 実施日) が同じ行は更新し、無ければ追加する。書き込んだ件数を返す"""
+    unique = {(r['provider'], r['name'], r['exam_date']): r for r in rows}
+    upsert_rows(OfficialMockExam, list(unique.values()), index_elements=['provider', 'name', 'exam_date'],
+                update_columns=['app_start_date', 'app_end_date', 'url', 'target_grade'])
+    db.session.commit()
+    return len(unique)
+
+
+def refresh_official_exams(providers=None, cache_path=None, model=None, workers=8, per_host=2, interval=1.0,
+                           use_frontier=True, dry_run=False, on_progress=None):
+    """
+    模試の公式ページを調べ、公式模試の一覧を更新する（`flask scrape-official-exams` とバックグラウンドジョブで使う）。
+    (抽出した行のリスト, 件数の集計) を返す。dry_run なら何も保存しない（巡回予定の更新も取り消す）
+    """
+    listings = {p: url for p, url in PROVIDER_LISTING_URLS.items() if not providers or p in providers}
+    model = model or GeminiModel()
+    link_cache = ClassificationCache(cache_path) if cache_path else None
+    fetcher = HostSessions(max_per_host=per_host, min_interval=interval)
+    extractor = ExamDetailsExtractor(model)
+    pipeline = ExamScrapePipeline(fetcher, LinkClassifier(model, link_cache), extractor, workers=workers,
+                                  frontier=CrawlFrontier() if use_frontier else None, on_progress=on_progress)
+    try:
+        rows = pipeline.run(listings)
+    finally:
+        fetcher.close()
+        if link_cache:
+            link_cache.close()
+    summary = dict(pipeline.stats, exams=len(rows), errors=len(pipeline.errors),
+                   rule_only=extractor.rule_only, ai_calls=extractor.ai_calls,
+                   link_cache_hits=link_cache.hits if link_cache else 0,
+                   link_cache_misses=link_cache.misses if link_cache else 0)
+    if dry_run:
+        db.session.rollback()
+    else:
+        # 巡回予定の更新は、模試の情報と同じコミットで保存する
+        summary['saved'] = save_official_exams(rows)
+    return rows, summary
@@ -0,0 +1,43 @@
+# app/heatmap.py
+# 学習時間ヒートマップ用のデータ（開始日 + 日毎の分数の配列）と色レベルの計算
+from bisect import bisect_right
+from .extensions import db
+from .models import StudyDailyRollup
+
+# 1日の学習時間（分）が何分以上で色レベル1〜5になるか
+THRESHOLDS = {
+    'ronin': (1, 180, 300, 480, 600),
+    'default': (1, 60, 120, 180, 300),
+}
+
+MAX_RANGE_DAYS = 731
+
+
+def thresholds_for(grade):
+    return THRESHOLDS['ronin'] if grade == 'ronin' else THRESHOLDS['default']
+
+
+def color_levels(minutes, thresholds):
+    """分数の配列を、まとめて色レベル(0〜5)の配列に変換する"""
+    return [bisect_right(thresholds, m) for m in minutes]
+
+
+def daily_minutes(user_id, start, end):
+    """start〜end（両端を含む）の日毎の合計学習時間を、1日1要素の配列で返す"""
+    minutes = [0] * ((end - start).days + 1)
+    rows = db.session.query(StudyDailyRollup.date, db.func.sum(StudyDailyRollup.minutes))\
+        .filter(StudyDailyRollup.user_id == user_id, StudyDailyRollup.date >= start, StudyDailyRollup.date <= end)\
+        .group_by(StudyDailyRollup.date)
+    for day, total in rows:
+        minutes[(day - start).days] = total
+    return minutes
+
+
+def heatmap_payload(user_id, grade, start, end):
+    """ヒートマップAPIのレスポンス。日付は start からの連番で表す"""
+    minutes = daily_minutes(user_id, start, end)
+    return {
+        'start': start.isoformat(),
+        'minutes': minutes,
+        'levels': color_levels(minutes, thresholds_for(grade)),
+    }
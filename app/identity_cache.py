@@ -0,0 +1,127 @@
+# app/identity_cache.py
+# ログイン中のユーザー（User と科目の一覧）を、ユーザーIDごとに短時間だけプロセス内に保持する。
+# User（科目の選択を含む）を変更したトランザクションは users.identity_version を1つ進めるので、
+# 保持している値を使う前にその値だけをDBで確認し、他のワーカーでの変更（パスワード・管理者の権限など）にもすぐに気づく。
+# ORMを通さない一括UPDATEで User を書き換えるときは、identity_version も一緒に進めること。
+# パスワードを確認する処理は、念のため必ずDBから読み直すこと。
+import threading
+from cachetools import TTLCache
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from .extensions import db
+from .models import User, Subject
+
+_EXTENSION_KEY = 'identity_cache'
+_init_lock = threading.Lock()
+_USER_COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+
+class IdentityCache:
+    def __init__(self, ttl, maxsize=10000):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, current_version):
+        """DBの identity_version と同じバージョンで保存した値だけを返す"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == current_version:
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+
+    def has(self, user_id):
+        with self._lock:
+            return user_id in self._entries
+
+    def put(self, user_id, version, snapshot):
+        with self._lock:
+            self._entries[user_id] = (version, snapshot)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_identity_cache():
+    cache = current_app.extensions.get(_EXTENSION_KEY)
+    if cache is None:
+        with _init_lock:
+            cache = current_app.extensions.setdefault(
+                _EXTENSION_KEY, IdentityCache(current_app.config.get('IDENTITY_CACHE_TTL', 30)))
+    return cache
+
+
+def identity_cache_stats():
+    return get_identity_cache().stats()
+
+
+def load_identity(user_id):
+    """user_loader 用。保持している値がDBのバージョンと同じなら、User と科目を読み込まずにセッションに載せて返す"""
+    existing = db.session.identity_map.get(identity_key(User, user_id))
+    if existing is not None:
+        return existing
+
+    cache = get_identity_cache()
+    if cache.has(user_id):
+        version = db.session.query(User.identity_version).filter_by(id=user_id).scalar()
+        snapshot = cache.get(user_id, version)
+        if snapshot is not None:
+            return _attach(snapshot)
+
+    user = db.session.query(User).options(selectinload(User.subjects)).get(user_id)
+    if user is not None:
+        cache.put(user_id, user.identity_version, (
+            {key: getattr(user, key) for key in _USER_COLUMNS},
+            tuple((s.id, s.name) for s in user.subjects)))
+    return user
+
+
+def _attach(snapshot):
+    """保存しておいた値から、DBから読み込んだのと同じ状態の User を作ってセッションに加える"""
+    columns, subject_rows = snapshot
+    subjects = []
+    for subject_id, name in subject_rows:
+        subject = Subject(id=subject_id, name=name)
+        make_transient_to_detached(subject)
+        subjects.append(db.session.merge(subject, load=False))
+    user = User(**columns)
+    set_committed_value(user, 'subjects', subjects)
+    make_transient_to_detached(user)
+    db.session.add(user)
+    return user
+
+
+@event.listens_for(User, 'before_update')
+def _bump_on_user_change(mapper, connection, target):
+    # 科目の選択（多対多）だけの変更でも、User の行を更新してバージョンを進める
+    session = object_session(target)
+    if session.is_modified(target):
+        target.identity_version = User.identity_version + 1
+        session.info.setdefault('identity_changed', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _discard_after_commit(session):
+    # 自分のワーカーの値はすぐに捨てる（他のワーカーは次の読み込みでバージョンの変化に気づく）
+    changed = session.info.pop('identity_changed', None)
+    if changed and has_app_context():
+        cache = current_app.extensions.get(_EXTENSION_KEY)
+        if cache is not None:
+            for user_id in changed:
+                cache.discard(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('identity_changed', None)
@@ -0,0 +1,238 @@
+# app/jobs.py
+# DBを使ったバックグラウンドジョブのキュー。時間のかかる処理（模試の公式ページの取得、集計の作り直しなど）は
+# Webのリクエスト中には実行せず、enqueue() で jobs テーブルに積んで、別プロセスのワーカー（`flask run-jobs`）に任せる。
+# - dedupe_key が同じジョブが実行待ち・実行中なら、新しく積まずにそのジョブを返す
+# - 失敗したジョブは、間隔を倍に延ばしながら max_attempts 回まで実行し直す
+# - 進捗は処理のトランザクションとは別の接続ですぐにコミットするので、管理画面から途中経過を確認できる
+# - 実行中は JOB_HEARTBEAT ごとに（進捗の報告が無くても）更新時刻を書き込む。
+#   JOB_LEASE 以上更新の無い実行中のジョブは、ワーカーが落ちたものとして他のワーカーが取り直す
+# 処理は @job_handler('種類') で登録する。重いライブラリは処理の中で読み込むこと（Webのワーカーもこのモジュールを読み込む）。
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import Job
+from .structured_logging import get_logger
+
+logger = get_logger('jobs')
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+# 再試行までの待ち時間（1回目の失敗の後は RETRY_BASE_DELAY、以降は倍ずつ、最大 RETRY_MAX_DELAY）
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+# 実行中のまま、この時間進捗の更新が無いジョブは取り直す
+JOB_LEASE = timedelta(minutes=30)
+# 実行中のジョブの更新時刻を書き込む間隔（JOB_LEASE より十分短くする）
+JOB_HEARTBEAT = timedelta(minutes=5)
+
+_HANDLERS = {}  # ジョブの種類 → 処理（progress, **payload）
+
+
+def job_handler(kind):
+    """ジョブの処理を登録するデコレータ。処理は (progress, **payload) で呼ばれ、JSONにできる値を返す"""
+    def register(func):
+        _HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, dedupe_key=None, max_attempts=3, run_at=None):
+    """
+    ジョブを積んでコミットし、Job を返す。
+    dedupe_key が同じジョブが実行待ち・実行中なら、新しく積まずにそのジョブを返す
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f'unknown job kind: {kind}')
+    if dedupe_key:
+        existing = db.session.query(Job).filter_by(dedupe_key=dedupe_key).first()
+        if existing:
+            return existing
+    job = Job(kind=kind, payload=json.dumps(payload or {}, ensure_ascii=False), dedupe_key=dedupe_key,
+              max_attempts=max_attempts, run_at=run_at or datetime.utcnow())
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 同じ dedupe_key のジョブを、他のリクエストが先に積んだ
+        db.session.rollback()
+        return db.session.query(Job).filter_by(dedupe_key=dedupe_key).one()
+    return job
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def _claimable(now):
+    return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+               and_(Job.status == RUNNING, Job.locked_at < now - JOB_LEASE))
+
+
+def claim_job(worker_id, now=None):
+    """実行できるジョブを1件取って実行中にし、コミットして返す（無ければ None）"""
+    now = now or datetime.utcnow()
+    candidates = db.session.query(Job.id).filter(_claimable(now)).order_by(Job.run_at, Job.id).limit(5).all()
+    for (job_id,) in candidates:
+        # 他のワーカーが先に取っていれば条件に合わなくなり、0行の更新になる
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, _claimable(now))
+            .values(status=RUNNING, locked_by=worker_id, locked_at=now, started_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        if claimed.rowcount == 1:
+            return db.session.get(Job, job_id)
+    return None
+
+
+class JobProgress:
+    """処理から呼ぶ進捗の報告。別の接続で書き込んですぐにコミットする（処理のトランザクションには含めない）"""
+
+    def __init__(self, job_id, min_interval=1.0):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._next_at = 0.0
+
+    def __call__(self, done, total=None, message=None):
+        now = time.monotonic()
+        # 頻繁に呼ばれても、最後の1回以外は min_interval ごとにしか書き込まない
+        if now < self._next_at and (total is None or done < total):
+            return
+        self._next_at = now + self.min_interval
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(update(Job).where(Job.id == self.job_id).values(
+                    progress_done=done, progress_total=total, message=message[:255] if message else None,
+                    locked_at=datetime.utcnow()))
+        except Exception:
+            logger.warning('job progress update failed', extra={'job_id': self.job_id}, exc_info=True)
+
+
+def _start_heartbeat(job_id, worker_id):
+    """
+    処理の実行中、JOB_HEARTBEAT ごとに別の接続で locked_at を書き込み、他のワーカーに取り直されないようにする。
+    返した Event を set すると止まる
+    """
+    engine = db.engine
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(JOB_HEARTBEAT.total_seconds()):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(update(Job).where(Job.id == job_id, Job.status == RUNNING,
+                                                         Job.locked_by == worker_id)
+                                       .values(locked_at=datetime.utcnow()))
+            except Exception:
+                logger.warning('job heartbeat failed', extra={'job_id': job_id}, exc_info=True)
+
+    threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True).start()
+    return stop
+
+
+def run_job(job, now=datetime.utcnow):
+    """ジョブを実行し、結果（成功・再試行待ち・失敗）を書き込む。成功したら True を返す"""
+    handler = _HANDLERS.get(job.kind)
+    heartbeat = _start_heartbeat(job.id, job.locked_by)
+    try:
+        if handler is None:
+            raise LookupError(f'no handler for job kind: {job.kind}')
+        result = handler(JobProgress(job.id), **json.loads(job.payload))
+    except Exception as e:
+        heartbeat.set()
+        # 処理の途中の書き込みは取り消し、ジョブの状態だけを書き込む
+        db.session.rollback()
+        logger.warning('job failed', extra={'job_id': job.id, 'kind': job.kind, 'attempt': job.attempts}, exc_info=True)
+        job.last_error = repr(e)
+        job.locked_by = job.locked_at = None
+        if job.attempts < job.max_attempts:
+            job.status = QUEUED
+            job.run_at = now() + retry_delay(job.attempts)
+            job.message = f'再試行待ち（{job.attempts}/{job.max_attempts} 回目が失敗）'
+        else:
+            job.status = FAILED
+            job.finished_at = now()
+            job.dedupe_key = None
+            job.message = f'{job.attempts} 回失敗しました'
+        db.session.commit()
+        return False
+    heartbeat.set()
+    job.status = SUCCEEDED
+    job.result = json.dumps(result, ensure_ascii=False, default=str)
+    job.finished_at = now()
+    job.locked_by = job.locked_at = None
+    job.dedupe_key = None
+    db.session.commit()
+    logger.info('job finished', extra={'job_id': job.id, 'kind': job.kind, 'attempt': job.attempts})
+    return True
+
+
+def run_worker(worker_id=None, poll_interval=2.0, once=False, should_stop=lambda: False):
+    """
+    ジョブを取り出して実行し続け、実行した件数を返す。
+    once=True なら、今すぐ実行できるジョブが無くなった時点で戻る
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    count = 0
+    while not should_stop():
+        job = claim_job(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        logger.info('job started', extra={'job_id': job.id, 'kind': job.kind, 'attempt': job.attempts})
+        run_job(job)
+        count += 1
+    return count
+
+
+def job_status(job):
+    """管理画面のポーリングに返すジョブの状態"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.last_error if job.status == FAILED else None,
+        'finished': job.status in (SUCCEEDED, FAILED),
+    }
+
+
+# --- ジョブの処理 ---
+
+@job_handler('refresh_official_exams')
+def refresh_official_exams_job(progress, providers=None):
+    """模試の公式ページを調べ、公式模試の一覧を更新する"""
+    from flask import current_app
+    from .exam_scraper import refresh_official_exams
+    _, summary = refresh_official_exams(providers, cache_path=current_app.config['EXAM_SCRAPER_CACHE_PATH'],
+                                        on_progress=lambda done, total: progress(done, total, 'ページを取得・解析しています'))
+    if summary['errors'] and not (summary['changed'] or summary['unchanged'] or summary['not_modified']):
+        # 1ページも取得できなかった（サイトやネットワークの障害）ときは、時間をおいて再試行する
+        raise RuntimeError(f"no official exam page could be fetched ({summary['errors']} errors)")
+    return summary
+
+
+@job_handler('backfill_study_rollup')
+def backfill_study_rollup_job(progress, user_id=None):
+    """学習記録から日毎の学習時間集計を作り直す"""
+    from .study_rollup import backfill_study_rollup
+    return {'rows': backfill_study_rollup(user_id)}
+
+
+@job_handler('backfill_progress_bitmaps')
+def backfill_progress_bitmaps_job(progress):
+    """progress テーブルから、ユーザーごとの完了タスクのビット列を作り直す"""
+    from .progress_bitmap import backfill_progress_bitmaps
+    return {'users': backfill_progress_bitmaps()}
@@ -0,0 +1,200 @@
+# app/load_dataset.py
+# 負荷試験用の大量データ（ユーザー・進捗・選択・学習記録・模試・お問い合わせ）を作る。
+# 参照データ（seed_db.py）が投入済みのDBに対して、ユーザー数件ごとにまとめて一括INSERTする。
+import random
+import secrets
+import time
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from werkzeug.security import generate_password_hash
+from .extensions import db
+from .models import (User, University, Progress, UserProgressBitmap, UserContinuousTaskSelection,
+                     UserSequentialTaskSelection, StudyLog, StudyDailyRollup, MockExam, MockExamResult,
+                     Inquiry, Reply, user_subjects_table)
+from .plan_cache import get_plan_cache
+from .progress_bitmap import encode_bits
+from .reference_cache import all_subjects, faculty_names_for
+
+GRADES = ('high1', 'high2', 'high3', 'ronin')
+COURSE_TYPES = ('science', 'humanities')
+# 学年が上がるほど、ルートの先まで進んでいる
+PROGRESS_RATIO = {'high1': (0.0, 0.3), 'high2': (0.1, 0.5), 'high3': (0.3, 0.8), 'ronin': (0.5, 1.0)}
+PROVIDERS = ('河合塾', '駿台', '東進', 'ベネッセ')
+RANKINGS = ('A', 'B', 'C', 'D', 'E')
+
+_Profile = namedtuple('_Profile', 'course_type')
+
+
+class LoadDatasetGenerator:
+    """乱数のシードと量の設定を受け取り、決まった内容のデータを作る"""
+
+    def __init__(self, users=1000, seed=0, days=365, study_days_per_week=4, exams_per_user=4,
+                 inquiry_rate=0.1, batch_size=500, prefix='load', password=None, admin_password=None):
+        """
+        password を省略すると乱数で作る（作ったものは self.password で参照できる）。
+        admin_password を指定したときだけ、お問い合わせに返信する管理者を1人作る
+        """
+        self.users = users
+        self.random = random.Random(seed)
+        self.days = days
+        self.study_days_per_week = study_days_per_week
+        self.exams_per_user = exams_per_user
+        self.inquiry_rate = inquiry_rate
+        self.batch_size = batch_size
+        self.prefix = prefix
+        # 全員同じパスワード（ハッシュの計算は遅いので1回だけ行う）
+        self.password = password or secrets.token_urlsafe(12)
+        self.password_hash = generate_password_hash(self.password, method='pbkdf2:sha256')
+        self.admin_password = admin_password
+        self.row_counts = Counter()
+
+        plan_cache = get_plan_cache()
+        self.subjects = all_subjects()
+        self.book_id_by_task_id = {b.task_id: b.id for b in plan_cache.books_by_task_id.values()}
+        self.plans = {(subject.id, course_type): plan_cache.plan_for_subject(subject, _Profile(course_type))
+                      for subject in self.subjects for course_type in COURSE_TYPES}
+        self.universities = [(name, faculty_names_for(uid))
+                             for uid, name in db.session.query(University.id, University.name).order_by(University.id)]
+        if not self.subjects or not self.universities:
+            raise RuntimeError('参照データがありません。先に seed_db.py を実行してください。')
+
+        self.next_ids = {model: (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+                         for model in (User, MockExam, Inquiry)}
+
+    def generate(self):
+        started = time.perf_counter()
+        admin_id = self._add_admin() if self.admin_password else \
+            db.session.query(User.id).filter_by(is_admin=True).order_by(User.id).limit(1).scalar()
+        for offset in range(0, self.users, self.batch_size):
+            rows = defaultdict(list)
+            for _ in range(min(self.batch_size, self.users - offset)):
+                user_id = self._add_user(rows)
+                self._add_user_data(rows, user_id, admin_id)
+            self._write(rows)
+        _reset_sequences((User, MockExam, Inquiry))
+        db.session.commit()
+        return time.perf_counter() - started
+
+    def _add_admin(self):
+        """返信用の管理者を作る（学習データは作らない）"""
+        rows = defaultdict(list)
+        admin_id = self._add_user(rows)
+        rows[User][-1].update({'username': f'{self.prefix}_admin_{admin_id:07d}', 'is_admin': True,
+                               'password_hash': generate_password_hash(self.admin_password, method='pbkdf2:sha256')})
+        self._write(rows)
+        return admin_id
+
+    # --- 1ユーザー分の行を作る ---
+    def _add_user(self, rows):
+        user_id = self._take_id(User)
+        school, faculties = self.random.choice(self.universities)
+        grade = self.random.choice(GRADES)
+        course_type = self.random.choice(COURSE_TYPES)
+        rows[User].append({
+            'id': user_id, 'username': f'{self.prefix}_{user_id:07d}', 'password_hash': self.password_hash,
+            'grade': grade, 'course_type': course_type, 'school': school,
+            'faculty': self.random.choice(faculties) if faculties else '学部未定', 'plan_type': 'standard',
+            'target_exam_date': date.today() + timedelta(days=self.random.randint(30, 700)), 'is_admin': False,
+        })
+        return user_id
+
+    def _add_user_data(self, rows, user_id, admin_id):
+        user = rows[User][-1]
+        subjects = self.random.sample(self.subjects, self.random.randint(2, min(6, len(self.subjects))))
+        completed_book_ids = []
+        for subject in subjects:
+            rows[user_subjects_table].append({'user_id': user_id, 'subject_id': subject.id})
+            plan = self.plans.get((subject.id, user['course_type']))
+            if plan:
+                completed_book_ids += self._add_plan_state(rows, user_id, subject, plan, user['grade'])
+        rows[UserProgressBitmap].append({'user_id': user_id, 'bits': encode_bits(completed_book_ids)})
+        self._add_study_logs(rows, user_id, subjects)
+        self._add_mock_exams(rows, user_id, subjects)
+        if self.random.random() < self.inquiry_rate:
+            self._add_inquiry(rows, user_id, user['username'], admin_id)
+
+    def _add_plan_state(self, rows, user_id, subject, plan, grade):
+        """ルートの途中までを完了にし、選択肢のあるグループ・継続タスクの選択も作る"""
+        low, high = PROGRESS_RATIO[grade]
+        done_groups = int(len(plan.groups) * self.random.uniform(low, high))
+        completed = []
+        for group in plan.groups[:done_groups]:
+            step = self.random.choice(group.steps)
+            completed.append(step.book.id)
+            rows[Progress].append({'user_id': user_id, 'task_id': step.book.task_id, 'subject_id': subject.id,
+                                   'is_completed': 1})
+            if len(group.steps) > 1:
+                rows[UserSequentialTaskSelection].append(
+                    {'user_id': user_id, 'group_id': group.group_id, 'selected_task_id': step.book.task_id})
+        for (level, category), steps in plan.continuous.items():
+            if len(steps) > 1 and self.random.random() < 0.5:
+                rows[UserContinuousTaskSelection].append({
+                    'user_id': user_id, 'subject_id': subject.id, 'level': level, 'category': category,
+                    'selected_task_id': self.random.choice(steps).book.task_id})
+        return completed
+
+    def _add_study_logs(self, rows, user_id, subjects):
+        minutes_by_day = defaultdict(int)
+        today = date.today()
+        for days_ago in range(self.days):
+            if self.random.random() >= self.study_days_per_week / 7:
+                continue
+            day = today - timedelta(days=days_ago)
+            comment = 'がんばった' if self.random.random() < 0.2 else None
+            for subject in self.random.sample(subjects, self.random.randint(1, min(3, len(subjects)))):
+                minutes = self.random.choice((15, 30, 45, 60, 90, 120))
+                rows[StudyLog].append({'user_id': user_id, 'subject_id': subject.id, 'date': day,
+                                       'duration_minutes': minutes, 'comment': comment})
+                minutes_by_day[(day, subject.id)] += minutes
+        rows[StudyDailyRollup].extend({'user_id': user_id, 'date': day, 'subject_id': subject_id, 'minutes': minutes}
+                                      for (day, subject_id), minutes in minutes_by_day.items())
+
+    def _add_mock_exams(self, rows, user_id, subjects):
+        for _ in range(self.exams_per_user):
+            exam_id = self._take_id(MockExam)
+            provider = self.random.choice(PROVIDERS)
+            rows[MockExam].append({'id': exam_id, 'user_id': user_id, 'exam_name': f'{provider} 全国模試',
+                                   'exam_date': date.today() - timedelta(days=self.random.randint(0, self.days)),
+                                   'provider': provider})
+            for subject in subjects:
+                score = self.random.randint(20, 100)
+                rows[MockExamResult].append({'mock_exam_id': exam_id, 'subject_id': subject.id, 'score': score,
+                                             'max_score': 100, 'deviation': round(35 + score * 0.35, 1),
+                                             'ranking': RANKINGS[min(4, (100 - score) // 20)]})
+
+    def _add_inquiry(self, rows, user_id, username, admin_id):
+        inquiry_id = self._take_id(Inquiry)
+        created_at = datetime.utcnow() - timedelta(days=self.random.randint(0, self.days))
+        # 管理者がいなければ返信は作らない
+        replied = self.random.random() < 0.7 and admin_id is not None
+        rows[Inquiry].append({'id': inquiry_id, 'user_id': user_id, 'name': username, 'message': '参考書の進め方について質問です。',
+                              'created_at': created_at, 'is_resolved': replied})
+        if replied:
+            rows[Reply].append({'inquiry_id': inquiry_id, 'admin_id': admin_id, 'message': '回答です。',
+                                'created_at': created_at + timedelta(days=1), 'is_read': self.random.random() < 0.5})
+
+    def _take_id(self, model):
+        value = self.next_ids[model]
+        self.next_ids[model] += 1
+        return value
+
+    # --- 一括INSERT（外部キーの順に書き込む） ---
+    def _write(self, rows):
+        for target in (User, user_subjects_table, Progress, UserProgressBitmap, UserSequentialTaskSelection,
+                       UserContinuousTaskSelection, StudyLog, StudyDailyRollup, MockExam, MockExamResult,
+                       Inquiry, Reply):
+            if rows.get(target):
+                table = getattr(target, '__table__', target)
+                db.session.execute(table.insert(), rows[target])
+                self.row_counts[table.name] += len(rows[target])
+        db.session.commit()
+
+
+def _reset_sequences(models):
+    """id を指定してINSERTしたので、PostgreSQLの連番を最大値に合わせる（SQLiteでは不要）"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"))
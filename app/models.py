@@ -22,6 +22,8 @@ class User(db.Model, UserMixin):
     target_exam_date = db.Column(db.Date)
     learning_style = db.Column(db.String)
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
+    # 行や科目の選択を変更するたびに1つ進む（ワーカーごとのユーザーのキャッシュが古くないかの確認に使う）
+    identity_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     subjects = db.relationship('Subject', secondary=user_subjects_table, back_populates='users')
     
 class Subject(db.Model):
@@ -34,14 +36,14 @@ class University(db.Model):
     __tablename__ = 'universities'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True, nullable=False)
-    kana_name = db.Column(db.String, nullable=False)
+    kana_name = db.Column(db.String, nullable=False, index=True)
     level = db.Column(db.String, nullable=False)
     info_url = db.Column(db.String)
 
 class Faculty(db.Model):
     __tablename__ = 'faculties'
     id = db.Column(db.Integer, primary_key=True)
-    university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=False)
+    university_id = db.Column(db.Integer, db.ForeignKey('universities.id'), nullable=False, index=True)
     name = db.Column(db.String, nullable=False)
 
 class Book(db.Model):
@@ -64,6 +66,7 @@ class Route(db.Model):
 
 class RouteStep(db.Model):
     __tablename__ = 'route_steps'
+    __table_args__ = (db.Index('ix_route_steps_route_id_step_order', 'route_id', 'step_order'),)
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
@@ -74,12 +77,20 @@ class RouteStep(db.Model):
 
 class Progress(db.Model):
     __tablename__ = 'progress'
+    # 1ユーザー・1タスクにつき1行（ユーザーIDでの絞り込みにもこのインデックスが使われる）
+    __table_args__ = (db.UniqueConstraint('user_id', 'task_id', name='uq_progress_user_id_task_id'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     task_id = db.Column(db.String, nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     is_completed = db.Column(db.Integer, nullable=False)
 
+# 完了済みタスクを Book.id をビット位置とするビット列で保持する（1ユーザー1行）
+class UserProgressBitmap(db.Model):
+    __tablename__ = 'user_progress_bitmaps'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')
+
 class UserContinuousTaskSelection(db.Model):
     __tablename__ = 'user_continuous_task_selections'
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
@@ -96,6 +107,7 @@ class UserSequentialTaskSelection(db.Model):
 
 class StudyLog(db.Model):
     __tablename__ = 'study_logs'
+    __table_args__ = (db.Index('ix_study_logs_user_id_date', 'user_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
@@ -104,11 +116,31 @@ class StudyLog(db.Model):
     comment = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# 日毎・科目毎の学習時間の集計（StudyLogの追加・削除と同じトランザクションで更新する）
+class StudyDailyRollup(db.Model):
+    __tablename__ = 'study_daily_rollup'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), primary_key=True)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+
 class SubjectStrategy(db.Model):
     __tablename__ = 'subject_strategies'
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), primary_key=True)
     strategy_html = db.Column(db.String, nullable=False)
 
+# 参照データ（科目・大学・参考書・ルートなど）が更新されたことを全ワーカーに知らせるためのバージョン（1行だけ）
+class ReferenceDataVersion(db.Model):
+    __tablename__ = 'reference_data_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# シードデータ（科目・大学・参考書など）の内容のハッシュ。内容が変わったものだけを投入し直すために使う
+class SeedFingerprint(db.Model):
+    __tablename__ = 'seed_fingerprints'
+    source = db.Column(db.String(50), primary_key=True)
+    digest = db.Column(db.String(64), nullable=False)
+
 class Weakness(db.Model):
     __tablename__ = 'weaknesses'
     id = db.Column(db.Integer, primary_key=True)
@@ -122,6 +154,7 @@ class UserHiddenTask(db.Model):
     
 class MockExam(db.Model):
     __tablename__ = 'mock_exams'
+    __table_args__ = (db.Index('ix_mock_exams_user_id_exam_date', 'user_id', 'exam_date'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     exam_name = db.Column(db.String, nullable=False)
@@ -135,7 +168,7 @@ class MockExam(db.Model):
 class MockExamResult(db.Model):
     __tablename__ = 'mock_exam_results'
     id = db.Column(db.Integer, primary_key=True)
-    mock_exam_id = db.Column(db.Integer, db.ForeignKey('mock_exams.id'), nullable=False)
+    mock_exam_id = db.Column(db.Integer, db.ForeignKey('mock_exams.id'), nullable=False, index=True)
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     
     score = db.Column(db.Integer)       # 点数
@@ -148,20 +181,63 @@ class MockExamResult(db.Model):
     
 class OfficialMockExam(db.Model):
     __tablename__ = 'official_mock_exam'
+    # 公式ページから取得した模試をまとめて書き込む（UPSERT）ときの突き合わせに使う
+    __table_args__ = (db.UniqueConstraint('provider', 'name', 'exam_date', name='uq_official_mock_exam_provider_name_exam_date'),)
     id = db.Column(db.Integer, primary_key=True)
     provider = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(150), nullable=False)
-    exam_date = db.Column(db.Date, nullable=False)
+    exam_date = db.Column(db.Date, nullable=False, index=True)
     app_start_date = db.Column(db.Date, nullable=True) 
     app_end_date = db.Column(db.Date, nullable=True)
     url = db.Column(db.String(255), nullable=False)
     target_grade = db.Column(db.String(50), nullable=True)
     
+# 模試の公式ページの巡回状況（URLごとの ETag / Last-Modified / 本文のハッシュと、次に取得する時刻）
+class CrawlPage(db.Model):
+    __tablename__ = 'crawl_pages'
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    provider = db.Column(db.String(50), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'listing'（一覧ページ）か 'detail'（模試の詳細ページ）
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))
+    last_status = db.Column(db.Integer)
+    last_fetched_at = db.Column(db.DateTime)
+    next_fetch_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# バックグラウンドで実行する処理（スクレイピング・集計の作り直しなど）の実行待ち・進捗・結果（app/jobs.py）
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # 処理に渡す引数（JSON）
+    dedupe_key = db.Column(db.String(100), unique=True, nullable=True)  # 実行待ち・実行中の間だけ入れる（同じ処理を二重に積まない）
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / succeeded / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # この時刻以降に実行する（再試行の待ち）
+    locked_by = db.Column(db.String(100), nullable=True)  # 実行中のワーカー
+    locked_at = db.Column(db.DateTime, nullable=True)  # 実行中のワーカーが最後に進捗を書いた時刻
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # 成功したときの結果（JSON）
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # ワーカーが実行できるジョブを探すときに使う
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
 # お問い合わせを保存するためのモデル
 class Inquiry(db.Model):
     __tablename__ = 'inquiries'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True) # ▼▼▼ 追加 ▼▼▼
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True) # ▼▼▼ 追加 ▼▼▼
     name = db.Column(db.String(100), nullable=True) # ▼▼▼ nullable=True に変更 ▼▼▼
     email = db.Column(db.String(100), nullable=True) # ▼▼▼ nullable=True に変更 ▼▼▼
     message = db.Column(db.Text, nullable=False)
@@ -175,11 +251,11 @@ class Inquiry(db.Model):
 class Reply(db.Model):
     __tablename__ = 'replies'
     id = db.Column(db.Integer, primary_key=True)
-    inquiry_id = db.Column(db.Integer, db.ForeignKey('inquiries.id'), nullable=False)
+    inquiry_id = db.Column(db.Integer, db.ForeignKey('inquiries.id'), nullable=False, index=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_read = db.Column(db.Boolean, default=False, nullable=False)
+    is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
 
     # 関連するInquiryやUserオブジェクトを簡単に取得できるようにする
     inquiry = db.relationship('Inquiry', backref=db.backref('replies', lazy=True))
@@ -0,0 +1,114 @@
+# app/plan_cache.py
+# ルート計画（RouteStep ⋈ Book）はユーザーに依存しないため、一度だけ組み立てて参照データのキャッシュに載せる
+from collections import namedtuple, defaultdict
+from .extensions import db
+from .models import Book, Route, RouteStep
+from .reference_cache import cached
+
+# テンプレートからは Book と同じ属性名で参照できるようにしておく
+BookInfo = namedtuple('BookInfo', 'id task_id title description youtube_query duration_weeks task_type url')
+PlanStep = namedtuple('PlanStep', 'book step_order level category is_main')
+PlanGroup = namedtuple('PlanGroup', 'group_id steps step_by_task_id choices')
+TaskPlacement = namedtuple('TaskPlacement', 'book_id route_id subject_id level category')
+
+
+class CompiledPlan:
+    """1つのルートを、表示に必要な形に前処理したもの"""
+
+    def __init__(self, route, steps):
+        self.route_id = route.id
+        self.name = route.name
+        self.plan_type = route.plan_type
+        self.subject_id = route.subject_id
+        self.steps = steps
+        self.sequential = [s for s in steps if s.book.task_type == 'sequential']
+
+        # is_mainフラグでタスクをグループ化
+        self.groups = []
+        temp_group = []
+        for step in self.sequential:
+            if step.is_main == 1 and temp_group:
+                self.groups.append(self._make_group(temp_group))
+                temp_group = []
+            temp_group.append(step)
+        if temp_group: self.groups.append(self._make_group(temp_group))
+        self.group_by_id = {g.group_id: g for g in self.groups}
+
+        self.level_by_task_id = {}
+        for step in self.sequential:
+            self.level_by_task_id.setdefault(step.book.task_id, step.level)
+
+        # 継続タスクは (レベル, カテゴリ) で引けるようにする
+        self.continuous = defaultdict(list)
+        self.continuous_categories = []
+        self.continuous_choices_by_level = defaultdict(dict)
+        for step in steps:
+            if step.book.task_type != 'continuous': continue
+            self.continuous[(step.level, step.category)].append(step)
+            if step.category not in self.continuous_categories:
+                self.continuous_categories.append(step.category)
+            self.continuous_choices_by_level[step.level].setdefault(step.category, []).append(
+                {"id": step.book.task_id, "title": step.book.title})
+        self.continuous = dict(self.continuous)
+        self.continuous_choices_by_level = dict(self.continuous_choices_by_level)
+
+    @staticmethod
+    def _make_group(steps):
+        group_id = next((s.book.task_id for s in steps if s.is_main == 1), steps[0].book.task_id)
+        return PlanGroup(
+            group_id=group_id, steps=tuple(steps),
+            step_by_task_id={s.book.task_id: s for s in steps},
+            choices=tuple({"id": s.book.task_id, "title": s.book.title} for s in steps))
+
+
+class PlanCache:
+    """全ルートのコンパイル済み計画と参考書の一覧"""
+
+    def __init__(self):
+        books = db.session.query(Book).all()
+        self.books_by_task_id = {b.task_id: BookInfo(b.id, b.task_id, b.title, b.description, b.youtube_query,
+                                                     b.duration_weeks, b.task_type, b.url) for b in books}
+        books_by_id = {b.id: self.books_by_task_id[b.task_id] for b in books}
+        self.task_id_by_book_id = {b.id: b.task_id for b in books}
+
+        steps_by_route = defaultdict(list)
+        for step in db.session.query(RouteStep).order_by(RouteStep.step_order, RouteStep.id):
+            book = books_by_id.get(step.book_id)
+            if book:
+                steps_by_route[step.route_id].append(PlanStep(book, step.step_order, step.level, step.category, step.is_main))
+
+        self.plans_by_route_id = {}
+        self.plans_by_name = {}
+        self.standard_plan_by_subject_id = {}
+        # task_id から、その参考書が使われている全てのルート上の位置を引けるようにする
+        self.placements_by_task_id = defaultdict(list)
+        for route in db.session.query(Route).order_by(Route.id):
+            plan = CompiledPlan(route, steps_by_route.get(route.id, []))
+            self.plans_by_route_id[route.id] = plan
+            self.plans_by_name[route.name] = plan
+            if route.plan_type == 'standard':
+                self.standard_plan_by_subject_id.setdefault(route.subject_id, plan)
+            for step in plan.steps:
+                self.placements_by_task_id[step.book.task_id].append(
+                    TaskPlacement(step.book.id, route.id, route.subject_id, step.level, step.category))
+        self.placements_by_task_id = dict(self.placements_by_task_id)
+
+    def plan_for_subject(self, subject, user):
+        """ユーザーが使う科目のルートを返す（数学は文理でルートを切り替える）"""
+        route_name_map = {'数学': 'math_rikei_standard' if user.course_type == 'science' else 'math_bunkei_standard'}
+        route_name = route_name_map.get(subject.name)
+        if route_name:
+            return self.plans_by_name.get(route_name)
+        return self.standard_plan_by_subject_id.get(subject.id)
+
+    def find_placement(self, task_id, subject_ids, level=None, category=None):
+        """ユーザーの科目の中から task_id の位置を探す。レベル・カテゴリが一致するものを優先する"""
+        candidates = [p for p in self.placements_by_task_id.get(task_id, []) if p.subject_id in subject_ids]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda p: (p.level == level and p.category == category, p.level == level))
+
+
+def get_plan_cache():
+    """コンパイル済みのルート計画を返す。参照データのバージョンが変わったら作り直される"""
+    return cached('plan', PlanCache)
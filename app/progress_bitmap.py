@@ -0,0 +1,86 @@
+# app/progress_bitmap.py
+# 完了済みタスクをユーザーごとのビット列（Book.id がビット位置）で読み書きする。
+# 移行期間中は progress テーブルにも書き込み続け、ビット列がまだ無いユーザーは progress から読む。
+from .extensions import db
+from .models import Progress, UserProgressBitmap
+from .plan_cache import get_plan_cache
+from .upsert import upsert_rows
+
+
+def encode_bits(book_ids):
+    book_ids = list(book_ids)
+    bits = bytearray((max(book_ids) >> 3) + 1 if book_ids else 0)
+    for book_id in book_ids:
+        bits[book_id >> 3] |= 1 << (book_id & 7)
+    return bytes(bits)
+
+
+def decode_bits(bits):
+    return {(index << 3) + bit for index, byte in enumerate(bits) if byte
+            for bit in range(8) if byte & (1 << bit)}
+
+
+def load_completed_task_ids(user_id):
+    """完了済みの task_id の集合を返す（ビット列があれば1行の取得だけで済む）"""
+    row = db.session.get(UserProgressBitmap, user_id)
+    if row is None:
+        return {p.task_id for p in db.session.query(Progress.task_id).filter_by(user_id=user_id, is_completed=1)}
+    task_id_by_book_id = get_plan_cache().task_id_by_book_id
+    return {task_id_by_book_id[book_id] for book_id in decode_bits(row.bits) if book_id in task_id_by_book_id}
+
+
+def _bits_from_progress(user_id):
+    book_id_by_task_id = {b.task_id: b.id for b in get_plan_cache().books_by_task_id.values()}
+    completed = {p.task_id for p in db.session.query(Progress.task_id).filter_by(user_id=user_id, is_completed=1)}
+    return encode_bits(book_id_by_task_id[t] for t in completed if t in book_id_by_task_id)
+
+
+def rebuild_progress_bitmap(user_id):
+    """progress テーブルの内容からビット列を作り直す。コミットは呼び出し側で行う"""
+    bits = _bits_from_progress(user_id)
+    row = db.session.get(UserProgressBitmap, user_id)
+    if row is None:
+        row = UserProgressBitmap(user_id=user_id, bits=bits)
+        db.session.add(row)
+    else:
+        row.bits = bits
+    return row
+
+
+def set_tasks_completed(user_id, states):
+    """{task_id: 完了かどうか} に従ってビットを立てる・下ろす。コミットは呼び出し側で行う"""
+    def locked_row():
+        return db.session.query(UserProgressBitmap).filter_by(user_id=user_id)\
+            .with_for_update().populate_existing().one_or_none()
+
+    row = locked_row()
+    if row is None:
+        # 初回はprogressから作る（その時点でprogressには今回の変更も書き込み済み）。
+        # 同じユーザーの初回の書き込みが同時に来ても主キーが重複しないよう、行が既にあれば何もしないINSERTにし、
+        # どちらが作った行でもロックしてから今回の変更を当てる
+        upsert_rows(UserProgressBitmap, [{'user_id': user_id, 'bits': _bits_from_progress(user_id)}],
+                    index_elements=['user_id'], update_columns=[])
+        row = locked_row()
+
+    books_by_task_id = get_plan_cache().books_by_task_id
+    bits = bytearray(row.bits)
+    for task_id, completed in states.items():
+        book = books_by_task_id.get(task_id)
+        if not book: continue
+        index, mask = book.id >> 3, 1 << (book.id & 7)
+        if completed:
+            if index >= len(bits): bits.extend(b'\0' * (index + 1 - len(bits)))
+            bits[index] |= mask
+        elif index < len(bits):
+            bits[index] &= ~mask
+    row.bits = bytes(bits)
+    return row
+
+
+def backfill_progress_bitmaps():
+    """progress に記録がある全ユーザーのビット列を作り直す。処理したユーザー数を返す"""
+    user_ids = [row.user_id for row in db.session.query(Progress.user_id).distinct()]
+    for user_id in user_ids:
+        rebuild_progress_bitmap(user_id)
+    db.session.commit()
+    return len(user_ids)
@@ -0,0 +1,181 @@
+# app/reference_cache.py
+# 科目・大学・参考書・ルート・科目別の攻略法など、ほとんど変わらない参照データのプロセス内キャッシュ。
+# 参照データを変更したトランザクションは reference_data_version の値を1つ進め、
+# 各ワーカーはリクエストごとに最初の参照時にその値を確認して、変わっていればキャッシュを捨てる。
+import threading
+from collections import namedtuple
+from cachetools import LRUCache
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import ReferenceDataVersion, Subject, University, Faculty, Book, Route, RouteStep, SubjectStrategy
+
+# テンプレートからは各モデルと同じ属性名で参照できるようにしておく
+SubjectInfo = namedtuple('SubjectInfo', 'id name')
+UniversityInfo = namedtuple('UniversityInfo', 'id name kana_name level info_url')
+
+# これらのモデルが変更されたらバージョンを進める
+REFERENCE_MODELS = (Subject, University, Faculty, Book, Route, RouteStep, SubjectStrategy)
+
+_CACHE_KEY = 'reference_cache'
+_VERSION_ROW_ID = 1
+_CHECKED_ENVIRON_KEY = 'univ_app.reference_version_checked'
+_init_lock = threading.Lock()
+
+
+class ReferenceCache:
+    """バージョン付きのキャッシュ本体。ヒット・ミス・破棄の回数を数えておく"""
+
+    def __init__(self, maxsize=64):
+        self._data = LRUCache(maxsize=maxsize)
+        self._lock = threading.RLock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, loader):
+        """key の値を返す。無ければ loader() で作って保存する"""
+        self._sync_version()
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            # 同じ値を複数のスレッドが同時に作らないよう、作成中もロックを持ったままにする
+            value = loader()
+            self._data[key] = value
+            return value
+
+    def current_version(self):
+        """DBのバージョンと同期したうえで、現在のバージョンを返す（キャッシュ外の派生データの鮮度確認用）"""
+        self._sync_version()
+        return self.version
+
+    def clear(self, version=None):
+        """値を捨てる。version を省略したときはバージョンをそのまま残し（None にはしない）、次の確認でDBの値に合わせる"""
+        with self._lock:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            if version is not None:
+                self.version = version
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+    def _sync_version(self):
+        # リクエスト中は最初の1回だけバージョンを確認する
+        if has_request_context():
+            if request.environ.get(_CHECKED_ENVIRON_KEY):
+                return
+            request.environ[_CHECKED_ENVIRON_KEY] = True
+        version = current_reference_version()
+        with self._lock:
+            if version != self.version:
+                self.clear(version)
+
+
+def current_reference_version():
+    return db.session.query(ReferenceDataVersion.version).filter_by(id=_VERSION_ROW_ID).scalar() or 0
+
+
+def get_reference_cache():
+    cache = current_app.extensions.get(_CACHE_KEY)
+    if cache is None:
+        with _init_lock:
+            cache = current_app.extensions.setdefault(_CACHE_KEY, ReferenceCache())
+    return cache
+
+
+def cached(key, loader):
+    return get_reference_cache().get(key, loader)
+
+
+def reference_cache_stats():
+    cache = get_reference_cache()
+    cache._sync_version()
+    return cache.stats()
+
+
+# --- 参照データの取得 ---
+def all_subjects():
+    """全科目を id 順に返す"""
+    return cached('subjects', lambda: tuple(
+        SubjectInfo(s.id, s.name) for s in db.session.query(Subject).order_by(Subject.id)))
+
+
+def subject_by_name(name):
+    subjects_by_name = cached('subjects_by_name', lambda: {s.name: s for s in all_subjects()})
+    return subjects_by_name.get(name)
+
+
+def university_by_name(name):
+    universities_by_name = cached('universities_by_name', lambda: {
+        u.name: UniversityInfo(u.id, u.name, u.kana_name, u.level, u.info_url) for u in db.session.query(University)})
+    return universities_by_name.get(name)
+
+
+def faculty_names_for(university_id):
+    """大学の学部名を id 順に返す（全大学分を1回のクエリでまとめて読み込んでおく）"""
+    def load():
+        faculties = {}
+        for university_id_, name in db.session.query(Faculty.university_id, Faculty.name).order_by(Faculty.id):
+            faculties.setdefault(university_id_, []).append(name)
+        return {key: tuple(names) for key, names in faculties.items()}
+    return cached('faculties_by_university_id', load).get(university_id, ())
+
+
+def strategy_html_for(subject_id):
+    strategies = cached('strategies', lambda: {
+        s.subject_id: s.strategy_html for s in db.session.query(SubjectStrategy)})
+    return strategies.get(subject_id)
+
+
+# --- 参照データが変更されたら、同じトランザクションでバージョンを進める ---
+def bump_reference_version(connection=None):
+    """バージョンを1つ進める。一括INSERTなどORMのflushを通らない更新の後に呼ぶ"""
+    if connection is None:
+        # コミットしたら、このワーカーの値もすぐに捨てる
+        db.session.info['reference_data_changed'] = True
+        connection = db.session.connection()
+    table = ReferenceDataVersion.__table__
+    result = connection.execute(table.update().where(table.c.id == _VERSION_ROW_ID)
+                                .values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=_VERSION_ROW_ID, version=1))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_reference_change(session, flush_context):
+    if session.info.get('reference_data_changed'):
+        return
+    # 科目はユーザーの科目選択（多対多）でも dirty になるので、自身の列が変わったものだけを見る
+    changed = list(session.new) + list(session.deleted) + \
+        [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for obj in changed:
+        if isinstance(obj, REFERENCE_MODELS):
+            bump_reference_version(session.connection())
+            session.info['reference_data_changed'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # 自分のワーカーはすぐに捨てる（他のワーカーは次のリクエストでバージョンの変化に気づく）
+    if session.info.pop('reference_data_changed', False) and has_app_context():
+        cache = current_app.extensions.get(_CACHE_KEY)
+        if cache is not None:
+            cache.clear()
+        if has_request_context():
+            request.environ.pop(_CHECKED_ENVIRON_KEY, None)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('reference_data_changed', None)
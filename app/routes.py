@@ -841,90 +841,7 @@ def delete_exam(exam_id):
     db.session.commit()
     return redirect(url_for('main.admin_exams'))
 
-# app/routes.py
-
-# ... (既存のimport文) ...
-import requests
-from bs4 import BeautifulSoup
-import os
-import google.generativeai as genai
-import json
-import re
-from datetime import date, datetime
-from urllib.parse import urljoin
-import ssl
-from requests.adapters import HTTPAdapter
-from urllib3 import PoolManager
-from urllib3.util.ssl_ import create_urllib3_context
-
-# --- 共通ヘルパー (変更なし) ---
-class LegacySSLAdapter(HTTPAdapter):
-    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
-        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-        ssl_context.options |= getattr(ssl, "OP_LEGACY_SERVER_CONNECT", 0x4)
-        self.poolmanager = PoolManager(
-            ssl_context=ssl_context, num_pools=connections, maxsize=maxsize,
-            block=block, **pool_kwargs)
-
-def _get_legacy_session():
-    """古いSSLリネゴシエーションを許可するrequests.Sessionオブジェクトを作成する"""
-    session = requests.Session()
-    session.mount("https://", LegacySSLAdapter())
-    return session
-# --- AIの役割定義 (思考ルーチンを強化) ---
-
-def _is_link_a_mock_exam(link_text: str, link_url: str) -> bool:
-    """【鑑定士AI - 強化版】与えられたリンクが模試詳細ページらしいか、より厳しく判定する"""
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"""
-        以下のHTMLリンクは、特定の大学受験模試（例：「第1回全統共通テスト模試」）の詳細・申込ページへのリンクですか？
-        一般的な案内ページ（例：「模試一覧」「お申し込み方法」）や、模試と無関係なページは「いいえ」と判断してください。
-        「はい」か「いいえ」だけで答えてください。
-        リンクテキスト: "{link_text}"
-        リンクURL: "{link_url}"
-        """
-        response = model.generate_content(prompt, request_options={'timeout': 20})
-        return "はい" in response.text
-    except Exception:
-        return False
-
-def _extract_exam_details_with_ai(url: str, provider: str):
-    """【書記AI - 強化版】詳細ページから文脈を読んで模試の情報をJSONで抽出する"""
-    session = requests.Session()
-    session.mount("https://", LegacySSLAdapter())
-    response = session.get(url, timeout=15)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser')
-    page_text = ' '.join(soup.get_text().split())[:8000]
-
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    today = date.today().isoformat()
-    prompt = f"""
-    あなたはWebページから日本の大学受験模試の情報を抽出するエキスパートです。今日の日付は{today}です。
-    以下のテキストから、以下の項目を抽出してください。
-    - name: 模試の正式名称。「{provider}」という単語は含めないでください。
-    - target_grade: 対象学年（例：「高3・卒」）。
-    - exam_date: 実施日。
-    - app_start_date: 申込開始日。
-    - app_end_date: 申込締切日。
-    
-    重要：
-    - 日付は必ず「YYYY-MM-DD」形式にしてください。
-    - 実施日は、今日以降の最も可能性の高い日付を選んでください。
-    - 申込開始日と締切日は、「申込期間」などのキーワードの近くにある日付を優先してください。
-    - 情報が見つからない項目はnullにしてください。
-    - 結果は必ずJSON形式 {{"name": ..., "exam_date": ...}} で返してください。
-
-    テキスト：
-    {page_text}
-    """
-    
-    ai_response = model.generate_content(prompt, request_options={'timeout': 40})
-    json_text_match = re.search(r'```json\s*(\{.*?\})\s*```', ai_response.text, re.DOTALL)
-    if not json_text_match:
-        raise ValueError("AI did not return a valid JSON block.")
-    return json.loads(json_text_match.group(1))
+# 模試ページの取得・AIによる抽出の処理は app/exam_scraper.py に移した
 
 
 @bp.route('/admin/universities')
@@ -1,13 +1,19 @@
 # app/routes/admin.py
 from datetime import date
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
 from ..extensions import db
-from ..models import OfficialMockExam, University, Faculty, User, Inquiry, FAQ, Reply
+from ..models import OfficialMockExam, University, Faculty, User, Inquiry, FAQ, Reply, Job
+from ..reference_cache import reference_cache_stats
+from ..crawl_frontier import PROVIDER_LISTING_URLS
+from ..jobs import enqueue, job_status
+from ..identity_cache import identity_cache_stats
+from ..structured_logging import get_logger
 
 # 'admin'という名前で、URLの接頭辞が/adminのブループリントを作成
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+logger = get_logger('admin')
 
 # 管理者確認用のデコレータ
 def admin_required(f):
@@ -18,6 +24,14 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 管理者による作成・編集・削除を記録する
+@admin_bp.after_request
+def _log_admin_change(response):
+    if request.method == 'POST' and current_user.is_authenticated:
+        logger.info('admin change', extra={'endpoint': request.endpoint, 'view_args': request.view_args,
+                                           'status': response.status_code, 'admin_id': current_user.id})
+    return response
+
 # ここに、管理者関連の関数を全て移動してきます
 # --- 管理者専用ルート ---
 
@@ -26,7 +40,28 @@ def admin_required(f):
 @admin_required
 def admin_exams():
     exams = db.session.query(OfficialMockExam).order_by(OfficialMockExam.exam_date.desc()).all()
-    return render_template('admin/admin_exams.html', exams=exams, user=current_user)
+    refresh_job = db.session.query(Job).filter_by(kind='refresh_official_exams').order_by(Job.id.desc()).first()
+    return render_template('admin/admin_exams.html', exams=exams, user=current_user,
+                           refresh_job=job_status(refresh_job) if refresh_job else None)
+
+# 公式ページからの更新は数分かかるので、ジョブとして積んでワーカー（flask run-jobs）に任せる
+@admin_bp.route('/admin/exams/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_exams():
+    job = enqueue('refresh_official_exams', dedupe_key='refresh_official_exams')
+    flash('公式ページからの更新を受け付けました。完了するとこのページが更新されます。')
+    return redirect(url_for('admin.admin_exams', job=job.id))
+
+# ジョブの進捗（管理画面からポーリングする）
+@admin_bp.route('/admin/jobs/<int:job_id>')
+@login_required
+@admin_required
+def job_detail(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_status(job))
 
 @admin_bp.route('/admin/exams/new', methods=['GET', 'POST'])
 @login_required
@@ -50,15 +85,10 @@ def new_exam():
     provider = request.args.get('provider')
     exam_template = None
     if provider:
-        provider_urls = {
-            '河合塾': 'https://www.kawai-juku.ac.jp/moshi/',
-            '駿台': 'https://www.sundai.ac.jp/moshi/',
-            '東進': 'https://www.toshin-moshi.com/'
-        }
         exam_template = OfficialMockExam(
             provider=provider,
             name=f"【{provider}】第X回 〇〇模試",
-            url=provider_urls.get(provider, '')
+            url=PROVIDER_LISTING_URLS.get(provider, '')
         )
     return render_template('admin/admin_exam_form.html', user=current_user, exam=exam_template)
 
@@ -288,6 +318,13 @@ def delete_faq(faq_id):
     flash('FAQを削除しました。')
     return redirect(url_for('admin.admin_faqs'))
 
+# 参照データ・ログインユーザーのキャッシュのヒット・ミス数（監視用）
+@admin_bp.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(dict(reference_cache_stats(), identity=identity_cache_stats()))
+
 @admin_bp.route('/admin')
 @login_required
 @admin_required
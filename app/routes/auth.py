@@ -5,10 +5,13 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.datastructures import MultiDict
 from flask_login import login_user, logout_user
 from ..extensions import db
-from ..models import User, Subject 
+from ..models import User, Subject
+from ..reference_cache import get_reference_cache, all_subjects
+from ..structured_logging import get_logger
 
 # 'auth'という名前のブループリントを作成
 auth_bp = Blueprint('auth', __name__)
+logger = get_logger('auth')
 
 # ここに、register, login, logout関数を移動してきます
 
@@ -49,18 +52,17 @@ def register():
             db.session.add(new_user)
             db.session.commit()
 
-            subject_ids = form_data.getlist('subjects')
-            for subject_id_str in subject_ids:
-                subject = db.session.query(Subject).get(int(subject_id_str))
-                if subject:
-                    new_user.subjects.append(subject)
+            subject_ids = {int(sid) for sid in form_data.getlist('subjects')} & {s.id for s in all_subjects()}
+            if subject_ids:
+                new_user.subjects = db.session.query(Subject).filter(Subject.id.in_(subject_ids)).all()
             
             db.session.commit()
+            logger.info('user registered', extra={'user_id': new_user.id})
             login_user(new_user)
             return redirect(url_for('main.dashboard', user_id=new_user.id))
 
-    subjects = db.session.query(Subject).order_by(Subject.id).all()
-    return render_template('register.html', subjects=subjects, error=error_message, form_data=form_data)
+    return render_template('register.html', subjects=all_subjects(), error=error_message, form_data=form_data,
+                           reference_version=get_reference_cache().current_version())
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -74,6 +76,7 @@ def login():
         if user and check_password_hash(user.password_hash, password):
             # ▼▼▼ 2. sessionの操作を login_user(user) に置き換える ▼▼▼
             login_user(user) 
+            logger.info('login succeeded', extra={'user_id': user.id})
             
             # ログイン後にリダイレクトすべきページがあれば、そちらにリダイレクト
             next_page = request.args.get('next')
@@ -81,6 +84,8 @@ def login():
                 return redirect(next_page)
             return redirect(url_for('main.dashboard', user_id=user.id))
         else:
+            # 入力されたユーザー名は個人情報になりうるので残さない（リクエストIDで追える）
+            logger.info('login failed')
             error_message = "ユーザー名またはパスワードが正しくありません。"
     return render_template('login.html', error=error_message)
 
@@ -1,17 +1,28 @@
 # app/routes/main.py
 import calendar 
-from datetime import date, datetime, timedelta
+from datetime import date, timedelta
 from werkzeug.security import check_password_hash, generate_password_hash
-from collections import defaultdict
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session, flash, abort
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload, contains_eager
 # ... 他に必要なものをインポート ...
 from ..extensions import db
-from ..models import (User, Subject, University, Faculty, Book, Route, RouteStep, 
+from ..dashboard_loader import load_dashboard_snapshot
+from ..plan_cache import get_plan_cache
+from ..reference_cache import get_reference_cache, all_subjects, subject_by_name, university_by_name, faculty_names_for
+from ..university_search import search_universities
+from ..study_rollup import add_study_minutes
+from ..study_history import load_log_page, load_month_logs
+from ..heatmap import heatmap_payload, MAX_RANGE_DAYS
+from ..upsert import upsert_rows
+from ..structured_logging import get_logger
+from ..progress_bitmap import load_completed_task_ids, set_tasks_completed, rebuild_progress_bitmap
+from ..models import (User, Subject, 
                        Progress, UserContinuousTaskSelection, UserSequentialTaskSelection, 
-                       StudyLog, Reply, Inquiry, MockExam, OfficialMockExam, FAQ, MockExamResult)
+                       StudyLog, StudyDailyRollup, Reply, Inquiry, MockExam, OfficialMockExam, FAQ, MockExamResult)
 
 main_bp = Blueprint('main', __name__)
+logger = get_logger('main')
 
 results_data = {
     'A': {
@@ -75,59 +86,41 @@ def show_plan(user_id):
 def get_plan_data(user_id, subject_name):
     if user_id != current_user.id: abort(403)
     
-    subject = db.session.query(Subject).filter_by(name=subject_name).first()
+    subject = subject_by_name(subject_name)
     if not subject: return jsonify({})
 
-    route = db.session.query(Route).filter_by(subject_id=subject.id, plan_type='standard').first()
-    if not route: return jsonify({})
+    plan = get_plan_cache().plan_for_subject(subject, current_user)
+    if not plan: return jsonify({})
 
-    # --- 1. 必要なデータを全て取得 ---
-    all_steps_raw = db.session.query(RouteStep, Book).join(Book, RouteStep.book_id == Book.id).filter(RouteStep.route_id == route.id).order_by(RouteStep.step_order).all()
-    
-    # ユーザーの全ての選択状況を取得
+    # --- 1. ユーザーの選択状況と進捗を取得（ルート計画はキャッシュ済み） ---
     seq_selections = {sel.group_id: sel.selected_task_id for sel in db.session.query(UserSequentialTaskSelection).filter_by(user_id=user_id).all()}
     cont_selections_raw = db.session.query(UserContinuousTaskSelection).filter_by(user_id=user_id, subject_id=subject.id).all()
     
-    completed_tasks_set = {p.task_id for p in db.session.query(Progress).filter_by(user_id=user_id, is_completed=1).all()}
+    completed_tasks_set = load_completed_task_ids(user_id)
 
     # --- 2. ルートタスク(sequential)を処理し、表示するノードを決定 ---
     nodes_to_render, sequential_links_base = [], []
-    
-    sequential_steps_raw = [(s, b) for s, b in all_steps_raw if b.task_type == 'sequential']
-    
-    # is_mainフラグでタスクをグループ化
-    task_groups = []
-    if sequential_steps_raw:
-        temp_group = []
-        for step, book in sequential_steps_raw:
-            if step.is_main == 1 and temp_group:
-                task_groups.append(temp_group)
-                temp_group = []
-            temp_group.append((step, book))
-        if temp_group: task_groups.append(temp_group)
-
-    # 各グループを処理して表示ノードを決定
-    for group in task_groups:
-        group_id = next((b.task_id for s, b in group if s.is_main == 1), group[0][1].task_id)
-        user_selected_task_id = seq_selections.get(group_id)
+    for group in plan.groups:
+        user_selected_task_id = seq_selections.get(group.group_id)
 
         node_to_add = None
         if user_selected_task_id:
-            step, book = next(((s, b) for s, b in group if b.task_id == user_selected_task_id), (None, None))
-            if book:
-                node_to_add = {"id": book.task_id, "title": book.title, "description": book.description, "youtube_query": book.youtube_query, "level": step.level, "category": step.category, "completed": book.task_id in completed_tasks_set, "is_placeholder": False}
-        elif len(group) == 1:
-            step, book = group[0]
-            node_to_add = {"id": book.task_id, "title": book.title, "description": book.description, "youtube_query": book.youtube_query, "level": step.level, "category": step.category, "completed": book.task_id in completed_tasks_set, "is_placeholder": False}
+            step = group.step_by_task_id.get(user_selected_task_id)
+        elif len(group.steps) == 1:
+            step = group.steps[0]
         else:
-            step, _ = group[0]
+            step = None
+            first_step = group.steps[0]
             node_to_add = {
-                "id": f"placeholder_seq_{group_id}", "title": f"【{step.category}】を選択", "description": "クリックして使用する参考書を選択してください。",
-                "level": step.level, "category": step.category, "completed": False, 
+                "id": f"placeholder_seq_{group.group_id}", "title": f"【{first_step.category}】を選択", "description": "クリックして使用する参考書を選択してください。",
+                "level": first_step.level, "category": first_step.category, "completed": False, 
                 "is_placeholder": True, "placeholder_type": "sequential",
-                "group_id": group_id,
-                "choices": [{"id": b.task_id, "title": b.title} for s, b in group]
+                "group_id": group.group_id,
+                "choices": list(group.choices)
             }
+        if step:
+            book = step.book
+            node_to_add = {"id": book.task_id, "title": book.title, "description": book.description, "youtube_query": book.youtube_query, "level": step.level, "category": step.category, "completed": book.task_id in completed_tasks_set, "is_placeholder": False}
         
         if node_to_add:
             nodes_to_render.append(node_to_add)
@@ -144,47 +137,15 @@ def get_plan_data(user_id, subject_name):
     elif nodes_to_render:
         current_level = nodes_to_render[-1]['level']
 
-    continuous_steps = [(s, b) for s, b in all_steps_raw if b.task_type == 'continuous']
-    available_choices = defaultdict(list)
-    for step, book in continuous_steps:
-        if step.level == current_level:
-            available_choices[step.category].append({"id": book.task_id, "title": book.title})
-            
     return jsonify({
         "graph_data": {"nodes": nodes_to_render, "links": graph_links},
         "continuous_data": {
             "current_level": current_level,
             "current_selections": {sel.category: sel.selected_task_id for sel in cont_selections_raw if sel.level == current_level},
-            "available_choices": dict(available_choices)
+            "available_choices": plan.continuous_choices_by_level.get(current_level, {})
         }
     })
     
-# app/routes.py
-
-# 学年と志望校レベルに応じた、中間目標の基準日（月-日）
-BENCHMARK_SCHEDULES = {
-    # 高校3年生向けのスケジュール
-    'high3': {
-        '早慶': {
-            '日東駒専': '07-31', # 7月末
-            'MARCH': '10-31',   # 10月末
-        },
-        'MARCH': {
-            '日東駒専': '09-30', # 9月末
-        }
-    },
-    # 浪人生向けの、より前倒しのスケジュール
-    'ronin': {
-        '早慶': {
-            '日東駒専': '06-30', # 6月末
-            'MARCH': '09-30',   # 9月末
-        },
-        'MARCH': {
-            '日東駒専': '08-31', # 8月末
-        }
-    }
-}    
-    
 @main_bp.route('/dashboard/<int:user_id>')
 @login_required
 def dashboard(user_id):
@@ -193,144 +154,16 @@ def dashboard(user_id):
     user = current_user
 
     # --- 1. 基本情報をDBから取得 ---
-    university = db.session.query(University).filter_by(name=user.school).first()
+    university = university_by_name(user.school)
     target_level_name = university.level if university else None
     
-    completed_tasks_set = {p.task_id for p in db.session.query(Progress).filter_by(user_id=user_id, is_completed=1).all()}
-    seq_selections = {row.group_id: row.selected_task_id for row in db.session.query(UserSequentialTaskSelection).filter_by(user_id=user_id).all()}
-    cont_selections_rows = db.session.query(UserContinuousTaskSelection).filter(UserContinuousTaskSelection.user_id == user_id).all()
-    cont_selections = {(s.subject_id, s.level, s.category): s.selected_task_id for s in cont_selections_rows}
-    
-    unread_replies = db.session.query(Reply).join(Inquiry).filter(Inquiry.user_id == user_id, Reply.is_read == False).order_by(Reply.created_at.desc()).all()
+    unread_replies = db.session.query(Reply).join(Inquiry).options(contains_eager(Reply.inquiry)).filter(Inquiry.user_id == user_id, Reply.is_read == False).order_by(Reply.created_at.desc()).all()
     upcoming_exams = db.session.query(OfficialMockExam).filter(OfficialMockExam.exam_date >= date.today()).order_by(OfficialMockExam.exam_date.asc()).limit(5).all()
 
     days_until_exam = (user.target_exam_date - date.today()).days if user.target_exam_date else "未設定"
-    level_hierarchy = { '基礎徹底レベル': 0, '高校入門レベル': 0, '日東駒専レベル': 1, '産近甲龍': 1, 'MARCHレベル': 2, '関関同立': 2, '早慶レベル': 3, '早稲田レベル': 3, '難関国公立・東大・早慶レベル': 3, '特殊形式': 98 }
-    target_level_value = level_hierarchy.get(target_level_name, 99)
-
-    # --- 2. 各科目のダッシュボード用データを作成 ---
-    dashboard_data = []
-    for subject in user.subjects:
-        # --- 2a. 科目ごとの基本情報を初期化 ---
-        subject.next_task = None
-        subject.continuous_tasks = []
-        subject.progress = 0
-        subject.last_completed_task = None
-        subject.pending_selections = []
-        subject.benchmark = None
-        
-        # ▼▼▼▼▼ このデバッグブロックを追加 ▼▼▼▼▼
-        print(f"\n--- 🕵️‍♂️ デバッグ開始: 科目「{subject.name}」---")
-        print(f"1. ユーザーの学年 (user.grade): '{user.grade}'")
-        print(f"2. 志望校レベル (target_level_name): '{target_level_name}'")
-        print(f"3. ルールブックに学年 '{user.grade}' は存在しますか？ -> {user.grade in BENCHMARK_SCHEDULES}")
-        if user.grade in BENCHMARK_SCHEDULES:
-            print(f"4. 学年ルールブックにレベル '{target_level_name}' は存在しますか？ -> {target_level_name in BENCHMARK_SCHEDULES.get(user.grade, {})}")
-        else:
-            print(f"4. 学年ルールブックが存在しないため、レベルをチェックできません。")
-        print(f"--- デバッグ終了 ---\n")
-        # ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
-        
-        # --- 2b. 科目ごとのルート計画を取得 ---
-        base_query = db.session.query(Book, RouteStep).join(RouteStep, Book.id == RouteStep.book_id).join(Route, RouteStep.route_id == Route.id)
-        route_name_map = {'数学': 'math_rikei_standard' if user.course_type == 'science' else 'math_bunkei_standard'}
-        route_name = route_name_map.get(subject.name)
-        if route_name:
-            full_plan_rows = base_query.filter(Route.name == route_name).order_by(RouteStep.step_order).all()
-        else:
-            full_plan_rows = base_query.filter(Route.plan_type == 'standard', Route.subject_id == subject.id).order_by(RouteStep.step_order).all()
 
-        full_plan = [{'book': b, 'step': s} for b, s in full_plan_rows]
-        
-        sequential_plan = sorted([task for task in full_plan if task['book'].task_type == 'sequential'], key=lambda x: x['step'].step_order)
-        
-        task_groups = []
-        if sequential_plan:
-            temp_group = []
-            for task in sequential_plan:
-                if task['step'].is_main == 1 and temp_group:
-                    task_groups.append(temp_group)
-                    temp_group = []
-                temp_group.append(task)
-            if temp_group: task_groups.append(temp_group)
-
-        # --- 2c. 「次のタスク」と「最後に完了したタスク」を決定 ---
-        completed_task_ids_in_plan = []
-        uncompleted_groups = []
-        for group in task_groups:
-            group_id = next((t['book'].task_id for t in group if t['step'].is_main), group[0]['book'].task_id)
-            actual_task_id = seq_selections.get(group_id, group_id)
-            if actual_task_id in completed_tasks_set:
-                completed_task_ids_in_plan.append(actual_task_id)
-            else:
-                uncompleted_groups.append(group)
-
-        if uncompleted_groups:
-            # --- 未完了タスクがある場合の処理 ---
-            next_group = uncompleted_groups[0]
-            group_id = next((t['book'].task_id for t in next_group if t['step'].is_main), next_group[0]['book'].task_id)
-            
-            if len(next_group) > 1 and group_id not in seq_selections:
-                subject.next_task = {'is_choice_pending': True, 'title': f"『{next_group[0]['step'].category}』を選択", 'subject_name': subject.name, 'level': next_group[0]['step'].level}
-            else:
-                selected_task_id = seq_selections.get(group_id, group_id)
-                subject.next_task = db.session.query(Book).filter_by(task_id=selected_task_id).first()
-
-            user_schedule = BENCHMARK_SCHEDULES.get(user.grade, {}).get(target_level_name, {})
-            if user_schedule:
-                next_benchmark_level = None
-                # uncompleted_groups[0] (つまり next_group) を使う
-                for task in next_group:
-                    level_from_db = task['step'].level
-                    lookup_key = level_from_db.replace('レベル', '')
-                    if lookup_key in user_schedule:
-                        next_benchmark_level = level_from_db
-                        break
-                
-                if next_benchmark_level:
-                    lookup_key = next_benchmark_level.replace('レベル', '')
-                    deadline_str = user_schedule[lookup_key]
-                    deadline_date = datetime.strptime(f"{date.today().year}-{deadline_str}", "%Y-%m-%d").date()
-                    subject.benchmark = {'level_name': next_benchmark_level, 'deadline': deadline_date.strftime('%-m月%-d日'), 'days_remaining': (deadline_date - date.today()).days}
-
-        if completed_task_ids_in_plan:
-            subject.last_completed_task = db.session.query(Book).filter_by(task_id=completed_task_ids_in_plan[-1]).first()
-
-
-        # --- 2e. 「継続タスク」と「現在のレベル」と「進捗率」を決定 ---
-        current_level = None
-        if subject.next_task and isinstance(subject.next_task, Book):
-            task_info = next((t for t in sequential_plan if t['book'].task_id == subject.next_task.task_id), None)
-            if task_info: current_level = task_info['step'].level
-        elif subject.last_completed_task:
-            task_info = next((t for t in sequential_plan if t['book'].task_id == subject.last_completed_task.task_id), None)
-            if task_info: current_level = task_info['step'].level
-        elif sequential_plan:
-            current_level = sequential_plan[0]['step'].level
-
-        if current_level:
-            continuous_tasks_in_plan = [task for task in full_plan if task['book'].task_type == 'continuous']
-            tasks_by_category = defaultdict(list)
-            for task in continuous_tasks_in_plan: tasks_by_category[task['step'].category].append(task)
-
-            tasks_to_display = []
-            for category, tasks in tasks_by_category.items():
-                tasks_in_current_level = [t for t in tasks if t['step'].level == current_level]
-                if not tasks_in_current_level: continue
-                
-                user_selection_id = cont_selections.get((subject.id, current_level, category))
-                if len(tasks_in_current_level) > 1 and not user_selection_id:
-                     subject.pending_selections.append(f"{current_level}の{category}")
-                else:
-                    task_to_add_id = user_selection_id or tasks_in_current_level[0]['book'].task_id
-                    book = db.session.query(Book).filter_by(task_id=task_to_add_id).first()
-                    if book: tasks_to_display.append(book)
-            subject.continuous_tasks = tasks_to_display
-
-        if task_groups:
-            subject.progress = int((len(completed_task_ids_in_plan) / len(task_groups)) * 100)
-
-        dashboard_data.append(subject)
+    # --- 2. 各科目のダッシュボード用データを作成（科目数に関係なく一定回数のクエリ） ---
+    dashboard_data = load_dashboard_snapshot(user, target_level_name)
 
     return render_template('dashboard.html', user=user, university=university, 
                            days_until_exam=days_until_exam, dashboard_data=dashboard_data,
@@ -365,44 +198,25 @@ def stats(user_id):
     prev_month = {'year': prev_month_date.year, 'month': prev_month_date.month}; next_month = {'year': next_month_date.year, 'month': next_month_date.month}
     is_future = (year > date.today().year) or (year == date.today().year and month >= date.today().month)
     
-    total_by_subject = db.session.query(Subject.name, db.func.sum(StudyLog.duration_minutes).label('total')).join(Subject, StudyLog.subject_id == Subject.id).filter(StudyLog.user_id == user_id).group_by(Subject.name).all()
-    last_7_days = db.session.query(StudyLog.date, db.func.sum(StudyLog.duration_minutes).label('total')).filter(StudyLog.user_id == user_id, StudyLog.date >= date.today() - timedelta(days=7)).group_by(StudyLog.date).order_by(StudyLog.date).all()
+    # 集計済みの日毎データ（study_daily_rollup）から読む
+    total_by_subject = db.session.query(Subject.name, db.func.sum(StudyDailyRollup.minutes).label('total')).join(Subject, StudyDailyRollup.subject_id == Subject.id).filter(StudyDailyRollup.user_id == user_id).group_by(Subject.name).all()
+    last_7_days = db.session.query(StudyDailyRollup.date, db.func.sum(StudyDailyRollup.minutes).label('total')).filter(StudyDailyRollup.user_id == user_id, StudyDailyRollup.date >= date.today() - timedelta(days=7)).group_by(StudyDailyRollup.date).order_by(StudyDailyRollup.date).all()
     
-    thresholds = {5: 600, 4: 480, 3: 300, 2: 180, 1: 1} if user.grade == 'ronin' else {5: 300, 4: 180, 3: 120, 2: 60, 1: 1}
-    all_logs_rows = db.session.query(StudyLog.date, db.func.sum(StudyLog.duration_minutes).label('total')).filter(StudyLog.user_id == user_id).group_by(StudyLog.date).all()
-    heatmap_data = [{"date": row.date.isoformat(), "value": row.total} for row in all_logs_rows]
-    study_data = {row.date.isoformat(): row.total for row in all_logs_rows}
+    # カレンダーは表示中の週だけを集計する（年間ヒートマップはAPIから遅延読み込み）
     cal = calendar.Calendar(); month_days = cal.monthdatescalendar(year, month)
+    month_heatmap = heatmap_payload(user_id, user.grade, month_days[0][0], month_days[-1][-1])
     calendar_data = []
-    for week in month_days:
+    for week_index, week in enumerate(month_days):
         week_data = []
-        for day in week:
-            total_minutes = study_data.get(day.isoformat(), 0); color_level = 0
-            for level, minute_req in sorted(thresholds.items(), reverse=True):
-                if total_minutes >= minute_req:
-                    color_level = level; break
-            week_data.append({'date': day, 'total_minutes': total_minutes, 'color_level': color_level})
+        for day_index, day in enumerate(week):
+            i = week_index * 7 + day_index
+            week_data.append({'date': day, 'total_minutes': month_heatmap['minutes'][i], 'color_level': month_heatmap['levels'][i]})
         calendar_data.append(week_data)
         
     user_subjects_list = [{'id': s.id, 'name': s.name} for s in user.subjects]    
-    # app/routes.py の stats 関数内
-    # ▼▼▼ 新しいロジック：日毎のログをグループ化する ▼▼▼
-    all_logs_details = db.session.query(StudyLog, Subject.name.label('subject_name'))\
-        .join(Subject, StudyLog.subject_id == Subject.id)\
-        .filter(StudyLog.user_id == user_id)\
-        .order_by(StudyLog.date.desc()).all()
-    
-    logs_by_date = defaultdict(lambda: {'date': None, 'comment': None, 'logs': []})
-    for log, subject_name in all_logs_details:
-        day_key = log.date.isoformat()
-        logs_by_date[day_key]['date'] = log.date
-        logs_by_date[day_key]['comment'] = log.comment
-        logs_by_date[day_key]['logs'].append({'subject_name': subject_name, 'duration': log.duration_minutes})
-    
-    # 最近のコメント付きログ10件を抽出
-    recent_logs_grouped = [log_group for log_group in logs_by_date.values() if log_group['comment']][:10]
-
-    heatmap_data = [{"date": row.date.isoformat(), "value": row.total} for row in all_logs_rows]
+    # 編集モーダル用には表示中の月の記録だけ、履歴は最初の1ページだけを読み込む（続きはAPIで取得）
+    logs_by_date = load_month_logs(user_id, month_days[0][0], month_days[-1][-1])
+    recent_logs_grouped, next_logs_cursor = load_log_page(user_id)
 
 
     return render_template(
@@ -412,14 +226,46 @@ def stats(user_id):
         date_labels=[r.date.isoformat() for r in last_7_days], 
         date_data=[round(r.total / 60, 1) for r in last_7_days],
         calendar_data=calendar_data, month=month, year=year,
-        recent_logs_grouped=recent_logs_grouped, user_subjects=user_subjects_list,
-        logs_by_date=logs_by_date, prev_month=prev_month, next_month=next_month, is_future=is_future, heatmap_data=heatmap_data
+        recent_logs_grouped=recent_logs_grouped, next_logs_cursor=next_logs_cursor, user_subjects=user_subjects_list,
+        logs_by_date=logs_by_date, prev_month=prev_month, next_month=next_month, is_future=is_future
     )
 
+@main_bp.route('/api/stats/<int:user_id>/logs')
+@login_required
+def get_log_history(user_id):
+    if user_id != current_user.id: abort(403)
+    try:
+        limit = int(request.args.get('limit', 20))
+        groups, next_cursor = load_log_page(user_id, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor or limit'}), 400
+    for group in groups:
+        group['date'] = group['date'].isoformat()
+    return jsonify({'groups': groups, 'next_cursor': next_cursor})
+
+@main_bp.route('/api/stats/<int:user_id>/heatmap')
+@login_required
+def get_heatmap(user_id):
+    if user_id != current_user.id: abort(403)
+    try:
+        start = date.fromisoformat(request.args['from'])
+        end = date.fromisoformat(request.args['to'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'from and to must be YYYY-MM-DD'}), 400
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        return jsonify({'success': False, 'error': 'Invalid date range'}), 400
+
+    response = jsonify(heatmap_payload(user_id, current_user.grade, start, end))
+    # 内容が変わっていなければ 304 を返せるように ETag を付ける
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @main_bp.route('/settings/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def settings(user_id):
-    user = db.session.query(User).get(user_id)
+    # ログイン処理で保持している値ではなく、DBの最新の状態を編集する
+    user = db.session.get(User, user_id, populate_existing=True)
     if not user or user.id != current_user.id: abort(404)
     message, error = None, None
 
@@ -444,19 +290,22 @@ def settings(user_id):
             if subjects_to_remove:
                 db.session.query(Progress).filter(Progress.user_id == user_id, Progress.subject_id.in_(subjects_to_remove)).delete(synchronize_session=False)
                 db.session.query(UserContinuousTaskSelection).filter(UserContinuousTaskSelection.user_id == user_id, UserContinuousTaskSelection.subject_id.in_(subjects_to_remove)).delete(synchronize_session=False)
+                rebuild_progress_bitmap(user_id)
 
-            user.subjects = [subject for subject in db.session.query(Subject).all() if subject.id in new_subject_ids]
+            new_subject_ids &= {s.id for s in all_subjects()}
+            user.subjects = db.session.query(Subject).filter(Subject.id.in_(new_subject_ids)).all() if new_subject_ids else []
             db.session.commit()
             message = "設定を保存しました。"
 
-    all_subjects = db.session.query(Subject).order_by(Subject.id).all()
     user_subject_ids = {s.id for s in user.subjects}
-    return render_template('settings.html', user=user, message=message, error=error, all_subjects=all_subjects, user_subject_ids=user_subject_ids)
+    return render_template('settings.html', user=user, message=message, error=error, all_subjects=all_subjects(), user_subject_ids=user_subject_ids,
+                           reference_version=get_reference_cache().current_version())
     
 @main_bp.route('/change_password/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def change_password(user_id):
-    user = db.session.query(User).get(user_id)
+    # パスワードの確認は、必ずDBの最新のハッシュで行う
+    user = db.session.get(User, user_id, populate_existing=True)
     if not user or user.id != current_user.id: abort(404)
     error, message = None, None
 
@@ -482,18 +331,34 @@ def change_password(user_id):
 def get_universities():
     query = request.args.get('q', '')
     if not query: return jsonify([])
-    search_term = f"{query}%"
-    universities = db.session.query(University).filter(db.or_(University.name.like(search_term), University.kana_name.like(search_term))).limit(5).all()
-    return jsonify([uni.name for uni in universities])
+    return jsonify(search_universities(query))
 
 @main_bp.route('/api/faculties')
 def get_faculties():
     university_name = request.args.get('univ', '')
     if not university_name: return jsonify([])
-    university = db.session.query(University).filter_by(name=university_name).first()
+    university = university_by_name(university_name)
     if not university: return jsonify([])
-    faculties = db.session.query(Faculty).filter_by(university_id=university.id).all()
-    return jsonify([fac.name for fac in faculties])
+    return jsonify(list(faculty_names_for(university.id)))
+
+# 大学名の候補と、それぞれの学部一覧を1回で返す（登録・設定フォーム用）
+# 参照データのバージョンを v に付けて呼べば、バージョンが変わるまでブラウザのキャッシュだけで済む
+@main_bp.route('/api/universities/lookup')
+def lookup_universities():
+    query = request.args.get('q', '')
+    version = get_reference_cache().current_version()
+    results = []
+    for name in search_universities(query):
+        university = university_by_name(name)
+        results.append({'name': name, 'faculties': list(faculty_names_for(university.id)) if university else []})
+
+    response = jsonify(results)
+    response.set_etag(f'ref-{version}')
+    if request.args.get('v') == str(version):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
 
 @main_bp.route('/api/update_progress', methods=['POST'])
 @login_required
@@ -506,15 +371,44 @@ def update_progress():
     except (ValueError, TypeError):
         return jsonify({'success': False, 'error': 'Invalid or missing subject_id'}), 400
     
-    progress = db.session.query(Progress).filter_by(user_id=current_user.id, task_id=task_id).first()
-    if progress:
-        progress.is_completed = 1 if is_completed else 0
-    else:
-        new_progress = Progress(user_id=current_user.id, task_id=task_id, subject_id=subject_id, is_completed=1 if is_completed else 0)
-        db.session.add(new_progress)
+    _upsert_progress([{'task_id': task_id, 'subject_id': subject_id, 'is_completed': 1 if is_completed else 0}])
     db.session.commit()
     return jsonify({'success': True})
 
+MAX_PROGRESS_BATCH = 200
+
+@main_bp.route('/api/update_progress_batch', methods=['POST'])
+@login_required
+def update_progress_batch():
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, list) or not changes or len(changes) > MAX_PROGRESS_BATCH:
+        return jsonify({'success': False, 'error': 'Missing or too many changes'}), 400
+
+    # 同じタスクへの変更が複数あれば、最後のものだけを使う
+    rows_by_task_id = {}
+    for change in changes:
+        if not isinstance(change, dict): return jsonify({'success': False, 'error': 'Missing data'}), 400
+        task_id = change.get('task_id'); is_completed = change.get('is_completed')
+        if task_id is None or is_completed is None: return jsonify({'success': False, 'error': 'Missing data'}), 400
+        try:
+            subject_id = int(change.get('subject_id'))
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'error': 'Invalid or missing subject_id'}), 400
+        rows_by_task_id[task_id] = {'task_id': task_id, 'subject_id': subject_id, 'is_completed': 1 if is_completed else 0}
+
+    _upsert_progress(list(rows_by_task_id.values()))
+    db.session.commit()
+    logger.debug('progress batch', extra={'received': len(changes), 'updated': len(rows_by_task_id)})
+    return jsonify({'success': True, 'updated': len(rows_by_task_id)})
+
+def _upsert_progress(rows):
+    """進捗を (user_id, task_id) のユニーク制約で1文のUPSERTとして書き込む"""
+    for row in rows:
+        row['user_id'] = current_user.id
+    upsert_rows(Progress, rows, index_elements=['user_id', 'task_id'], update_columns=['is_completed'])
+    set_tasks_completed(current_user.id, {row['task_id']: bool(row['is_completed']) for row in rows})
+
 @main_bp.route('/api/select_continuous_task', methods=['POST'])
 @login_required
 def select_continuous_task():
@@ -556,18 +450,20 @@ def log_study_for_date(user_id):
     comment = data.get('comment')
     if not date_str or logs is None: return jsonify({'success': False}), 400
     
+    log_date = date.fromisoformat(date_str)
     for log_item in logs:
-        subject_id = log_item.get('subject_id')
+        subject_id = int(log_item.get('subject_id'))
         total_minutes = int(log_item.get('hours', 0)) * 60 + int(log_item.get('minutes', 0))
         if total_minutes > 0:
          new_log = StudyLog(
             user_id=user_id, 
             subject_id=subject_id, 
-            date=date.fromisoformat(date_str), 
+            date=log_date, 
             duration_minutes=total_minutes,
             comment=comment # ▼▼▼ 全てのログに同じコメントを紐付け ▼▼▼
          )
          db.session.add(new_log)
+         add_study_minutes(user_id, subject_id, log_date, total_minutes)
 
     db.session.commit()
     return jsonify({'success': True})
@@ -577,6 +473,7 @@ def log_study_for_date(user_id):
 def delete_log(log_id):
     log = db.session.query(StudyLog).get(log_id)
     if log and log.user_id == current_user.id:
+        add_study_minutes(log.user_id, log.subject_id, log.date, -log.duration_minutes)
         db.session.delete(log)
         db.session.commit()
     return redirect(url_for('.stats', user_id=current_user.id))
@@ -682,91 +579,6 @@ def delete_mock_exam(exam_id):
 
 
 
-# ... (既存のimport文) ...
-import requests
-from bs4 import BeautifulSoup
-import os
-import google.generativeai as genai
-import json
-import re
-from datetime import date, datetime
-from urllib.parse import urljoin
-import ssl
-from requests.adapters import HTTPAdapter
-from urllib3 import PoolManager
-from urllib3.util.ssl_ import create_urllib3_context
-
-# --- 共通ヘルパー (変更なし) ---
-class LegacySSLAdapter(HTTPAdapter):
-    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
-        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-        ssl_context.options |= getattr(ssl, "OP_LEGACY_SERVER_CONNECT", 0x4)
-        self.poolmanager = PoolManager(
-            ssl_context=ssl_context, num_pools=connections, maxsize=maxsize,
-            block=block, **pool_kwargs)
-
-def _get_legacy_session():
-    """古いSSLリネゴシエーションを許可するrequests.Sessionオブジェクトを作成する"""
-    session = requests.Session()
-    session.mount("https://", LegacySSLAdapter())
-    return session
-# --- AIの役割定義 (思考ルーチンを強化) ---
-
-def _is_link_a_mock_exam(link_text: str, link_url: str) -> bool:
-    """【鑑定士AI - 強化版】与えられたリンクが模試詳細ページらしいか、より厳しく判定する"""
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"""
-        以下のHTMLリンクは、特定の大学受験模試（例：「第1回全統共通テスト模試」）の詳細・申込ページへのリンクですか？
-        一般的な案内ページ（例：「模試一覧」「お申し込み方法」）や、模試と無関係なページは「いいえ」と判断してください。
-        「はい」か「いいえ」だけで答えてください。
-        リンクテキスト: "{link_text}"
-        リンクURL: "{link_url}"
-        """
-        response = model.generate_content(prompt, request_options={'timeout': 20})
-        return "はい" in response.text
-    except Exception:
-        return False
-
-def _extract_exam_details_with_ai(url: str, provider: str):
-    """【書記AI - 強化版】詳細ページから文脈を読んで模試の情報をJSONで抽出する"""
-    session = requests.Session()
-    session.mount("https://", LegacySSLAdapter())
-    response = session.get(url, timeout=15)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser')
-    page_text = ' '.join(soup.get_text().split())[:8000]
-
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    today = date.today().isoformat()
-    prompt = f"""
-    あなたはWebページから日本の大学受験模試の情報を抽出するエキスパートです。今日の日付は{today}です。
-    以下のテキストから、以下の項目を抽出してください。
-    - name: 模試の正式名称。「{provider}」という単語は含めないでください。
-    - target_grade: 対象学年（例：「高3・卒」）。
-    - exam_date: 実施日。
-    - app_start_date: 申込開始日。
-    - app_end_date: 申込締切日。
-    
-    重要：
-    - 日付は必ず「YYYY-MM-DD」形式にしてください。
-    - 実施日は、今日以降の最も可能性の高い日付を選んでください。
-    - 申込開始日と締切日は、「申込期間」などのキーワードの近くにある日付を優先してください。
-    - 情報が見つからない項目はnullにしてください。
-    - 結果は必ずJSON形式 {{"name": ..., "exam_date": ...}} で返してください。
-
-    テキスト：
-    {page_text}
-    """
-    
-    ai_response = model.generate_content(prompt, request_options={'timeout': 40})
-    json_text_match = re.search(r'```json\s*(\{.*?\})\s*```', ai_response.text, re.DOTALL)
-    if not json_text_match:
-        raise ValueError("AI did not return a valid JSON block.")
-    return json.loads(json_text_match.group(1))
-
-
-
 @main_bp.route('/api/update_continuous_tasks/<int:user_id>', methods=['POST'])
 @login_required
 def update_continuous_tasks(user_id):
@@ -788,25 +600,19 @@ def update_continuous_tasks(user_id):
         UserContinuousTaskSelection.category.in_(categories_to_update)
     ).delete(synchronize_session=False)
 
-    # 新しい選択を追加
+    # 新しい選択を追加（参考書→科目の対応はキャッシュ済みの逆引きインデックスから求める）
+    plan_cache = get_plan_cache()
     subject_ids = {s.id for s in current_user.subjects} # ユーザーの科目IDを取得
+    new_rows = {}
     for category, task_id in selections.items():
-        if task_id: # 選択がある場合のみ
-             # subject_idを見つけるロジック(簡易版、要改善の可能性あり)
-            book = db.session.query(Book).filter_by(task_id=task_id).first()
-            route_step = db.session.query(RouteStep).filter_by(book_id=book.id).first()
-            route = db.session.query(Route).get(route_step.route_id)
-            subject_id = route.subject_id
-            
-            if subject_id in subject_ids:
-                new_selection = UserContinuousTaskSelection(
-                    user_id=user_id, 
-                    subject_id=subject_id, 
-                    level=level, 
-                    category=category, 
-                    selected_task_id=task_id
-                )
-                db.session.add(new_selection)
+        if not task_id: continue # 選択がある場合のみ
+        placement = plan_cache.find_placement(task_id, subject_ids, level, category)
+        if placement:
+            new_rows[(placement.subject_id, category)] = {
+                'user_id': user_id, 'subject_id': placement.subject_id,
+                'level': level, 'category': category, 'selected_task_id': task_id}
+    upsert_rows(UserContinuousTaskSelection, list(new_rows.values()),
+                index_elements=['user_id', 'subject_id', 'level', 'category'], update_columns=['selected_task_id'])
     
     db.session.commit()
     return jsonify({'success': True})
@@ -847,7 +653,8 @@ def faq_list():
 @login_required
 def inbox():
     # ユーザーに関連する全てのお問い合わせと、それに対する返信を取得
-    inquiries = db.session.query(Inquiry).filter_by(user_id=current_user.id).order_by(Inquiry.created_at.desc()).all()
+    inquiries = db.session.query(Inquiry).options(selectinload(Inquiry.replies))\
+        .filter_by(user_id=current_user.id).order_by(Inquiry.created_at.desc()).all()
     return render_template('inbox.html', inquiries=inquiries, user=current_user)
 
 @main_bp.route('/api/reply/<int:reply_id>/read', methods=['POST'])
@@ -0,0 +1,93 @@
+# app/sql_instrument.py
+# リクエストごとに発行したSQLの件数・DB時間・同じ形のSQLの繰り返し（N+1の兆候）を記録する。
+# デバッグ時は Server-Timing ヘッダーで返すので、ブラウザの開発者ツールで確認できる。
+# 件数と時間は常に数えるが、SQLの文そのものはデバッグ・テスト時だけ残し、形の比較は必要になってから行う。
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .structured_logging import get_logger
+
+logger = get_logger('sql')
+
+# 同じ形のSQLがこの回数以上繰り返されたら、デバッグ時に警告を出す
+N_PLUS_ONE_THRESHOLD = 5
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """パラメータやINの要素数の違いを無視して、SQLの形だけを取り出す"""
+    statement = _LITERAL.sub('?', statement)
+    statement = _IN_LIST.sub('(?)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class SqlStats:
+    def __init__(self, keep_statements=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if keep_statements else None
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    def repeated(self, threshold=2):
+        """threshold 回以上発行された同じ形のSQLを、多い順に返す（文を残していなければ空）"""
+        fingerprints = Counter(fingerprint(statement) for statement in self.statements or ())
+        return [(sql, n) for sql, n in fingerprints.most_common() if n >= threshold]
+
+    def server_timing(self):
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+    def report(self):
+        lines = [f'{self.count} queries, {self.duration * 1000:.1f} ms']
+        lines += [f'  x{n}: {sql}' for sql, n in self.repeated()]
+        return '\n'.join(lines)
+
+
+def request_sql_stats():
+    """現在のリクエストの記録を返す（リクエスト外なら None）"""
+    return g.get('sql_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    stats = request_sql_stats()
+    if stats is not None:
+        stats.record(statement, duration)
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_failed_statement(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+def init_sql_instrumentation(app):
+    @app.before_request
+    def _start_sql_stats():
+        g.sql_stats = SqlStats(keep_statements=app.debug or app.testing)
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = request_sql_stats()
+        if stats is None or not app.debug:
+            return response
+        response.headers.add('Server-Timing', stats.server_timing())
+        repeated = stats.repeated(N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            logger.warning('同じ形のSQLが繰り返し発行されています（N+1の可能性）', extra={'repeated': repeated[:5]})
+        return response
@@ -0,0 +1,153 @@
+# app/structured_logging.py
+# アプリのログ設定。ブループリントごとに名前付きのロガーを使い、1行1レコードのJSONで出力する。
+# 書き込みは QueueHandler 経由で別スレッドが行うので、リクエストの処理がログの出力先で待たされない。
+# 頻度の高いDEBUGは一部だけを残す（LOG_DEBUG_SAMPLE_RATE）。
+import atexit
+import copy
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from flask import g, has_request_context, request
+
+ROOT_LOGGER_NAME = 'univ_app'
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# LogRecord の標準の属性（これ以外で extra に渡されたものは、そのままJSONの項目として出力する）
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'path', 'method'}
+
+_listener = None
+
+
+def get_logger(name):
+    """'main' → 'univ_app.main' のように、アプリ配下の名前付きロガーを返す"""
+    return logging.getLogger(f'{ROOT_LOGGER_NAME}.{name}')
+
+
+class RequestContextFilter(logging.Filter):
+    """リクエスト中のログに、リクエストIDとパスを付ける（ログを出したスレッドで実行される）"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.path = request.path
+            record.method = request.method
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUGのレコードだけを rate の割合で残す"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in ('request_id', 'method', 'path'):
+            if getattr(record, key, None) is not None:
+                payload[key] = getattr(record, key)
+        payload.update({k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS})
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # キューを通ったレコード（_JsonQueueHandler で文字列にしてある）
+            payload['exc_info'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _JsonQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare() は例外のトレースバックを message に混ぜて exc_info を消すので、
+    トレースバックは文字列にして exc_text に分けたままキューに入れる
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class _StderrHandler(logging.StreamHandler):
+    """出力のたびにその時点の sys.stderr に書く（テスト時などに差し替えられても追従する）"""
+
+    def __init__(self):
+        super().__init__(None)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def init_logging(app):
+    """ロガーの設定と、リクエストID・処理時間を記録するフックを登録する"""
+    global _listener
+    if _listener is not None:
+        # アプリを作り直した場合（テストなど）は、前の設定を片付けてから作り直す
+        _listener.stop()
+
+    output = _StderrHandler()
+    output.setFormatter(JsonFormatter())
+    queue = SimpleQueue()
+    queue_handler = _JsonQueueHandler(queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter(app.config.get('LOG_DEBUG_SAMPLE_RATE', 0.01)))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.handlers = [queue_handler]
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    root.propagate = False
+    _listener = QueueListener(queue, output, respect_handler_level=True)
+    _listener.start()
+
+    request_logger = get_logger('request')
+
+    @app.before_request
+    def _start_request_log():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_log(response):
+        response.headers.setdefault(REQUEST_ID_HEADER, g.get('request_id', ''))
+        if request_logger.isEnabledFor(logging.INFO) and 'request_started' in g:
+            from .sql_instrument import request_sql_stats
+            stats = request_sql_stats()
+            request_logger.info('request', extra={
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+                'db_queries': stats.count if stats else None,
+                'db_ms': round(stats.duration * 1000, 2) if stats else None,
+            })
+        return response
+
+
+@atexit.register
+def _flush_on_exit():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,61 @@
+# app/study_history.py
+# 学習記録の履歴を (date, id) のキーセットで新しい順にページ分割して取得する
+from datetime import date
+from collections import defaultdict
+from .extensions import db
+from .models import StudyLog, Subject
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(log):
+    return f"{log.date.isoformat()}_{log.id}"
+
+
+def decode_cursor(cursor):
+    """"YYYY-MM-DD_id" 形式のカーソルを (date, id) に戻す。不正な値なら ValueError"""
+    date_str, _, log_id = cursor.partition('_')
+    return date.fromisoformat(date_str), int(log_id)
+
+
+def load_log_page(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """カーソルより古い、コメントのある日の学習記録を最大limit件取得し、日付ごとにまとめて返す。
+
+    戻り値は (日付ごとのグループのリスト, 次のページのカーソル or None)。
+    同じ日付の記録がページをまたぐことがあるので、表示側で同じ日付のグループは結合する。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # 履歴にはコメントを書いた日だけを出す（その日のコメントは、ページをまたいでも各行に付ける）
+    commented_days = db.session.query(StudyLog.date.label('date'), db.func.max(StudyLog.comment).label('comment'))\
+        .filter(StudyLog.user_id == user_id, StudyLog.comment.isnot(None), StudyLog.comment != '')\
+        .group_by(StudyLog.date).subquery()
+    query = db.session.query(StudyLog, Subject.name.label('subject_name'), commented_days.c.comment)\
+        .join(Subject, StudyLog.subject_id == Subject.id)\
+        .join(commented_days, StudyLog.date == commented_days.c.date)\
+        .filter(StudyLog.user_id == user_id)
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(db.or_(StudyLog.date < cursor_date,
+                                    db.and_(StudyLog.date == cursor_date, StudyLog.id < cursor_id)))
+    rows = query.order_by(StudyLog.date.desc(), StudyLog.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    groups = []
+    for log, subject_name, comment in rows[:limit]:
+        if not groups or groups[-1]['date'] != log.date:
+            groups.append({'date': log.date, 'comment': comment, 'logs': []})
+        groups[-1]['logs'].append({'id': log.id, 'subject_name': subject_name, 'duration': log.duration_minutes})
+    return groups, next_cursor
+
+
+def load_month_logs(user_id, first_day, last_day):
+    """カレンダーの編集モーダル用に、表示中の期間の記録を {日付: {科目ID: {...}}} の形で返す"""
+    logs_by_date = defaultdict(dict)
+    rows = db.session.query(StudyLog).filter(StudyLog.user_id == user_id, StudyLog.date >= first_day, StudyLog.date <= last_day)
+    for log in rows:
+        record = logs_by_date[log.date.isoformat()].setdefault(str(log.subject_id), {'duration_minutes': 0, 'comment': None})
+        record['duration_minutes'] += log.duration_minutes
+        if log.comment:
+            record['comment'] = log.comment
+    return dict(logs_by_date)
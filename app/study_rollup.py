@@ -0,0 +1,35 @@
+# app/study_rollup.py
+# 学習記録の日毎集計（study_daily_rollup）を更新するヘルパー
+from sqlalchemy import func, insert, select
+from .extensions import db
+from .models import StudyLog, StudyDailyRollup
+from .upsert import upsert_rows
+
+
+def add_study_minutes(user_id, subject_id, day, minutes):
+    """集計に学習時間を加算する（マイナスなら減算）。コミットは呼び出し側で行う"""
+    if not minutes:
+        return
+    if minutes > 0:
+        # 同じ日の記録が同時に来ても主キーの重複にならないよう、INSERT ... ON CONFLICT で加算する
+        upsert_rows(StudyDailyRollup, [{'user_id': user_id, 'date': day, 'subject_id': subject_id, 'minutes': minutes}],
+                    index_elements=['user_id', 'date', 'subject_id'], update_columns=[], increment_columns=['minutes'])
+        return
+    rollup = db.session.query(StudyDailyRollup).filter_by(user_id=user_id, date=day, subject_id=subject_id)
+    if rollup.update({StudyDailyRollup.minutes: StudyDailyRollup.minutes + minutes}, synchronize_session=False):
+        rollup.filter(StudyDailyRollup.minutes <= 0).delete(synchronize_session=False)
+
+
+def backfill_study_rollup(user_id=None):
+    """study_logs から集計を作り直す。user_idを指定した場合はそのユーザーだけ。作成した行数を返す"""
+    delete_query = db.session.query(StudyDailyRollup)
+    source = select(StudyLog.user_id, StudyLog.date, StudyLog.subject_id, func.sum(StudyLog.duration_minutes))\
+        .group_by(StudyLog.user_id, StudyLog.date, StudyLog.subject_id)
+    if user_id is not None:
+        delete_query = delete_query.filter(StudyDailyRollup.user_id == user_id)
+        source = source.where(StudyLog.user_id == user_id)
+
+    delete_query.delete(synchronize_session=False)
+    result = db.session.execute(insert(StudyDailyRollup).from_select(['user_id', 'date', 'subject_id', 'minutes'], source))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,109 @@
+# app/university_search.py
+# 大学名の入力補完用の検索インデックス（メモリ上のトライ木）。
+# 大学名とふりがなの全ての接尾辞をトライ木に入れておき、前方一致・部分一致を1回の辿りで引けるようにする。
+# 参照データのバージョンが変わったら、DBの大学一覧と差分を取って変わった大学だけを入れ替える。
+import threading
+import unicodedata
+from flask import current_app
+from .extensions import db
+from .models import University
+from .reference_cache import get_reference_cache
+
+DEFAULT_LIMIT = 5
+
+_EXTENSION_KEY = 'university_search'
+_init_lock = threading.Lock()
+
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+
+def normalize(text):
+    """全角英数・半角カナ・カタカナ・大文字小文字・空白の違いを吸収する"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ''.join(text.split()).translate(_KATAKANA_TO_HIRAGANA)
+
+
+class _Node:
+    __slots__ = ('children', 'offsets')
+
+    def __init__(self):
+        self.children = {}
+        # このノードを通る大学ID -> 一致が始まる位置（0なら前方一致）
+        self.offsets = {}
+
+
+class UniversitySearchIndex:
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._entries = {}  # 大学ID -> (大学名, 正規化したキーのタプル)
+        self.version = None
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """一致の良い順に大学名を返す（完全一致 > 前方一致 > 部分一致、同順位なら短い名前を優先）"""
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            node = self._root
+            for char in query:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            ranked = sorted(
+                (query not in self._entries[uid][1], offset > 0, offset, len(self._entries[uid][0]), self._entries[uid][0])
+                for uid, offset in node.offsets.items())
+        return [name for *_, name in ranked[:limit]]
+
+    def sync(self, universities):
+        """(id, 大学名, ふりがな) の一覧に合わせて、変わった大学だけを入れ替える"""
+        latest = {uid: (name, (normalize(name), normalize(kana))) for uid, name, kana in universities}
+        with self._lock:
+            for uid in [uid for uid in self._entries if latest.get(uid) != self._entries[uid]]:
+                self._remove(uid)
+            for uid, entry in latest.items():
+                if uid not in self._entries:
+                    self._add(uid, entry)
+
+    def _add(self, uid, entry):
+        self._entries[uid] = entry
+        for key in entry[1]:
+            for start in range(len(key)):
+                node = self._root
+                for char in key[start:]:
+                    node = node.children.setdefault(char, _Node())
+                    if start < node.offsets.get(uid, len(key)):
+                        node.offsets[uid] = start
+
+    def _remove(self, uid):
+        for key in self._entries.pop(uid)[1]:
+            for start in range(len(key)):
+                self._remove_path(self._root, key[start:], uid)
+
+    def _remove_path(self, node, suffix, uid):
+        if not suffix:
+            return
+        child = node.children.get(suffix[0])
+        if child is None:
+            return
+        child.offsets.pop(uid, None)
+        self._remove_path(child, suffix[1:], uid)
+        if not child.offsets:
+            del node.children[suffix[0]]
+
+
+def get_search_index():
+    """検索インデックスを返す。参照データのバージョンが変わっていれば差分を反映してから返す"""
+    index = current_app.extensions.get(_EXTENSION_KEY)
+    if index is None:
+        with _init_lock:
+            index = current_app.extensions.setdefault(_EXTENSION_KEY, UniversitySearchIndex())
+    version = get_reference_cache().current_version()
+    if index.version != version:
+        index.sync(db.session.query(University.id, University.name, University.kana_name).all())
+        index.version = version
+    return index
+
+
+def search_universities(query, limit=DEFAULT_LIMIT):
+    return get_search_index().search(query, limit)
@@ -0,0 +1,32 @@
+# app/upsert.py
+# INSERT ... ON CONFLICT DO UPDATE を SQLite / PostgreSQL の両方で使うためのヘルパー
+from sqlalchemy.dialects import postgresql, sqlite
+from .extensions import db
+
+_INSERT_BY_DIALECT = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def upsert_rows(model, rows, index_elements, update_columns, increment_columns=()):
+    """rows（辞書のリスト）を1文でまとめて書き込む。
+
+    index_elements のユニーク制約に当たった行は update_columns だけを新しい値で更新し、
+    increment_columns は既存の値に新しい値を足す。コミットは呼び出し側で行う。
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    insert = _INSERT_BY_DIALECT.get(dialect)
+    if insert is None:
+        raise ValueError(f"upsert is not supported for dialect '{dialect}'")
+
+    stmt = insert(model).values(rows)
+    if update_columns or increment_columns:
+        set_ = {column: stmt.excluded[column] for column in update_columns}
+        set_.update({column: getattr(model, column) + stmt.excluded[column] for column in increment_columns})
+        stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    db.session.execute(stmt)
@@ -1,3 +1,4 @@
+import os
 from app import create_app, db
 from flask_migrate import upgrade
 from seed_db import seed_database
@@ -15,8 +16,9 @@ with app.app_context():
     print("--- Database upgrade finished. ---")
 
     print("--- Seeding database... ---")
-    # データ投入を実行
-    seed_database(db)
+    # データ投入を実行（seed_data/ などの内容が前回から変わったテーブルだけを投入する。
+    # SEED_FORCE=1 なら全テーブルをDBと突き合わせる）
+    seed_database(db, force=os.environ.get('SEED_FORCE') == '1')
     print("--- Database seeding finished. ---")
 
 print("--- Build script finished successfully! ---")
\ No newline at end of file
@@ -15,6 +15,18 @@ class Config:
         
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # ログの出力レベルと、DEBUGのレコードを残す割合（DEBUGは頻度が高いので一部だけ出力する）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.01'))
+
+    # ログイン中のユーザー情報をプロセス内に保持する秒数。他のワーカーでの変更は identity_version の確認で
+    # 次のリクエストから反映されるので、この値は使われない値がメモリに残る時間の上限にだけ効く
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', '30'))
+
+    # 模試ページのリンクをAIで判定した結果の保存先（SQLiteのファイル）
+    EXAM_SCRAPER_CACHE_PATH = os.environ.get('EXAM_SCRAPER_CACHE_PATH') or \
+        os.path.join(basedir, 'instance', 'exam_scraper_cache.sqlite3')
+
     # メール設定もここにまとめるのが綺麗です
     MAIL_SERVER = 'smtp.sendgrid.net'
     MAIL_PORT = 587
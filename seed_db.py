@@ -1,98 +1,205 @@
 # seed_db.py
+# テーブルごとに既存の行のキーを1回のクエリで読み込み、シードデータとの差分（追加・変更）だけを
+# まとめてINSERT・UPDATEする。全テーブルを1つのトランザクションで書き込み、最後に1回だけコミットする。
+# 行の削除は行わない（ユーザーの進捗などが参照しているため）。
+# シードデータの内容のハッシュを seed_fingerprints に保存し、内容が変わったデータのテーブルだけを投入し直す。
 
+import hashlib
+import time
 from datetime import date
-from app.models import Subject, University, Faculty, Book, Route, RouteStep, SubjectStrategy, OfficialMockExam
+from sqlalchemy import select, update
+from app.models import (Subject, University, Faculty, Book, Route, RouteStep, SubjectStrategy, OfficialMockExam,
+                        SeedFingerprint)
+from app.reference_cache import bump_reference_version
 from seed_data.universities import universities_to_seed
 from seed_data.books import books_to_seed
 from seed_data.routes import routes_to_seed, route_steps_human_readable
 from seed_data.faculties import faculties_to_seed
 from seed_data.strategies import strategy_data
 
-def seed_database(db):
-    """データベースに初期データを投入する関数"""
+SUBJECTS = [
+    '英語', '数学', '現代文', '古文', '漢文', '世界史', '日本史',
+    '地理', '政治・経済', '倫理', '物理', '化学', '生物', '地学', '小論文'
+]
+
+# provider, name, exam_date, app_start_date, app_end_date, url
+OFFICIAL_EXAMS = [
+    ('河合塾', '第1回 全統共通テスト模試', date(2026, 5, 3), date(2026, 3, 20), date(2026, 4, 22), 'https://www.kawai-juku.ac.jp/moshi/'),
+    ('駿台', '第1回 駿台atama＋共通テスト模試', date(2026, 6, 7), date(2026, 4, 1), date(2026, 5, 28), 'https://www.sundai.ac.jp/moshi/'),
+    ('東進', '第2回 共通テスト本番レベル模試', date(2026, 4, 26), date(2026, 3, 1), date(2026, 4, 23), 'https://www.toshin.com/moshi/'),
+]
+
+# シードデータの名前 → その内容を返す関数
+SEED_SOURCES = {
+    'subjects': lambda: SUBJECTS,
+    'universities': lambda: universities_to_seed,
+    'faculties': lambda: faculties_to_seed,
+    'books': lambda: books_to_seed,
+    'routes': lambda: (routes_to_seed, route_steps_human_readable),
+    'strategies': lambda: strategy_data,
+    'official_exams': lambda: OFFICIAL_EXAMS,
+}
+
+# テーブル → 投入する行を決めるシードデータ（どれかが変われば、そのテーブルを投入し直す）
+TABLE_SOURCES = {
+    'subjects': ('subjects',),
+    'universities': ('universities',),
+    'faculties': ('universities', 'faculties'),
+    'books': ('books',),
+    'routes': ('routes', 'subjects'),
+    'route_steps': ('routes', 'books'),
+    'subject_strategies': ('strategies', 'subjects'),
+    'official_mock_exam': ('official_exams',),
+}
+
+
+def seed_fingerprints():
+    """シードデータごとの内容のハッシュ"""
+    return {name: hashlib.sha256(repr(load()).encode('utf-8')).hexdigest() for name, load in SEED_SOURCES.items()}
+
+
+def seed_database(db, force=False):
+    """
+    データベースに初期データを投入・更新する関数。テーブル名 → (追加件数, 更新件数) を返す。
+    保存済みのハッシュと同じシードデータのテーブルは飛ばす（force=True なら全テーブルを突き合わせる）。
+    """
     print("Seeding database...")
+    started = time.perf_counter()
+    fingerprints = seed_fingerprints()
+    if force:
+        changed_sources = set(fingerprints)
+    else:
+        stored = dict(db.session.execute(select(SeedFingerprint.source, SeedFingerprint.digest)).all())
+        changed_sources = {name for name, digest in fingerprints.items() if stored.get(name) != digest}
+    if not changed_sources:
+        print("シードデータに変更はありません。")
+        return {}
+    tables = {table for table, sources in TABLE_SOURCES.items() if changed_sources & set(sources)}
+    summary = {}
+    ids = {}
+
+    def ids_of(model, key_columns):
+        # 飛ばしたテーブルの主キーが必要になったときだけ読み込む
+        if model not in ids:
+            ids[model] = _load_ids(db, model, key_columns)
+        return ids[model]
+
+    try:
+        # --- 1. 科目マスターデータ ---
+        if 'subjects' in tables:
+            ids[Subject] = _sync_table(db, Subject, ['name'], [{'name': name} for name in SUBJECTS], summary)
+
+        # --- 2. 大学マスターデータ ---
+        if 'universities' in tables:
+            ids[University] = _sync_table(db, University, ['name'], [
+                {'name': name, 'kana_name': kana, 'level': level, 'info_url': url}
+                for name, kana, level, url in universities_to_seed], summary)
+
+        # --- 3. 学部マスターデータ ---
+        if 'faculties' in tables:
+            university_ids = ids_of(University, ['name'])
+            _sync_table(db, Faculty, ['university_id', 'name'], [
+                {'university_id': university_ids[uni_name], 'name': fac_name}
+                for uni_name, fac_name in faculties_to_seed if uni_name in university_ids], summary)
+
+        # --- 4. 参考書マスターデータ（タイトルなどが変わっていれば更新する） ---
+        if 'books' in tables:
+            ids[Book] = _sync_table(db, Book, ['task_id'], [
+                {'task_id': task_id, 'title': title, 'description': desc, 'youtube_query': yt,
+                 'duration_weeks': weeks, 'task_type': type, 'url': url}
+                for task_id, title, desc, yt, weeks, type, url in books_to_seed], summary)
+
+        # --- 5. ルート定義 ---
+        if 'routes' in tables:
+            subject_ids = ids_of(Subject, ['name'])
+            ids[Route] = _sync_table(db, Route, ['name'], [
+                {'name': name, 'plan_type': p_type,
+                 'subject_id': subject_ids.get(s_id_or_name) if isinstance(s_id_or_name, str) else s_id_or_name}
+                for name, p_type, s_id_or_name in routes_to_seed], summary)
+
+        # --- 6. ルートステップ（レベル・カテゴリが変わっていれば更新する） ---
+        if 'route_steps' in tables:
+            route_ids, book_ids = ids_of(Route, ['name']), ids_of(Book, ['task_id'])
+            _sync_table(db, RouteStep, ['route_id', 'book_id', 'step_order'], [
+                {'route_id': route_ids[route_name], 'book_id': book_ids[task_id], 'step_order': step,
+                 'level': level, 'category': cat, 'is_main': is_main}
+                for route_name, task_id, step, level, cat, is_main in route_steps_human_readable
+                if route_name in route_ids and task_id in book_ids], summary)
+
+        # --- 7. 学習戦略データ ---
+        if 'subject_strategies' in tables:
+            subject_ids = ids_of(Subject, ['name'])
+            _sync_table(db, SubjectStrategy, ['subject_id'], [
+                {'subject_id': subject_ids[subject_name], 'strategy_html': strategy_html}
+                for subject_name, strategy_html in strategy_data.items() if subject_name in subject_ids], summary)
+
+        # --- 8. 模試マスターデータ ---
+        if 'official_mock_exam' in tables:
+            _sync_table(db, OfficialMockExam, ['provider', 'name', 'exam_date'], [
+                {'provider': provider, 'name': name, 'exam_date': exam_d,
+                 'app_start_date': app_start, 'app_end_date': app_end, 'url': url}
+                for provider, name, exam_d, app_start, app_end, url in OFFICIAL_EXAMS], summary)
+
+        # 一括書き込みはORMのflushを通らないので、参照データのバージョンは自分で進める
+        if any(inserted or updated for table, (inserted, updated) in summary.items()
+               if table != OfficialMockExam.__tablename__):
+            bump_reference_version()
+        # ハッシュはデータと同じトランザクションで保存する（途中で失敗したら次回もう一度投入する）
+        _sync_table(db, SeedFingerprint, ['source'], [
+            {'source': name, 'digest': digest} for name, digest in fingerprints.items()], {})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    print(f"  変更されたシードデータ: {', '.join(sorted(changed_sources))}")
+    for table, (inserted, updated) in summary.items():
+        print(f"  {table}: 追加 {inserted} 件 / 更新 {updated} 件")
+    print(f"データベースの初期データを投入しました（{time.perf_counter() - started:.2f} 秒）。")
+    return summary
+
+
+def _sync_table(db, model, key_columns, rows, summary):
+    """
+    rows（列名 → 値の辞書のリスト）を、key_columns の値が同じ既存の行と突き合わせ、
+    無い行は一括INSERT、キー以外の列が違う行は一括UPDATEする。キー → 主キーの辞書を返す。
+    """
+    table = model.__table__
+    primary_key = table.primary_key.columns[0].key
+    compare_columns = [c for c in (rows[0] if rows else {}) if c not in key_columns]
+
+    def key_of(row):
+        return row[key_columns[0]] if len(key_columns) == 1 else tuple(row[c] for c in key_columns)
+
+    desired = {}
+    for row in rows:
+        desired.setdefault(key_of(row), row)
+
+    columns = [table.c[c] for c in dict.fromkeys([primary_key, *key_columns, *compare_columns])]
+    existing = {key_of(r): r for r in db.session.execute(select(*columns)).mappings()}
+
+    inserts = [row for key, row in desired.items() if key not in existing]
+    updates = [dict({primary_key: existing[key][primary_key]}, **{c: row[c] for c in compare_columns})
+               for key, row in desired.items()
+               if key in existing and any(existing[key][c] != row[c] for c in compare_columns)]
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        # 主キーを含む辞書のリストを渡すと、主キーごとのUPDATEをまとめて実行する
+        db.session.execute(update(model), updates)
+    summary[table.name] = (len(inserts), len(updates))
+
+    if inserts:
+        # 追加した行の主キーを知るために読み直す
+        return _load_ids(db, model, key_columns)
+    return {key: r[primary_key] for key, r in existing.items()}
+
 
-    # --- 1. 科目マスターデータ ---
-    subjects_list = [
-        '英語', '数学', '現代文', '古文', '漢文', '世界史', '日本史', 
-        '地理', '政治・経済', '倫理', '物理', '化学', '生物', '地学', '小論文'
-    ]
-    for subject_name in subjects_list:
-        # ▼▼▼ Model.query -> db.session.query(Model) に変更 ▼▼▼
-        if not db.session.query(Subject).filter_by(name=subject_name).first():
-            db.session.add(Subject(name=subject_name))
-    db.session.commit()
-    print("科目を登録しました。")
-
-    # --- 2. 大学マスターデータ ---
-    for name, kana, level, url in universities_to_seed:
-        if not db.session.query(University).filter_by(name=name).first():
-            db.session.add(University(name=name, kana_name=kana, level=level, info_url=url))
-    db.session.commit()
-    print("大学データを登録しました。")
-
-    # --- 3. 学部マスターデータの登録 ---
-    university_id_map = {u.name: u.id for u in db.session.query(University).all()}
-    for uni_name, fac_name in faculties_to_seed:
-        if uni_name in university_id_map:
-            uni_id = university_id_map[uni_name]
-            if not db.session.query(Faculty).filter_by(university_id=uni_id, name=fac_name).first():
-                db.session.add(Faculty(university_id=uni_id, name=fac_name))
-    db.session.commit()
-    print("学部データを登録しました。")
-
-    # --- 4. 参考書マスターデータ ---
-    for task_id, title, desc, yt, weeks, type, url in books_to_seed:
-        if not db.session.query(Book).filter_by(task_id=task_id).first():
-            db.session.add(Book(task_id=task_id, title=title, description=desc, youtube_query=yt, duration_weeks=weeks, task_type=type, url=url))
-    db.session.commit()
-    print("参考書を登録しました。")
-
-    # --- 5. ルート定義 ---
-    subject_id_map = {s.name: s.id for s in db.session.query(Subject).all()}
-    for name, p_type, s_id_or_name in routes_to_seed:
-        subject_id = subject_id_map.get(s_id_or_name) if isinstance(s_id_or_name, str) else s_id_or_name
-        if not db.session.query(Route).filter_by(name=name).first():
-            db.session.add(Route(name=name, plan_type=p_type, subject_id=subject_id))
-    db.session.commit()
-    print("各科目のルートを定義しました。")
-    
-    # --- 6. ルートステップ登録 ---
-    book_id_map = {b.task_id: b.id for b in db.session.query(Book).all()}
-    route_id_map = {r.name: r.id for r in db.session.query(Route).all()}
-    for route_name, task_id, step, level, cat, is_main in route_steps_human_readable:
-        if route_name in route_id_map and task_id in book_id_map:
-            route_id = route_id_map[route_name]
-            book_id = book_id_map[task_id]
-            if not db.session.query(RouteStep).filter_by(route_id=route_id, book_id=book_id, step_order=step).first():
-                db.session.add(RouteStep(route_id=route_id, book_id=book_id, step_order=step, level=level, category=cat, is_main=is_main))
-    db.session.commit()
-    print("全科目のルートステップを登録しました。")
-    
-    # --- 7. 学習戦略データ ---
-    for subject_name, strategy_html in strategy_data.items():
-        if subject_name in subject_id_map:
-            subject_id = subject_id_map[subject_name]
-            if not db.session.query(SubjectStrategy).filter_by(subject_id=subject_id).first():
-                db.session.add(SubjectStrategy(subject_id=subject_id, strategy_html=strategy_html))
-    db.session.commit()
-    print("学習戦略データを登録しました。")
-    
-    # --- 8. 模試マスターデータ ---
-    # provider, name, exam_date, app_start_date, app_end_date, url
-    official_exams_to_seed = [
-        ('河合塾', '第1回 全統共通テスト模試', date(2026, 5, 3), date(2026, 3, 20), date(2026, 4, 22), 'https://www.kawai-juku.ac.jp/moshi/'),
-        ('駿台', '第1回 駿台atama＋共通テスト模試', date(2026, 6, 7), date(2026, 4, 1), date(2026, 5, 28), 'https://www.sundai.ac.jp/moshi/'),
-        ('東進', '第2回 共通テスト本番レベル模試', date(2026, 4, 26), date(2026, 3, 1), date(2026, 4, 23), 'https://www.toshin.com/moshi/'),
-    ]
-
-    for provider, name, exam_d, app_start, app_end, url in official_exams_to_seed:
-        if not db.session.query(OfficialMockExam).filter_by(name=name, exam_date=exam_d).first():
-            db.session.add(OfficialMockExam(
-                provider=provider, name=name, exam_date=exam_d,
-                app_start_date=app_start, app_end_date=app_end, url=url
-            ))
-    db.session.commit()
-    print("模試マスターデータを登録しました。")
-
-    print("データベースに全ての初期データを投入しました。")
\ No newline at end of file
+def _load_ids(db, model, key_columns):
+    """キー → 主キーの辞書を1回のクエリで読み込む"""
+    table = model.__table__
+    primary_key = table.primary_key.columns[0].key
+    columns = [table.c[c] for c in dict.fromkeys([primary_key, *key_columns])]
+    if len(key_columns) == 1:
+        return {r[key_columns[0]]: r[primary_key] for r in db.session.execute(select(*columns)).mappings()}
+    return {tuple(r[c] for c in key_columns): r[primary_key] for r in db.session.execute(select(*columns)).mappings()}
@@ -9,6 +9,7 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:' # ファイルではなくメモリ上のDBを使用
     WTF_CSRF_ENABLED = False # テストではCSRF保護を無効にすると便利
+    LOG_LEVEL = 'WARNING' # リクエストごとのログはテストでは出さない
 
 @pytest.fixture(scope='module')
 def app():
@@ -23,4 +24,107 @@ def app():
 @pytest.fixture()
 def client(app):
     """テスト用のクライアント（仮想ブラウザ）を作成する"""
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+@pytest.fixture(scope='module')
+def make_user(app):
+    """
+    パスワードが 'password' のユーザーを作ってコミットし、返す。
+    subjects には Subject か科目名を渡す（科目名はDBにある科目から探す）
+    """
+    from werkzeug.security import generate_password_hash
+    from app.models import User, Subject
+
+    def make(username, subjects=(), is_admin=False, **overrides):
+        names = [s for s in subjects if isinstance(s, str)]
+        found = db.session.query(Subject).filter(Subject.name.in_(names)).all() if names else []
+        columns = dict(grade='high3', course_type='science', school='テスト大学', faculty='テスト学部',
+                       plan_type='standard', password_hash=generate_password_hash('password', method='pbkdf2:sha256'))
+        columns.update(overrides)
+        user = User(username=username, is_admin=is_admin,
+                    subjects=[s for s in subjects if not isinstance(s, str)] + found, **columns)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+@pytest.fixture()
+def query_budget(app, client):
+    """エンドポイントを呼び出し、発行したSQLの件数と同じ形のSQLの繰り返し回数が上限以内か確認する"""
+    from flask import request_finished
+    from app.sql_instrument import request_sql_stats
+
+    def check(url, max_queries, max_repeats=3, method='get', status=200, **kwargs):
+        recorded = []
+        def on_finished(sender, response, **extra):
+            recorded.append(request_sql_stats())
+        with request_finished.connected_to(on_finished, app):
+            response = getattr(client, method)(url, **kwargs)
+        # リダイレクトやエラーはクエリが少なくても合格にしない
+        assert response.status_code == status, f'{url}: {response.status_code}'
+        stats = recorded[-1]
+        assert stats.count <= max_queries, f'{url}: {stats.report()}'
+        assert not stats.repeated(max_repeats + 1), f'{url}: {stats.report()}'
+        return response
+    return check
+
+@pytest.fixture()
+def exam_site():
+    """
+    保存しておいた模試の公式ページ（tests/fixtures/exam_pages）を返すローカルのHTTPサーバー。
+    本文のハッシュを ETag として返し、If-None-Match が一致すれば 304 を返す（server.directory は差し替えられる）
+    """
+    import hashlib
+    import os
+    import threading
+    import time
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    class Handler(SimpleHTTPRequestHandler):
+        etag = None
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=server.directory, **kwargs)
+
+        def do_GET(self):
+            with server.lock:
+                server.requests.append(self.path)
+                server.active += 1
+                server.peak = max(server.peak, server.active)
+            try:
+                time.sleep(server.delay)
+                path = self.translate_path(self.path)
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        self.etag = '"%s"' % hashlib.sha256(f.read()).hexdigest()[:16]
+                    if self.headers.get('If-None-Match') == self.etag:
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                super().do_GET()
+            finally:
+                with server.lock:
+                    server.active -= 1
+
+        def end_headers(self):
+            if self.etag:
+                self.send_header('ETag', self.etag)
+            super().end_headers()
+
+        def log_request(self, code='-', size='-'):
+            with server.lock:
+                server.responses.append((self.path, int(code)))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.directory = os.path.join(os.path.dirname(__file__), 'fixtures', 'exam_pages')
+    server.lock = threading.Lock()
+    server.requests, server.responses, server.active, server.peak, server.delay = [], [], 0, 0, 0.0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
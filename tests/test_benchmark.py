@@ -0,0 +1,75 @@
+# tests/test_benchmark.py
+
+from app import db
+from app.benchmark import (EndpointBenchmark, TestClientDriver, load_benchmark_users, percentile,
+                           compare_with_baseline, parse_importtime, measure_import_time)
+from app.load_dataset import LoadDatasetGenerator
+from seed_db import seed_database
+
+
+def test_percentile_uses_nearest_rank():
+    """
+    百分位数が最近傍順位法で求められることを確認するテスト
+    """
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_journey_reports_every_endpoint_and_detects_regressions(app):
+    """
+    一連の操作で各エンドポイントが計測され、基準値より遅い・SQLが多い場合に検出されることを確認するテスト
+    """
+    seed_database(db)
+    LoadDatasetGenerator(users=3, seed=1, days=30, exams_per_user=1, password='password').generate()
+    users = load_benchmark_users(app, 2)
+    assert len(users) == 2
+
+    report = EndpointBenchmark(TestClientDriver(app), users, 'password').run(iterations=1, warmup=0)
+    endpoints = report['endpoints']
+    assert {'login', 'dashboard', 'plan_data', 'log_study', 'stats', 'inbox'} <= endpoints.keys()
+    assert all(row['errors'] == 0 for row in endpoints.values())
+    assert endpoints['dashboard']['queries_per_request'] > 0
+
+    assert compare_with_baseline(report, report) == []
+    faster = {'endpoints': {'stats': dict(endpoints['stats'], p95_ms=endpoints['stats']['p95_ms'] / 10,
+                                          queries_per_request=endpoints['stats']['queries_per_request'] - 1)}}
+    regressions = compare_with_baseline(report, faster)
+    assert len(regressions) == 2 and all(r.startswith('stats:') for r in regressions)
+
+
+def test_wrong_password_is_reported_as_errors(app):
+    """
+    パスワードが違ってリダイレクトされたリクエストはエラーとして数えられ、基準値との比較で失敗になることを確認するテスト
+    """
+    users = load_benchmark_users(app, 1)
+    report = EndpointBenchmark(TestClientDriver(app), users, 'wrong-password').run(iterations=1, warmup=0)
+    endpoints = report['endpoints']
+    assert endpoints['login']['errors'] == 1 and endpoints['dashboard']['errors'] == 1
+    regressions = compare_with_baseline(report, report)
+    assert 'login: 1/1 requests returned an unexpected status' in regressions
+
+
+def test_parse_importtime_reads_depth_and_times():
+    """
+    python -X importtime の出力から、モジュール名・時間・入れ子の深さが読み取れることを確認するテスト
+    """
+    text = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _weakref
+import time:       300 |        420 |   weakref
+import time:      1000 |       1420 | app
+"""
+    assert parse_importtime(text) == [('_weakref', 120, 120, 2), ('weakref', 300, 420, 1), ('app', 1000, 1420, 0)]
+
+
+def test_worker_startup_does_not_load_scraper_stack():
+    """
+    アプリの作成時にAI・スクレイピング用のモジュールが読み込まれず、読み込まれたら基準値との比較で検出されることを確認するテスト
+    """
+    report = {'endpoints': {}, 'import_time': measure_import_time(top=5)}
+    assert report['import_time']['lazy_modules_loaded'] == []
+    assert compare_with_baseline(report, report) == []
+
+    report['import_time'] = dict(report['import_time'], lazy_modules_loaded=['bs4'])
+    assert compare_with_baseline(report, {'endpoints': {}}) == ['import: bs4 is loaded at startup']
@@ -0,0 +1,165 @@
+# tests/test_dashboard.py
+
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import Subject, Progress, Book, UserContinuousTaskSelection, UserProgressBitmap
+from app.plan_cache import get_plan_cache
+from app import progress_bitmap
+from app.progress_bitmap import load_completed_task_ids, decode_bits, set_tasks_completed
+from seed_db import seed_database
+
+
+@pytest.fixture(scope='module', autouse=True)
+def seeded(app):
+    """ルートや参考書などの初期データを投入しておく"""
+    seed_database(db)
+
+
+@pytest.fixture()
+def create_user(make_user):
+    """シードデータにある大学・学部を志望するユーザーを作る"""
+    return lambda username, subject_names: make_user(username, subject_names, school='早稲田大学', faculty='理工学部')
+
+
+def _count_dashboard_queries(client, user):
+    client.post('/login', data={'username': user.username, 'password': 'password'})
+    client.get(f'/dashboard/{user.id}') # ルート計画のキャッシュを作成しておく
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(f'/dashboard/{user.id}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_dashboard_query_count_does_not_grow_with_subjects(client, app, create_user):
+    """
+    科目数が増えても、ダッシュボードのクエリ数が変わらないことを確認するテスト
+    """
+    one_subject = create_user('one_subject', ['英語'])
+    many_subjects = create_user('many_subjects', ['英語', '数学', '現代文', '古文', '漢文', '日本史', '物理', '化学'])
+
+    assert _count_dashboard_queries(client, one_subject) == _count_dashboard_queries(app.test_client(), many_subjects)
+
+
+def test_dashboard_shows_next_and_last_completed_task(client, app, create_user):
+    """
+    完了済みのタスクの次の参考書と、直前に完了した参考書が表示されることを確認するテスト
+    """
+    user = create_user('progress_user', ['英語'])
+    english = db.session.query(Subject).filter_by(name='英語').first()
+    db.session.add(Progress(user_id=user.id, task_id='eng_n03', subject_id=english.id, is_completed=1))
+    db.session.commit()
+
+    client.post('/login', data={'username': 'progress_user', 'password': 'password'})
+    response = client.get(f'/dashboard/{user.id}')
+    assert response.status_code == 200
+    assert '関正生の英文法ポラリス1'.encode('utf-8') in response.data
+    assert '大岩のいちばんはじめの英文法'.encode('utf-8') in response.data
+    assert '日東駒専レベルの英単語'.encode('utf-8') in response.data
+
+
+def test_plan_data_uses_compiled_plan(client, app, create_user):
+    """
+    学習マップ用のAPIが、選択肢のあるグループをプレースホルダーとして返すことを確認するテスト
+    """
+    user = create_user('plan_user', ['英語'])
+    client.post('/login', data={'username': 'plan_user', 'password': 'password'})
+    response = client.get(f'/api/plan_data/{user.id}/英語')
+    assert response.status_code == 200
+
+    nodes = response.get_json()['graph_data']['nodes']
+    assert nodes[0]['id'] == 'eng_n03'
+    placeholder = next(node for node in nodes if node['is_placeholder'])
+    assert placeholder['group_id'] == 'eng_m05'
+    assert [c['id'] for c in placeholder['choices']] == ['eng_m05', 'eng_m06']
+    assert response.get_json()['continuous_data']['available_choices']['英単語'][0]['id'] == 'eng_n01'
+
+
+def test_plan_cache_is_rebuilt_when_books_change(app):
+    """
+    参考書が更新されたら、コンパイル済みのルート計画が作り直されることを確認するテスト
+    """
+    cache = get_plan_cache()
+    assert get_plan_cache() is cache
+
+    book = db.session.query(Book).filter_by(task_id='eng_n03').first()
+    book.title = '改訂版タイトル'
+    db.session.commit()
+
+    assert get_plan_cache() is not cache
+    assert get_plan_cache().books_by_task_id['eng_n03'].title == '改訂版タイトル'
+
+
+def test_update_continuous_tasks_resolves_subject_without_queries(client, app, create_user):
+    """
+    継続タスクの選択保存で、参考書・ルートを問い合わせずに科目が決まることを確認するテスト
+    """
+    user = create_user('continuous_user', ['英語'])
+    client.post('/login', data={'username': 'continuous_user', 'password': 'password'})
+    get_plan_cache()
+
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.post(f'/api/update_continuous_tasks/{user.id}',
+                               json={'level': '日東駒専レベル', 'selections': {'英単語': 'eng_n02'}})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.get_json()['success']
+    assert not [s for s in statements if 'FROM books' in s or 'FROM route_steps' in s or 'FROM routes' in s]
+
+    english = db.session.query(Subject).filter_by(name='英語').first()
+    selection = db.session.query(UserContinuousTaskSelection).filter_by(user_id=user.id).one()
+    assert (selection.subject_id, selection.category, selection.selected_task_id) == (english.id, '英単語', 'eng_n02')
+
+
+def test_progress_bitmap_tracks_completed_tasks(client, app, create_user):
+    """
+    進捗の更新でビット列が作られ、progressテーブルと同じ完了タスクを返すことを確認するテスト
+    """
+    user = create_user('bitmap_user', ['英語'])
+    english = db.session.query(Subject).filter_by(name='英語').first()
+    db.session.add(Progress(user_id=user.id, task_id='eng_n03', subject_id=english.id, is_completed=1))
+    db.session.commit()
+    assert db.session.get(UserProgressBitmap, user.id) is None
+    assert load_completed_task_ids(user.id) == {'eng_n03'}
+
+    client.post('/login', data={'username': 'bitmap_user', 'password': 'password'})
+    client.post('/api/update_progress_batch', json={'changes': [
+        {'task_id': 'eng_n04', 'subject_id': english.id, 'is_completed': True},
+        {'task_id': 'eng_n03', 'subject_id': english.id, 'is_completed': False},
+    ]})
+    bitmap = db.session.get(UserProgressBitmap, user.id)
+    assert bitmap is not None
+    assert decode_bits(bitmap.bits) == {db.session.query(Book).filter_by(task_id='eng_n04').first().id}
+    assert load_completed_task_ids(user.id) == {'eng_n04'}
+
+
+def test_first_bitmap_write_survives_a_concurrent_first_write(app, monkeypatch, create_user):
+    """
+    ビット列の行が無いことを確認した直後に別のリクエストが行を作っても、主キーの重複にならず今回の変更が反映されることを確認するテスト
+    """
+    user = create_user('bitmap_race_user', ['英語'])
+    english = db.session.query(Subject).filter_by(name='英語').first()
+    db.session.add(Progress(user_id=user.id, task_id='eng_n04', subject_id=english.id, is_completed=1))
+    db.session.flush()
+    bits_from_progress = progress_bitmap._bits_from_progress
+
+    def other_request_creates_row_first(user_id):
+        # 別のリクエストが、今回の変更を含まないビット列で先に行を作った
+        db.session.execute(UserProgressBitmap.__table__.insert().values(user_id=user_id, bits=b''))
+        return bits_from_progress(user_id)
+    monkeypatch.setattr(progress_bitmap, '_bits_from_progress', other_request_creates_row_first)
+
+    row = set_tasks_completed(user.id, {'eng_n04': True})
+    db.session.commit()
+    assert decode_bits(row.bits) == {db.session.query(Book).filter_by(task_id='eng_n04').first().id}
+    assert load_completed_task_ids(user.id) == {'eng_n04'}
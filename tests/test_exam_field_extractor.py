@@ -0,0 +1,81 @@
+# tests/test_exam_field_extractor.py
+
+import json
+import os
+from datetime import date
+import pytest
+from app.exam_field_extractor import extract_exam_fields, unresolved_fields
+from app.exam_scraper import ExamDetailsExtractor, FakeModel, page_text, extract_exam_details_from_text
+
+PAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'exam_pages')
+TODAY = date(2026, 2, 1)
+
+
+def _load_expected():
+    with open(os.path.join(PAGES, 'expected_fields.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    expected.pop('_today')
+    return expected
+
+
+def _page(path):
+    with open(os.path.join(PAGES, path), 'rb') as f:
+        return page_text(f.read())
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('第1回 全統共通テスト模試 実施日 2026年5月3日(日)', {'exam_date': '2026-05-03'}),
+    ('第1回 全統共通テスト模試 実施日：２０２６年５月３日（日）', {'exam_date': '2026-05-03'}),
+    ('第1回 全統共通テスト模試 試験日 5/3(日)', {'exam_date': '2026-05-03'}),
+    ('第1回 全統共通テスト模試 実施日 令和8年5月3日', {'exam_date': '2026-05-03'}),
+    ('第1回 全統共通テスト模試 実施日 2026年5月3日 申込期間 3月20日～4月22日',
+     {'exam_date': '2026-05-03', 'app_start_date': '2026-03-20', 'app_end_date': '2026-04-22'}),
+    # 年をまたぐ申込期間
+    ('第3回 全統模試 実施日 2027年1月10日 申込期間 11月20日〜1月5日',
+     {'exam_date': '2027-01-10', 'app_start_date': '2026-11-20', 'app_end_date': '2027-01-05'}),
+    # 書かれた曜日と合わない日付は読み取らない
+    ('第1回 全統共通テスト模試 実施日 2026年5月3日(月)', {'exam_date': None}),
+])
+def test_date_forms(text, expected):
+    """
+    よくある日付の書き方（西暦・月/日・令和・全角・申込期間の範囲）が読み取れることを確認するテスト
+    """
+    fields = extract_exam_fields(text, today=TODAY)
+    assert {key: fields[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize('path', sorted(_load_expected()))
+def test_saved_pages(path):
+    """
+    保存しておいた公式ページから、期待どおりの項目が読み取れることを確認するテスト（回帰テスト）
+    """
+    expected = dict(_load_expected()[path])
+    provider = expected.pop('provider')
+    assert extract_exam_fields(_page(path), provider, today=TODAY) == expected
+
+
+def test_only_unresolved_pages_go_to_ai():
+    """
+    規則で読み取れたページではAIを呼ばず、実施日が決まらないページだけAIに任せて残りを補うことを確認するテスト
+    """
+    model = FakeModel(lambda prompt: '```json\n{"name": "AIの模試名", "exam_date": "2026-08-30", "app_end_date": null}\n```')
+    extractor = ExamDetailsExtractor(model, today=TODAY)
+
+    assert extractor(_page('kawai/zento_kyotsu_1.html'), '河合塾')['exam_date'] == '2026-05-03'
+    assert extractor(_page('toshin/honban_2.html'), '東進')['app_end_date'] == '2026-04-23'
+    assert model.prompts == []
+
+    ambiguous = _page('kawai/zento_kyotsu_2.html')
+    assert unresolved_fields(ambiguous, extract_exam_fields(ambiguous, '河合塾', today=TODAY)) == ['exam_date']
+    details = extractor(ambiguous, '河合塾')
+    assert details['name'] == '第2回 全統共通テスト模試'
+    assert details['exam_date'] == '2026-08-30'
+    assert (extractor.rule_only, extractor.ai_calls, len(model.prompts)) == (2, 1, 1)
+
+
+def test_ai_answer_without_code_fence_is_parsed():
+    """
+    AIの応答が ```json で囲まれていない素のJSONでも、抽出結果として読み取れることを確認するテスト
+    """
+    model = FakeModel(lambda prompt: '{"name": "AIの模試名", "exam_date": "2026-08-30"}')
+    assert extract_exam_details_from_text('本文', '河合塾', model=model) == {'name': 'AIの模試名', 'exam_date': '2026-08-30'}
@@ -0,0 +1,157 @@
+# tests/test_exam_scraper.py
+
+import re
+import shutil
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import OfficialMockExam, CrawlPage
+from app.crawl_frontier import CrawlFrontier
+from app.exam_scraper import (ExamScrapePipeline, HostSessions, LinkClassifier, ClassificationCache, FakeModel,
+                              canonical_url, save_official_exams)
+
+
+def fake_extract(text, provider):
+    """AIの代わりに、保存したページの見出しと西暦の実施日だけを読み取る"""
+    name = re.search(r'(第\d回 \S+模試)', text).group(1)
+    found = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', text)
+    exam_date = date(*map(int, found.groups())).isoformat() if found else '2026-06-07'
+    return {'name': name, 'exam_date': exam_date, 'target_grade': '高3・卒', 'app_start_date': None}
+
+
+def test_pipeline_scrapes_listing_pages_politely(app, exam_site):
+    """
+    一覧ページから模試のページだけを取得して抽出し、同じホストへの同時接続数の上限とURLの重複除去が守られることを確認するテスト
+    """
+    exam_site.delay = 0.05
+    fetcher = HostSessions(max_per_host=2, min_interval=0)
+    pipeline = ExamScrapePipeline(fetcher, LinkClassifier(FakeModel()), fake_extract, workers=8)
+    rows = pipeline.run({'河合塾': f'{exam_site.url}/kawai/index.html', '駿台': f'{exam_site.url}/sundai/index.html'})
+    # 同じホストへの接続は1つの Session で使い回す
+    assert len(fetcher.hosts) == 1
+    fetcher.close()
+
+    assert pipeline.errors == []
+    assert sorted((r['provider'], r['name']) for r in rows) == [
+        ('河合塾', '第1回 全統共通テスト模試'), ('河合塾', '第1回 全統記述模試'), ('駿台', '第1回 駿台atama＋共通テスト模試')]
+    # 重複したリンク・ページ内リンク・案内ページは取得しない
+    assert sorted(exam_site.requests) == ['/kawai/index.html', '/kawai/zento_kijutsu_1.html', '/kawai/zento_kyotsu_1.html',
+                                          '/sundai/atama_kyotsu_1.html', '/sundai/index.html']
+    assert 1 < exam_site.peak <= 2
+
+    assert save_official_exams(rows) == 3
+    # もう一度保存しても行は増えず、変わった値だけが更新される
+    rows[0]['target_grade'] = '高2'
+    assert save_official_exams(rows) == 3
+    assert db.session.query(OfficialMockExam).count() == 3
+    assert db.session.query(OfficialMockExam).filter_by(name=rows[0]['name']).one().target_grade == '高2'
+
+
+def test_failed_pages_are_reported_without_stopping(app, exam_site):
+    """
+    取得できないページがあっても、他のページの処理は続き、失敗したURLが記録されることを確認するテスト
+    """
+    fetcher = HostSessions(min_interval=0)
+    pipeline = ExamScrapePipeline(fetcher, LinkClassifier(FakeModel()), fake_extract)
+    rows = pipeline.run({'河合塾': f'{exam_site.url}/kawai/index.html', '東進': f'{exam_site.url}/toshin/index.html'})
+    fetcher.close()
+
+    assert len(rows) == 2
+    assert [url for url, _ in pipeline.errors] == [f'{exam_site.url}/toshin/index.html']
+
+
+def test_canonical_url_removes_noise():
+    """
+    同じページを指すURLが、1つの形にそろえられることを確認するテスト
+    """
+    assert canonical_url('HTTPS://Www.Example.jp:443/moshi/a.html?utm_source=x&b=2&a=1#top') == \
+        'https://www.example.jp/moshi/a.html?a=1&b=2'
+    assert canonical_url('../b.html', base='http://example.jp/moshi/a/index.html') == 'http://example.jp/moshi/b.html'
+    assert canonical_url('mailto:moshi@example.jp') is None
+
+
+def test_links_are_classified_in_batches_and_cached_on_disk(tmp_path):
+    """
+    リンクがまとめて判定され、判定結果がファイルに保存されて次回はAIを呼ばないことを確認するテスト
+    """
+    links = [(f'第{i}回 全統模試', f'https://example.jp/moshi/{i}.html') for i in range(1, 6)] + \
+        [('お申し込み方法', 'https://example.jp/moshi/guide.html')]
+    model = FakeModel()
+    cache = ClassificationCache(str(tmp_path / 'links.sqlite3'))
+    assert LinkClassifier(model, cache, batch_size=4).classify_links(links) == [True] * 5 + [False]
+    assert len(model.prompts) == 2
+    cache.close()
+
+    # 別のプロセスを想定して開き直しても、保存済みの結果だけで判定できる（URLの表記ゆれも同じものとして扱う）
+    model = FakeModel()
+    cache = ClassificationCache(str(tmp_path / 'links.sqlite3'))
+    again = links[:2] + [('第9回 全統模試', 'https://example.jp/moshi/9.html')] + [(links[2][0], links[2][1] + '#top')]
+    assert LinkClassifier(model, cache).classify_links(again) == [True] * 4
+    assert len(model.prompts) == 1 and '9.html' in model.prompts[0] and '1.html' not in model.prompts[0]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_broken_model_response_is_not_cached(tmp_path):
+    """
+    AIの応答が壊れていたリンクは模試ではない扱いになり、保存されずに次回もう一度判定されることを確認するテスト
+    """
+    cache = ClassificationCache(str(tmp_path / 'links.sqlite3'))
+    links = [('第1回 全統模試', 'https://example.jp/moshi/1.html')]
+    assert LinkClassifier(FakeModel(lambda prompt: 'はい'), cache).classify_links(links) == [False]
+    model = FakeModel()
+    assert LinkClassifier(model, cache).classify_links(links) == [True]
+    assert len(model.prompts) == 1
+
+
+def test_frontier_revisits_only_due_and_changed_pages(app, exam_site, tmp_path):
+    """
+    2回目以降は期限の来たページだけを条件付きGETで取得し、304 や内容が同じページはAIでの判定も抽出もせず、
+    一覧ページに増えたリンクだけを判定・取得することを確認するテスト
+    """
+    shutil.copytree(exam_site.directory, tmp_path / 'site')
+    exam_site.directory = str(tmp_path / 'site')
+    listing = f'{exam_site.url}/kawai/index.html'
+    started = datetime(2026, 4, 1, 9, 0)
+    db.session.query(CrawlPage).delete()
+
+    def crawl(days):
+        model, extracted = FakeModel(), []
+
+        def extract(text, provider):
+            extracted.append(text)
+            return fake_extract(text, provider)
+        exam_site.responses.clear()
+        fetcher = HostSessions(min_interval=0)
+        frontier = CrawlFrontier(clock=lambda: started + timedelta(days=days))
+        pipeline = ExamScrapePipeline(fetcher, LinkClassifier(model), extract, frontier=frontier)
+        rows = pipeline.run({'河合塾': listing})
+        fetcher.close()
+        db.session.commit()
+        assert pipeline.errors == []
+        return rows, model, extracted, sorted(exam_site.responses)
+
+    rows, model, extracted, responses = crawl(0)
+    assert len(rows) == 2 and len(model.prompts) == 1
+    assert responses == [('/kawai/index.html', 200), ('/kawai/zento_kijutsu_1.html', 200),
+                         ('/kawai/zento_kyotsu_1.html', 200)]
+    page = db.session.query(CrawlPage).filter_by(url=listing).one()
+    assert page.etag and page.content_hash and page.next_fetch_at == started + timedelta(days=1)
+
+    # 一覧ページだけ期限が来ていて、変わっていないので 304 で終わる
+    rows, model, extracted, responses = crawl(2)
+    assert (rows, model.prompts, extracted) == ([], [], [])
+    assert responses == [('/kawai/index.html', 304)]
+
+    # 一覧ページに模試が増えたら、増えたリンクだけを判定して取得する
+    index = tmp_path / 'site' / 'kawai' / 'index.html'
+    index.write_text(index.read_text(encoding='utf-8').replace(
+        '</ul>', '  <li><a href="zento_kyotsu_2.html">第2回 全統共通テスト模試</a></li>\n  </ul>', 1), encoding='utf-8')
+    rows, model, extracted, responses = crawl(4)
+    assert [row['url'] for row in rows] == [f'{exam_site.url}/kawai/zento_kyotsu_2.html']
+    assert len(model.prompts) == 1 and 'zento_kyotsu_2.html' in model.prompts[0] and 'zento_kyotsu_1' not in model.prompts[0]
+    assert responses == [('/kawai/index.html', 200), ('/kawai/zento_kyotsu_2.html', 200)]
+
+    # 最初に取得した詳細ページは1週間後に見直すが、変わっていなければ抽出しない
+    rows, model, extracted, responses = crawl(8)
+    assert (rows, model.prompts, extracted) == ([], [], [])
+    assert responses == [('/kawai/index.html', 304), ('/kawai/zento_kijutsu_1.html', 304),
+                         ('/kawai/zento_kyotsu_1.html', 304)]
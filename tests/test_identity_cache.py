@@ -0,0 +1,101 @@
+# tests/test_identity_cache.py
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import db
+from app.models import User, Subject
+
+
+@pytest.fixture(scope='module')
+def user(app, make_user):
+    db.session.add(Subject(name='数学'))
+    return make_user('identity_user', [Subject(name='英語')]).id
+
+
+def _user_statements(app, client, url, **kwargs):
+    """本番と同じく新しいアプリのコンテキスト（空のセッション）で url を呼び出し、users・user_subjects へのクエリを返す"""
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement or 'user_subjects' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        with app.app_context():
+            response = client.post(url, **kwargs) if 'data' in kwargs else client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, url
+    return statements
+
+
+def _only_version_check(statements):
+    """保持している値を使い、identity_version の確認だけを発行した"""
+    return len(statements) == 1 and 'identity_version' in statements[0] and 'user_subjects' not in statements[0]
+
+
+def test_identity_is_reused_until_settings_change(app, client, user):
+    """
+    2回目以降のリクエストではバージョンの確認しか発行されず、設定を変えると次のリクエストで読み直されることを確認するテスト
+    """
+    client.post('/login', data={'username': 'identity_user', 'password': 'password'})
+    assert _user_statements(app, client, '/inbox')
+    assert _only_version_check(_user_statements(app, client, '/inbox'))
+
+    math = db.session.query(Subject).filter_by(name='数学').first()
+    _user_statements(app, client, f'/settings/{user}', data={
+        'username': 'identity_user', 'grade': 'ronin', 'course_type': 'science', 'school': 'テスト大学',
+        'faculty': 'テスト学部', 'subjects': [str(math.id)]})
+    assert _user_statements(app, client, '/inbox')
+    assert _only_version_check(_user_statements(app, client, '/inbox'))
+    with app.app_context():
+        page = client.get(f'/dashboard/{user}').get_data(as_text=True)
+    assert '数学' in page and '英語' not in page
+
+    # 保持している値から作った User への変更も、そのまま保存される
+    with app.app_context():
+        client.post(f'/quiz/{user}/submit', data={f'q{i}': 'A' for i in range(1, 11)})
+    db.session.expire_all()
+    assert db.session.get(User, user).learning_style == '視覚優位タイプ'
+    assert _user_statements(app, client, '/inbox')
+
+
+def test_password_change_checks_latest_hash(app, client, user):
+    """
+    他のワーカーでパスワードが変わっていても、パスワード変更は最新のハッシュで確認されることを確認するテスト
+    """
+    client.post('/login', data={'username': 'identity_user', 'password': 'password'})
+    _user_statements(app, client, '/inbox')
+
+    # 別プロセスでの変更を想定し、キャッシュには触れずにDBだけ書き換える
+    db.session.query(User).filter_by(id=user).update({'password_hash': generate_password_hash('changed', method='pbkdf2:sha256')})
+    db.session.commit()
+
+    _user_statements(app, client, f'/change_password/{user}', data={
+        'current_password': 'changed', 'new_password': 'newer', 'confirm_password': 'newer'})
+    db.session.expire_all()
+    assert check_password_hash(db.session.get(User, user).password_hash, 'newer')
+    assert _user_statements(app, client, '/inbox')
+
+
+def test_change_in_another_worker_is_noticed(app, client, user):
+    """
+    他のワーカーで管理者の権限などが変わると、このワーカーの保持している値は使われずに読み直されることを確認するテスト
+    """
+    db.session.get(User, user).password_hash = generate_password_hash('password', method='pbkdf2:sha256')
+    db.session.commit()
+    client.post('/login', data={'username': 'identity_user', 'password': 'password'})
+    _user_statements(app, client, '/inbox')
+    assert _only_version_check(_user_statements(app, client, '/inbox'))
+
+    # 別プロセスでの変更を想定し、キャッシュには触れずにORMでDBだけ書き換える
+    other = db.session.get(User, user)
+    version = other.identity_version
+    other.is_admin = True
+    db.session.commit()
+    assert db.session.get(User, user).identity_version == version + 1
+
+    statements = _user_statements(app, client, '/inbox')
+    assert any('user_subjects' in statement for statement in statements)
+    with app.app_context():
+        assert client.get('/admin/admin/exams').status_code == 200
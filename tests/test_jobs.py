@@ -0,0 +1,128 @@
+# tests/test_jobs.py
+
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import Job
+from app import exam_scraper
+from app import jobs
+from app.jobs import job_handler, enqueue, claim_job, run_job, run_worker, JOB_LEASE, QUEUED, RUNNING, FAILED
+
+
+flaky_calls = []
+
+
+@job_handler('test_flaky')
+def flaky_job(progress, fail_times=0):
+    """fail_times 回目までの呼び出しは失敗する"""
+    flaky_calls.append(fail_times)
+    if len(flaky_calls) <= fail_times:
+        raise RuntimeError('一時的な失敗')
+    return {'calls': len(flaky_calls)}
+
+
+@job_handler('test_slow')
+def slow_job(progress, seconds=0.3):
+    """進捗を報告せずに時間のかかる処理"""
+    time.sleep(seconds)
+    return {'locked_at': db.session.query(Job.locked_at).filter(Job.status == RUNNING).scalar()}
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(app):
+    """前のテストで積んだジョブを、ワーカーが実行しないように消しておく"""
+    db.session.query(Job).delete()
+    db.session.commit()
+    # SQLiteでは消したジョブのIDが振り直されるので、前のテストで読み込んだ Job をセッションに残さない
+    db.session.expunge_all()
+
+
+@pytest.fixture(scope='module')
+def admin(make_user):
+    return make_user('jobs_admin', is_admin=True)
+
+
+def test_admin_refresh_is_queued_once_and_polled(client, admin, monkeypatch):
+    """
+    管理画面からの更新はリクエスト中には実行せずにジョブとして1件だけ積まれ、ワーカーが実行した結果をポーリングで確認できることを確認するテスト
+    """
+    def fake_refresh(providers, cache_path=None, on_progress=None):
+        on_progress(3, 3)
+        return [], {'exams': 2, 'saved': 2, 'errors': 0, 'changed': 3, 'unchanged': 0, 'not_modified': 0}
+    monkeypatch.setattr(exam_scraper, 'refresh_official_exams', fake_refresh)
+    client.post('/login', data={'username': 'jobs_admin', 'password': 'password'})
+
+    response = client.post('/admin/admin/exams/refresh')
+    assert response.status_code == 302
+    # 実行待ちの間にもう一度押しても、同じジョブを返す
+    client.post('/admin/admin/exams/refresh')
+    job = db.session.query(Job).filter_by(kind='refresh_official_exams').one()
+    status = client.get(f'/admin/admin/jobs/{job.id}').get_json()
+    assert (status['status'], status['finished']) == ('queued', False)
+    assert 'aria-busy' in client.get('/admin/admin/exams').get_data(as_text=True)
+
+    assert run_worker(once=True) == 1
+    status = client.get(f'/admin/admin/jobs/{job.id}').get_json()
+    assert (status['status'], status['finished'], status['attempts']) == ('succeeded', True, 1)
+    assert (status['progress_done'], status['progress_total']) == (3, 3)
+    assert status['result']['saved'] == 2
+
+    # 終わったジョブは重複除去の対象にならない
+    client.post('/admin/admin/exams/refresh')
+    assert db.session.query(Job).filter_by(kind='refresh_official_exams').count() == 2
+    assert client.get('/admin/admin/jobs/999999').status_code == 404
+
+
+def test_failed_job_is_retried_with_backoff_then_marked_failed(app):
+    """
+    失敗したジョブは待ち時間を延ばしながら再実行され、回数の上限に達したら失敗になることを確認するテスト
+    """
+    flaky_calls.clear()
+    job = enqueue('test_flaky', {'fail_times': 5}, dedupe_key='test_flaky', max_attempts=2)
+    started = datetime.utcnow()
+
+    assert run_worker(once=True) == 1
+    db.session.refresh(job)
+    assert (job.status, job.attempts, job.dedupe_key) == (QUEUED, 1, 'test_flaky')
+    assert job.run_at >= started + timedelta(seconds=30) and '一時的な失敗' in job.last_error
+    # 待ち時間が過ぎるまでは実行されない
+    assert run_worker(once=True) == 0
+
+    claimed = claim_job('test-worker', now=job.run_at)
+    assert claimed.id == job.id and claimed.attempts == 2
+    assert run_job(claimed) is False
+    db.session.refresh(job)
+    assert (job.status, job.dedupe_key) == (FAILED, None)
+    assert claim_job('test-worker', now=datetime.utcnow() + timedelta(days=1)) is None
+    assert len(flaky_calls) == 2
+
+
+def test_stale_running_job_is_taken_over(app):
+    """
+    ワーカーが落ちて進捗の更新が途絶えた実行中のジョブは、他のワーカーが取り直すことを確認するテスト
+    """
+    flaky_calls.clear()
+    job = enqueue('test_flaky')
+    now = datetime.utcnow()
+    assert claim_job('crashed-worker', now=now).id == job.id
+    assert claim_job('other-worker', now=now + timedelta(minutes=1)) is None
+
+    taken = claim_job('other-worker', now=now + JOB_LEASE + timedelta(minutes=1))
+    assert (taken.id, taken.status, taken.locked_by, taken.attempts) == (job.id, RUNNING, 'other-worker', 2)
+    assert run_job(taken) is True
+    assert json.loads(db.session.get(Job, job.id).result) == {'calls': 1}
+
+
+def test_running_job_keeps_its_lease_without_progress(app, monkeypatch):
+    """
+    進捗を報告しない処理でも、実行中は更新時刻が書き込まれ、他のワーカーに取り直されないことを確認するテスト
+    """
+    monkeypatch.setattr(jobs, 'JOB_HEARTBEAT', timedelta(seconds=0.05))
+    job = enqueue('test_slow')
+    claimed = claim_job('busy-worker')
+    claimed_at = claimed.locked_at
+    assert run_job(claimed) is True
+    locked_at = datetime.fromisoformat(json.loads(db.session.get(Job, job.id).result)['locked_at'])
+    assert locked_at > claimed_at
@@ -0,0 +1,60 @@
+# tests/test_load_dataset.py
+
+import pytest
+from werkzeug.security import check_password_hash
+from app import db
+from app.models import User, Progress, StudyLog, StudyDailyRollup, MockExam, Inquiry, Reply
+from app.load_dataset import LoadDatasetGenerator
+from app.progress_bitmap import load_completed_task_ids
+from seed_db import seed_database
+
+
+@pytest.fixture(scope='module')
+def generated(app):
+    seed_database(db)
+    generator = LoadDatasetGenerator(users=6, seed=7, days=60, batch_size=4, inquiry_rate=0.5, password='password')
+    generator.generate()
+    return generator
+
+
+def test_generated_data_is_consistent(generated):
+    """
+    一括で作ったデータで、集計・ビット列が元の行と一致していることを確認するテスト
+    """
+    assert db.session.query(User).count() == 6
+    # 管理者は指定しない限り作らない（返信する管理者がいないので、返信も作らない）
+    assert db.session.query(User).filter_by(is_admin=True).count() == 0
+    assert db.session.query(Reply).count() == 0
+    assert generated.row_counts['study_logs'] == db.session.query(StudyLog).count() > 0
+    assert db.session.query(db.func.sum(StudyLog.duration_minutes)).scalar() == \
+        db.session.query(db.func.sum(StudyDailyRollup.minutes)).scalar()
+    assert db.session.query(MockExam).count() == 6 * 4
+
+    for user in db.session.query(User):
+        completed = {p.task_id for p in db.session.query(Progress).filter_by(user_id=user.id)}
+        assert load_completed_task_ids(user.id) == completed
+
+
+def test_generated_user_can_use_dashboard(client, generated):
+    """
+    作成したユーザーでログインし、ダッシュボードと統計ページが表示できることを確認するテスト
+    """
+    user = db.session.query(User).filter_by(is_admin=False).first()
+    client.post('/login', data={'username': user.username, 'password': 'password'})
+    assert client.get(f'/dashboard/{user.id}').status_code == 200
+    assert client.get(f'/stats/{user.id}').status_code == 200
+
+
+def test_password_is_random_and_admin_is_opt_in(app, generated):
+    """
+    パスワードを指定しなければ乱数で作られ、管理者は管理者のパスワードを指定したときだけ作られることを確認するテスト
+    """
+    assert LoadDatasetGenerator(users=1).password != LoadDatasetGenerator(users=1).password
+
+    generator = LoadDatasetGenerator(users=2, seed=3, days=30, inquiry_rate=1.0, admin_password='admin-secret')
+    generator.generate()
+    admin = db.session.query(User).filter_by(is_admin=True).one()
+    assert check_password_hash(admin.password_hash, 'admin-secret')
+    assert not check_password_hash(admin.password_hash, generator.password)
+    assert db.session.query(Reply).filter(Reply.admin_id != admin.id).count() == 0
+    assert db.session.query(Inquiry).count() > 0
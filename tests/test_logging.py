@@ -0,0 +1,82 @@
+# tests/test_logging.py
+
+import json
+import logging
+import sys
+from flask import g
+from app import db
+from app.structured_logging import JsonFormatter, RequestContextFilter, DebugSamplingFilter
+from seed_db import seed_database
+
+
+def _record(level=logging.INFO, **extra):
+    record = logging.LogRecord('univ_app.main', level, __file__, 1, 'progress batch', (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_record_has_request_id_and_extra_fields(app):
+    """
+    リクエスト中のログが、リクエストIDと extra の値を含む1行のJSONになることを確認するテスト
+    """
+    with app.test_request_context('/api/update_progress_batch', method='POST'):
+        g.request_id = 'abc123'
+        record = _record(updated=3)
+        RequestContextFilter().filter(record)
+        payload = json.loads(JsonFormatter().format(record))
+    assert payload['request_id'] == 'abc123'
+    assert payload['path'] == '/api/update_progress_batch'
+    assert payload['logger'] == 'univ_app.main'
+    assert payload['updated'] == 3
+
+
+def test_exception_is_kept_apart_from_message_through_the_queue(app):
+    """
+    exc_info=True のログがキューを通っても、トレースバックが message ではなく exc_info の項目に出力されることを確認するテスト
+    """
+    queue_handler = logging.getLogger('univ_app').handlers[0]
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = _record(logging.ERROR)
+        record.exc_info = sys.exc_info()
+    payload = json.loads(JsonFormatter().format(queue_handler.prepare(record)))
+    assert payload['message'] == 'progress batch'
+    assert 'ZeroDivisionError' in payload['exc_info'] and payload['exc_info'].startswith('Traceback')
+
+
+def test_debug_records_are_sampled():
+    """
+    DEBUGのレコードだけが割合に応じて間引かれることを確認するテスト
+    """
+    never = DebugSamplingFilter(0.0)
+    assert not never.filter(_record(logging.DEBUG))
+    assert never.filter(_record(logging.INFO))
+    assert DebugSamplingFilter(1.0).filter(_record(logging.DEBUG))
+
+
+def test_dashboard_does_not_print_and_echoes_request_id(client, app, capsys, make_user):
+    """
+    ダッシュボードが標準出力に何も書かず、レスポンスにリクエストIDが付くことを確認するテスト
+    """
+    seed_database(db)
+    user = make_user('log_user', ['英語', '数学'], school='早稲田大学', faculty='理工学部')
+    capsys.readouterr()
+
+    client.post('/login', data={'username': 'log_user', 'password': 'password'})
+    response = client.get(f'/dashboard/{user.id}', headers={'X-Request-ID': 'req-1'})
+    assert response.status_code == 200
+    assert response.headers['X-Request-ID'] == 'req-1'
+    assert capsys.readouterr().out == ''
+
+
+def test_failed_login_does_not_log_the_username(client, caplog):
+    """
+    ログインの失敗は、入力されたユーザー名を含めずに記録されることを確認するテスト
+    """
+    # univ_app のロガーはルートに伝播しないので、caplog をロガーを指定して使う
+    with caplog.at_level(logging.INFO, logger='univ_app.auth'):
+        client.post('/login', data={'username': 'someone@example.com', 'password': 'wrong'})
+    records = [r for r in caplog.records if r.getMessage() == 'login failed']
+    assert records
+    assert all('someone@example.com' not in json.dumps(r.__dict__, default=str) for r in records)
@@ -0,0 +1,38 @@
+# tests/test_progress.py
+
+import pytest
+from app import db
+from app.models import Subject, Progress
+
+
+@pytest.fixture(scope='module')
+def user(make_user):
+    return make_user('progress_batch', [Subject(name='英語')])
+
+
+def _progress(user):
+    return {p.task_id: p.is_completed for p in db.session.query(Progress).filter_by(user_id=user.id)}
+
+
+def test_batch_update_upserts_all_changes(client, user):
+    """
+    まとめて送った進捗の変更が、重複なく1ユーザー1タスク1行で保存されることを確認するテスト
+    """
+    subject_id = user.subjects[0].id
+    client.post('/login', data={'username': 'progress_batch', 'password': 'password'})
+    client.post('/api/update_progress', json={'task_id': 'eng_n03', 'subject_id': subject_id, 'is_completed': True})
+
+    response = client.post('/api/update_progress_batch', json={'changes': [
+        {'task_id': 'eng_n03', 'subject_id': subject_id, 'is_completed': False},
+        {'task_id': 'eng_n04', 'subject_id': subject_id, 'is_completed': False},
+        {'task_id': 'eng_n04', 'subject_id': subject_id, 'is_completed': True},
+    ]})
+    assert response.get_json() == {'success': True, 'updated': 2}
+    assert _progress(user) == {'eng_n03': 0, 'eng_n04': 1}
+    assert db.session.query(Progress).filter_by(user_id=user.id).count() == 2
+
+
+def test_batch_update_rejects_invalid_changes(client, user):
+    client.post('/login', data={'username': 'progress_batch', 'password': 'password'})
+    assert client.post('/api/update_progress_batch', json={'changes': []}).status_code == 400
+    assert client.post('/api/update_progress_batch', json={'changes': [{'task_id': 'eng_n05', 'is_completed': True}]}).status_code == 400
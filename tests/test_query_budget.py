@@ -0,0 +1,109 @@
+# tests/test_query_budget.py
+
+from datetime import date, timedelta
+import pytest
+from app import db
+from app.models import Subject, Progress, StudyLog, Inquiry, Reply
+from app.study_rollup import backfill_study_rollup
+from app.sql_instrument import fingerprint, SqlStats
+from seed_db import seed_database
+
+
+@pytest.fixture(scope='module')
+def users(app, make_user):
+    seed_database(db)
+    # シードデータにある科目だけを使う（無い科目だと、科目ごとのクエリの経路を通らない）
+    subjects = db.session.query(Subject).filter(Subject.name.in_(['英語', '数学', '現代文'])).order_by(Subject.id).all()
+    assert len(subjects) == 3
+    student = make_user('budget_user', subjects, school='早稲田大学', faculty='理工学部')
+    admin = make_user('budget_admin', is_admin=True, school='早稲田大学', faculty='理工学部')
+
+    english = subjects[0]
+    db.session.add(Progress(user_id=student.id, task_id='eng_n03', subject_id=english.id, is_completed=1))
+    for days_ago in range(30):
+        for subject in subjects:
+            db.session.add(StudyLog(user_id=student.id, subject_id=subject.id, date=date.today() - timedelta(days=days_ago),
+                                    duration_minutes=30, comment='がんばった'))
+    for i in range(5):
+        inquiry = Inquiry(user_id=student.id, name=student.username, message=f'質問{i}')
+        db.session.add(inquiry)
+        db.session.flush()
+        db.session.add(Reply(inquiry_id=inquiry.id, admin_id=admin.id, message=f'回答{i}'))
+    db.session.commit()
+    backfill_study_rollup(student.id)
+    return student, admin
+
+
+# 上限は、参照データのキャッシュが温まった状態での現在の件数に合わせてある。
+# 件数がデータ量に比例しないことを確かめるため、記録・お問い合わせは複数件入れている
+USER_BUDGETS = {
+    '/dashboard/{id}': 7,
+    '/api/plan_data/{id}/英語': 5,
+    '/stats/{id}': 5,
+    '/inbox': 2,
+}
+
+ADMIN_BUDGETS = {
+    '/admin/admin/users': 1,
+    '/admin/admin/inquiries': 1,
+    '/admin/admin/universities': 1,
+    '/admin/admin/exams': 2,  # 模試の一覧と、公式ページからの更新のジョブの状態
+    '/admin/admin/faqs': 1,
+}
+
+
+def test_user_endpoints_stay_within_query_budget(client, users, query_budget):
+    """
+    ユーザー向けの主要なエンドポイントが、決められた件数以内のSQLで応答することを確認するテスト
+    """
+    student, _ = users
+    client.post('/login', data={'username': 'budget_user', 'password': 'password'})
+    urls = {url.format(id=student.id): budget for url, budget in USER_BUDGETS.items()}
+    for url in urls:
+        client.get(url)
+    for url, budget in urls.items():
+        query_budget(url, budget)
+
+def test_admin_lists_stay_within_query_budget(client, users, query_budget):
+    """
+    管理画面の一覧ページが、件数に比例しないSQLで応答することを確認するテスト
+    """
+    client.post('/login', data={'username': 'budget_admin', 'password': 'password'})
+    for url in ADMIN_BUDGETS:
+        client.get(url)
+    for url, budget in ADMIN_BUDGETS.items():
+        query_budget(url, budget)
+
+
+def test_fingerprint_ignores_parameters_and_in_list_size():
+    """
+    値やINの要素数だけが違うSQLが、同じ形として数えられることを確認するテスト
+    """
+    assert fingerprint("SELECT * FROM books WHERE id IN (?, ?, ?)") == fingerprint("SELECT *  FROM books\nWHERE id IN (?, ?)")
+    assert fingerprint("SELECT * FROM books WHERE id = 3") == fingerprint("SELECT * FROM books WHERE id = 12")
+
+
+def test_statements_are_kept_only_when_asked():
+    """
+    件数と時間は常に数え、SQLの文は残すよう指定したときだけ残して形を比べることを確認するテスト
+    """
+    production, debug = SqlStats(), SqlStats(keep_statements=True)
+    for stats in (production, debug):
+        stats.record("SELECT * FROM books WHERE id = 1", 0.001)
+        stats.record("SELECT * FROM books WHERE id = 2", 0.001)
+    assert production.count == debug.count == 2
+    assert production.statements is None and production.repeated() == []
+    assert debug.repeated() == [("SELECT * FROM books WHERE id = ?", 2)]
+
+
+def test_server_timing_header_in_debug(app, client, users):
+    """
+    デバッグ時だけ、DBの件数と時間が Server-Timing ヘッダーで返されることを確認するテスト
+    """
+    assert 'Server-Timing' not in client.get('/login').headers
+    app.debug = True
+    try:
+        response = client.get('/login')
+    finally:
+        app.debug = False
+    assert response.headers['Server-Timing'].startswith('db;dur=')
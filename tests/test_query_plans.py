@@ -0,0 +1,100 @@
+# tests/test_query_plans.py
+
+import re
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import (Progress, StudyLog, Inquiry, Reply, MockExam, MockExamResult,
+                        OfficialMockExam, University)
+from seed_db import seed_database
+
+# ユーザーごとに増えていくテーブル（全件スキャンになると、データ量に比例して遅くなる）
+HOT_TABLES = {'progress', 'study_logs', 'study_daily_rollup', 'replies', 'inquiries', 'mock_exams', 'mock_exam_results',
+              'official_mock_exam', 'user_continuous_task_selections', 'user_sequential_task_selections'}
+
+
+@pytest.fixture(scope='module')
+def user(app, make_user):
+    seed_database(db)
+    user = make_user('plan_check', ['英語', '数学'], school='早稲田大学', faculty='理工学部')
+
+    english = user.subjects[0]
+    db.session.add(Progress(user_id=user.id, task_id='eng_n03', subject_id=english.id, is_completed=1))
+    db.session.add(StudyLog(user_id=user.id, subject_id=english.id, date=date.today() - timedelta(days=1), duration_minutes=90, comment='がんばった'))
+    inquiry = Inquiry(user_id=user.id, name=user.username, message='質問です')
+    db.session.add(inquiry)
+    db.session.flush()
+    db.session.add(Reply(inquiry_id=inquiry.id, admin_id=user.id, message='回答です'))
+    exam = MockExam(user_id=user.id, exam_name='全統模試', exam_date=date.today())
+    db.session.add(exam)
+    db.session.flush()
+    db.session.add(MockExamResult(mock_exam_id=exam.id, subject_id=english.id, score=80))
+    db.session.commit()
+    return user
+
+
+def _capture_statements(client, urls):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for url in urls:
+            assert client.get(url).status_code == 200, url
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def _full_scans(statement, parameters):
+    """EXPLAIN QUERY PLAN の結果から、インデックスを使わない全件スキャンのテーブル名を返す"""
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    scans = set()
+    for row in plan:
+        match = re.match(r'SCAN (\w+)(?: AS \w+)?$', row[-1])
+        if match:
+            scans.add(match.group(1))
+    return scans
+
+
+def test_user_pages_do_not_scan_hot_tables(client, user):
+    """
+    ユーザー向けの主要ページのクエリが、ユーザーデータのテーブルを全件スキャンしないことを確認するテスト
+    """
+    client.post('/login', data={'username': 'plan_check', 'password': 'password'})
+    exam = db.session.query(MockExam).filter_by(user_id=user.id).first()
+    statements = _capture_statements(client, [
+        f'/dashboard/{user.id}',
+        f'/api/plan_data/{user.id}/英語',
+        f'/stats/{user.id}',
+        f'/exams/{user.id}',
+        f'/exams/{exam.id}/results',
+        '/inbox',
+        '/api/faculties?univ=早稲田大学',
+    ])
+    assert statements
+
+    offending = []
+    for statement, parameters in statements:
+        scanned = _full_scans(statement, parameters) & HOT_TABLES
+        if scanned:
+            offending.append((sorted(scanned), statement))
+    assert not offending, offending
+
+
+def test_reference_indexes_are_used(app):
+    """
+    ルートステップの並び順と大学のふりがな検索でインデックスが使われることを確認するテスト
+    """
+    from app.models import RouteStep
+    route_steps = db.session.query(RouteStep).filter(RouteStep.route_id == 1).order_by(RouteStep.step_order)
+    universities = db.session.query(University).filter(University.kana_name >= 'わ').order_by(University.kana_name)
+    upcoming = db.session.query(OfficialMockExam).filter(OfficialMockExam.exam_date >= date.today()).order_by(OfficialMockExam.exam_date)
+
+    for query in (route_steps, universities, upcoming):
+        compiled = query.statement.compile(db.engine)
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        assert not _full_scans(str(compiled), params), str(compiled)
@@ -0,0 +1,81 @@
+# tests/test_reference_cache.py
+
+import pytest
+from app import db
+from app.models import User, Subject, University, Faculty
+from app.reference_cache import get_reference_cache, current_reference_version, bump_reference_version, university_by_name
+
+
+@pytest.fixture(scope='module')
+def users(app, make_user):
+    db.session.add_all([Subject(name='英語'), Subject(name='数学'),
+                        University(name='テスト大学', kana_name='てすとだいがく', level='MARCH')])
+    admin = make_user('ref_admin', is_admin=True)
+    student = make_user('ref_student')
+    db.session.add(Faculty(university_id=db.session.query(University.id).scalar(), name='理工学部'))
+    db.session.commit()
+    return admin, student
+
+
+def test_cache_is_dropped_when_another_worker_bumps_version(client, users):
+    """
+    他のワーカーがバージョンを進めたら、次のリクエストでキャッシュが作り直されることを確認するテスト
+    """
+    cache = get_reference_cache()
+    assert client.get('/api/faculties?univ=テスト大学').get_json() == ['理工学部']
+    hits, misses = cache.hits, cache.misses
+    assert client.get('/api/faculties?univ=テスト大学').get_json() == ['理工学部']
+    assert cache.hits > hits and cache.misses == misses
+
+    # 別プロセスでの更新を想定し、このプロセスのキャッシュには触れずにバージョンだけ進める
+    db.session.query(University).filter_by(name='テスト大学').update({'name': '新テスト大学'})
+    bump_reference_version()
+    db.session.commit()
+
+    assert client.get('/api/faculties?univ=テスト大学').get_json() == []
+    assert client.get('/api/faculties?univ=新テスト大学').get_json() == ['理工学部']
+    assert cache.version == current_reference_version()
+    db.session.query(University).filter_by(name='新テスト大学').update({'name': 'テスト大学'})
+    bump_reference_version()
+    db.session.commit()
+
+
+def test_admin_edit_bumps_version_but_subject_choice_does_not(client, users):
+    """
+    管理画面での大学の編集はバージョンを進め、ユーザーの科目選択では進めないことを確認するテスト
+    """
+    admin, student = users
+    client.post('/login', data={'username': 'ref_admin', 'password': 'password'})
+    university = university_by_name('テスト大学')
+    version = current_reference_version()
+
+    client.post(f'/admin/admin/universities/{university.id}/edit', data={
+        'name': 'テスト大学', 'kana_name': 'てすとだいがく', 'level': '早慶', 'info_url': ''})
+    assert current_reference_version() == version + 1
+    assert university_by_name('テスト大学').level == '早慶'
+
+    stats = client.get('/admin/admin/cache_stats').get_json()
+    assert stats['version'] == version + 1
+    assert {'hits', 'misses', 'invalidations', 'size'} <= stats.keys()
+
+    client.get('/logout')
+    client.post('/login', data={'username': 'ref_student', 'password': 'password'})
+    math = db.session.query(Subject).filter_by(name='数学').first()
+    client.post(f'/settings/{student.id}', data={
+        'username': 'ref_student', 'grade': 'high3', 'course_type': 'science', 'school': 'テスト大学',
+        'faculty': 'テスト学部', 'subjects': [str(math.id)]})
+    assert [s.name for s in db.session.get(User, student.id).subjects] == ['数学']
+    assert current_reference_version() == version + 1
+
+
+def test_invalidation_keeps_a_version_for_etags(users):
+    """
+    参照データの変更をコミットしてキャッシュを捨てても、バージョンが None にならず（ETagが ref-None にならず）、
+    次の確認でDBのバージョンに進むことを確認するテスト
+    """
+    cache = get_reference_cache()
+    version = cache.current_version()
+    db.session.query(University).filter_by(name='テスト大学').one().level = '旧帝大'
+    db.session.commit()
+    assert cache.version == version
+    assert cache.current_version() == version + 1
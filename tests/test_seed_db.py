@@ -0,0 +1,86 @@
+# tests/test_seed_db.py
+
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import Book, RouteStep, Route
+from app.reference_cache import current_reference_version
+import seed_db
+from seed_db import seed_database
+
+
+@pytest.fixture(scope='module')
+def first_run(app):
+    return seed_database(db)
+
+
+def _statements_during(func):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return result, statements
+
+
+def test_reseed_without_changes_reads_each_table_once(first_run):
+    """
+    投入済みのDBにもう一度シードしても何も書き込まず、テーブルごとに1回しか読まないことを確認するテスト
+    """
+    assert first_run['books'][0] == db.session.query(Book).count() > 0
+    version = current_reference_version()
+
+    summary, statements = _statements_during(lambda: seed_database(db, force=True))
+    assert all(counts == (0, 0) for counts in summary.values())
+    # テーブルごとに1回と、保存済みのハッシュの読み込み
+    assert statements.count('SELECT') == len(summary) + 1
+    assert 'INSERT' not in statements and 'UPDATE' not in statements
+    assert current_reference_version() == version
+
+
+def test_reseed_updates_changed_titles_and_levels(first_run):
+    """
+    参考書のタイトルやステップのレベルがDBと違えば更新され、参照データのバージョンが進むことを確認するテスト
+    """
+    book = db.session.query(Book).filter_by(task_id='eng_n01').one()
+    step = db.session.query(RouteStep).join(Route).filter(Route.name == 'english_standard', RouteStep.step_order == 1).one()
+    original_title, original_level = book.title, step.level
+    book.title = '古いタイトル'
+    step.level = '古いレベル'
+    db.session.commit()
+    version = current_reference_version()
+
+    summary = seed_database(db, force=True)
+    assert summary['books'] == (0, 1)
+    assert summary['route_steps'] == (0, 1)
+    db.session.expire_all()
+    assert db.session.get(Book, book.id).title == original_title
+    assert db.session.get(RouteStep, step.id).level == original_level
+    assert current_reference_version() == version + 1
+
+
+def test_unchanged_seed_data_is_skipped(first_run):
+    """
+    シードデータが前回から変わっていなければ、保存済みのハッシュを読むだけで何もしないことを確認するテスト
+    """
+    summary, statements = _statements_during(lambda: seed_database(db))
+    assert summary == {}
+    assert statements == ['SELECT']
+
+
+def test_only_tables_of_changed_seed_data_are_applied(first_run, monkeypatch):
+    """
+    参考書のデータだけが変わったときは、参考書とルートステップのテーブルだけを投入し直すことを確認するテスト
+    """
+    books = [list(book) for book in seed_db.books_to_seed]
+    books[0][1] = books[0][1] + '（改訂版）'
+    monkeypatch.setattr(seed_db, 'books_to_seed', [tuple(book) for book in books])
+
+    summary = seed_database(db)
+    assert set(summary) == {'books', 'route_steps'}
+    assert summary['books'] == (0, 1)
+    assert db.session.query(Book).filter_by(task_id=books[0][0]).one().title.endswith('（改訂版）')
+    assert seed_database(db) == {}
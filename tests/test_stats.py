@@ -0,0 +1,100 @@
+# tests/test_stats.py
+
+from datetime import date
+import pytest
+from app import db
+from app.models import Subject, StudyLog, StudyDailyRollup
+from app.study_rollup import backfill_study_rollup
+
+
+@pytest.fixture(scope='module')
+def user(make_user):
+    return make_user('stats_user', [Subject(name='英語'), Subject(name='数学')])
+
+
+def _rollup(user):
+    return {(r.date, r.subject_id): r.minutes for r in db.session.query(StudyDailyRollup).filter_by(user_id=user.id)}
+
+
+def test_rollup_follows_log_and_delete(client, user):
+    """
+    学習記録の追加・削除に合わせて、日毎の集計が更新されることを確認するテスト
+    """
+    english, math = user.subjects
+    client.post('/login', data={'username': 'stats_user', 'password': 'password'})
+    day = date(2026, 5, 1)
+    for minutes in (30, 45):
+        response = client.post(f'/api/log_study_for_date/{user.id}', json={
+            'date': day.isoformat(), 'comment': 'テスト',
+            'logs': [{'subject_id': english.id, 'hours': '0', 'minutes': str(minutes)},
+                     {'subject_id': math.id, 'hours': '1', 'minutes': '0'}]})
+        assert response.get_json()['success']
+    assert _rollup(user) == {(day, english.id): 75, (day, math.id): 120}
+
+    math_logs = db.session.query(StudyLog).filter_by(user_id=user.id, subject_id=math.id).all()
+    client.post(f'/log/{math_logs[0].id}/delete')
+    assert _rollup(user) == {(day, english.id): 75, (day, math.id): 60}
+    client.post(f'/log/{math_logs[1].id}/delete')
+    assert _rollup(user) == {(day, english.id): 75}
+
+    response = client.get(f'/stats/{user.id}')
+    assert response.status_code == 200
+
+
+def test_backfill_rebuilds_rollup_from_logs(user):
+    """
+    バックフィルで、学習記録から集計が作り直されることを確認するテスト
+    """
+    english = user.subjects[0]
+    db.session.query(StudyDailyRollup).delete()
+    db.session.add(StudyLog(user_id=user.id, subject_id=english.id, date=date(2026, 5, 2), duration_minutes=20))
+    db.session.commit()
+
+    backfill_study_rollup(user.id)
+    assert _rollup(user) == {(date(2026, 5, 1), english.id): 75, (date(2026, 5, 2), english.id): 20}
+
+
+def test_log_history_is_paginated_with_keyset_cursor(client, user):
+    """
+    学習履歴APIが、コメントのある日の記録を (date, id) のカーソルで重複も抜けもなく新しい順にページ分割することを確認するテスト
+    """
+    english, math = user.subjects
+    for day in range(1, 8):
+        # 奇数日だけコメントを書き、コメントの無い科目の記録も同じ日に入れる
+        db.session.add(StudyLog(user_id=user.id, subject_id=english.id, date=date(2026, 6, day), duration_minutes=day,
+                                comment=f'{day}日目' if day % 2 else None))
+        db.session.add(StudyLog(user_id=user.id, subject_id=math.id, date=date(2026, 6, day), duration_minutes=day))
+    db.session.commit()
+    commented = {log.date for log in db.session.query(StudyLog).filter_by(user_id=user.id) if log.comment}
+    expected = [(log.date.isoformat(), log.id) for log in db.session.query(StudyLog).filter_by(user_id=user.id)
+                .order_by(StudyLog.date.desc(), StudyLog.id.desc()) if log.date in commented]
+
+    client.post('/login', data={'username': 'stats_user', 'password': 'password'})
+    seen, cursor = [], None
+    while True:
+        url = f'/api/stats/{user.id}/logs?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        seen.extend((group['date'], log['id']) for group in page['groups'] for log in group['logs'])
+        assert all(group['comment'] for group in page['groups'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert seen == expected
+
+    assert client.get(f'/api/stats/{user.id}/logs?cursor=broken').status_code == 400
+
+
+def test_heatmap_api_returns_dense_minutes_with_etag(client, user):
+    """
+    ヒートマップAPIが開始日と日毎の配列を返し、ETagで304を返せることを確認するテスト
+    """
+    client.post('/login', data={'username': 'stats_user', 'password': 'password'})
+    response = client.get(f'/api/stats/{user.id}/heatmap?from=2026-04-30&to=2026-05-03')
+    assert response.status_code == 200
+    assert response.get_json() == {'start': '2026-04-30', 'minutes': [0, 75, 20, 0], 'levels': [0, 2, 1, 0]}
+
+    cached = client.get(f'/api/stats/{user.id}/heatmap?from=2026-04-30&to=2026-05-03',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+    assert client.get(f'/api/stats/{user.id}/heatmap?from=2026-05-03&to=2026-04-30').status_code == 400
@@ -0,0 +1,83 @@
+# tests/test_university_search.py
+
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import University
+from app.university_search import normalize, UniversitySearchIndex
+from seed_db import seed_database
+
+
+@pytest.fixture(scope='module')
+def admin(app, make_user):
+    seed_database(db)
+    return make_user('search_admin', is_admin=True, school='早稲田大学', faculty='理工学部')
+
+
+def test_normalize_absorbs_kana_and_width():
+    """
+    カタカナ・半角カナ・全角英数・空白の違いが吸収されることを確認するテスト
+    """
+    assert normalize('ワセダ') == normalize('ﾜｾﾀﾞ') == normalize('わせだ') == 'わせだ'
+    assert normalize('ＭＡＲＣＨ 大学') == 'march大学'
+
+
+def test_ranking_prefers_exact_then_prefix_then_substring():
+    """
+    完全一致 > 前方一致 > 部分一致の順に並ぶことを確認するテスト
+    """
+    index = UniversitySearchIndex()
+    index.sync([(1, '東京大学', 'とうきょうだいがく'), (2, '東京理科大学', 'とうきょうりかだいがく'),
+                (3, '南東京大学', 'みなみとうきょうだいがく')])
+    assert index.search('東京') == ['東京大学', '東京理科大学', '南東京大学']
+    assert index.search('とうきょうだいがく') == ['東京大学', '南東京大学']
+    assert index.search('リカ') == ['東京理科大学']
+
+    index.sync([(1, '東京大学', 'とうきょうだいがく'), (3, '西東京大学', 'にしとうきょうだいがく')])
+    assert index.search('東京') == ['東京大学', '西東京大学']
+    assert index.search('みなみ') == []
+
+
+def test_api_follows_admin_changes_without_queries(client, admin):
+    """
+    APIがDBの大学検索なしで答え、管理画面で追加した大学がすぐに候補に出ることを確認するテスト
+    """
+    assert client.get('/api/universities?q=ワセダ').get_json() == ['早稲田大学']
+
+    client.post('/login', data={'username': 'search_admin', 'password': 'password'})
+    client.post('/admin/admin/universities/new', data={
+        'name': '早稲田テスト大学', 'kana_name': 'わせだてすとだいがく', 'level': '早慶', 'info_url': ''})
+    assert client.get('/api/universities?q=わせだ').get_json() == ['早稲田大学', '早稲田テスト大学']
+
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        assert client.get('/api/universities?q=てすと').get_json() == ['早稲田テスト大学']
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert not [s for s in statements if 'universities' in s]
+
+
+def test_lookup_returns_faculties_with_versioned_caching(client, admin):
+    """
+    候補と学部一覧を1回で返し、参照データのバージョンに紐づくETagとCache-Controlが付くことを確認するテスト
+    """
+    response = client.get('/api/universities/lookup?q=早稲田大学')
+    assert response.get_json()[0]['name'] == '早稲田大学'
+    assert '商学部' in response.get_json()[0]['faculties']
+    assert response.headers['Cache-Control'] == 'public, no-cache'
+    etag = response.headers['ETag']
+    version = etag.strip('"').removeprefix('ref-')
+
+    versioned = client.get(f'/api/universities/lookup?q=早稲田大学&v={version}')
+    assert versioned.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert client.get('/api/universities/lookup?q=早稲田大学', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/login', data={'username': 'search_admin', 'password': 'password'})
+    university = db.session.query(University).filter_by(name='早稲田大学').first()
+    client.post(f'/admin/admin/universities/{university.id}/faculties/add', data={'faculty_name': 'テスト学部'})
+    changed = client.get('/api/universities/lookup?q=早稲田大学', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert 'テスト学部' in changed.get_json()[0]['faculties']